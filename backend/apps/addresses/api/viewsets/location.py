@@ -31,7 +31,7 @@ class LocationChildViewSet(viewsets.ModelViewSet):
         self.perform_create(serializer)
         data = serializer.data
 
-        address_to_validate = serializer.create_instance()
+        address_to_validate = serializer.instance
         address_validation_payload = self.tax_client.validate_tax_address(address_to_validate)
         data['valid_address'] = address_validation_payload.get('valid_address')
         data['messages'] = address_validation_payload.get('messages')
@@ -47,7 +47,7 @@ class LocationChildViewSet(viewsets.ModelViewSet):
         instance.refresh_from_db()
         data = self.serializer_class(instance).data
 
-        address_to_validate = serializer.create_instance()
+        address_to_validate = instance
         address_validation_payload = self.tax_client.validate_tax_address(address_to_validate)
         data['valid_address'] = address_validation_payload.get('valid_address')
         data['messages'] = address_validation_payload.get('messages')
@@ -0,0 +1,63 @@
+# Generated by Django 3.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('addresses', '0005_auto_20220609_1721'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicallocation',
+            name='is_valid_tax_address',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicallocation',
+            name='normalized_tax_address',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='historicallocation',
+            name='tax_address_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='historicallocation',
+            name='tax_address_validated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicallocation',
+            name='tax_address_validation_messages',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='is_valid_tax_address',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='normalized_tax_address',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='tax_address_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='tax_address_validated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='tax_address_validation_messages',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
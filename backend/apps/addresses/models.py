@@ -1,4 +1,6 @@
-from django.db import models
+import hashlib
+
+from django.db import models, transaction
 from localflavor.us.models import USStateField, USZipCodeField
 
 from apps.core.models import CoreModel
@@ -16,6 +18,12 @@ class Location(CoreModel):
     state = models.TextField(null=True, blank=True)
     zipcode = USZipCodeField()
     is_active = models.BooleanField(default=True)
+    # outcome of the last tax address validation, only trusted while the fingerprint matches the address fields
+    is_valid_tax_address = models.BooleanField(null=True, blank=True)
+    normalized_tax_address = models.JSONField(default=dict, blank=True)
+    tax_address_validation_messages = models.JSONField(default=list, blank=True)
+    tax_address_fingerprint = models.CharField(max_length=64, blank=True, default='')
+    tax_address_validated_at = models.DateTimeField(null=True, blank=True)
 
     STATE_ABBREVIATION_MAP = {
         'Alabama': 'AL',
@@ -81,3 +89,23 @@ class Location(CoreModel):
             self.state is not None,
             self.zipcode is not None,
         ])
+
+    @property
+    def address_fingerprint(self) -> str:
+        address_fields = [self.street_address, self.city, self.state, self.zipcode]
+        normalized_fields = '|'.join(f'{field or ""}'.strip().lower() for field in address_fields)
+        return hashlib.sha256(normalized_fields.encode('utf-8')).hexdigest()
+
+    @property
+    def has_current_tax_address_validation(self) -> bool:
+        return self.is_valid_tax_address is not None and self.tax_address_fingerprint == self.address_fingerprint
+
+    def _invalidate_cached_tax_quotes(self):
+        from libs.tax_nexus.avalara.client import TaxProcessorClient
+        TaxProcessorClient.invalidate_cached_quotes(self)
+
+    def save(self, *args, **kwargs):
+        if not self.is_new() and self.is_dirty():
+            transaction.on_commit(self._invalidate_cached_tax_quotes)
+
+        super().save(*args, **kwargs)
@@ -49,19 +49,35 @@ class PaymentMethod(CoreModel):
         )
         return self.payment_processor.client.attach_customer_to_payment_method(attachment_data)
 
-    def _save_related_charge_to_db(self, processed_charge):
-        charge_data = ProcessedChargeDTO(
+    def _processed_charge_dto(self, processed_charge) -> ProcessedChargeDTO:
+        return ProcessedChargeDTO(
             customer_id=f'{self.customer.id}',
             payment_method_id=self.id,
             cents_amount=processed_charge.amount,
             processor_transaction_id=processed_charge.id,
             is_captured=processed_charge.status == 'succeeded'
         )
+
+    def _save_related_charge_to_db(self, processed_charge):
         return self.payment_processor.billing_transaction_manager(
-            processed_charge_dto=charge_data
+            processed_charge_dto=self._processed_charge_dto(processed_charge)
         ).save_charge_to_database()
 
-    def charge(self, amount: Decimal):
+    def process_charge(self, amount: Decimal, idempotency_key: str = None):
+        """
+        Charges the payment method through the payment processor without touching the database, so it can be called
+        from worker threads. The idempotency key ensures that a charge that was already processed on the payment
+        provider's end is not processed again when it is retried.
+        """
+        charge_data = ChargeDTO(
+            processor_customer_id=f'{self.customer.payment_provider_customer_id}',
+            processor_payment_method_id=f'{self.payment_processor_payment_method_id}',
+            decimal_amount=amount,
+            idempotency_key=idempotency_key,
+        )
+        return self.payment_processor.client.charge(charge_data)
+
+    def charge(self, amount: Decimal, idempotency_key: str = None):
         """
         Handles the charging of the payment method.
         We create an idempotent key to ensure that payment charges that were processed
@@ -69,12 +85,7 @@ class PaymentMethod(CoreModel):
         Thus, preventing customers from being charged n-times.
         """
         try:
-            charge_data = ChargeDTO(
-                processor_customer_id=f'{self.customer.payment_provider_customer_id}',
-                processor_payment_method_id=f'{self.payment_processor_payment_method_id}',
-                decimal_amount=amount,
-            )
-            payment_processor_charge = self.payment_processor.client.charge(charge_data)
+            payment_processor_charge = self.process_charge(amount, idempotency_key)
             return self._save_related_charge_to_db(processed_charge=payment_processor_charge)
         except (CouldNotChargeOrderError, CouldNotProcessChargeError):
             raise
@@ -1,15 +1,15 @@
 from decimal import Decimal
+from typing import Dict, List
 
-import django_fsm
 import stripe.error
 from celery import shared_task
 from chunkator import chunkator
 from django.apps import apps
 from sentry_sdk.utils import logger
 from celery_app import app
-import csv
 import stripe
 
+from apps.core.imports import import_rows, non_atomic_import_handler
 from apps.core.tasks import StripeErrorRetryTask
 from libs.stripe_import_client import StripeImportClient
 
@@ -88,44 +88,35 @@ def import_customer_payment_method_data_from_stripe():
 
 @app.task
 def import_stripe_refund_from_line(data):
-    Charge = apps.get_model('billing', 'Charge')
     Refund = apps.get_model('billing', 'Refund')
-    payment_intent = data.get('PaymentIntent ID')
     Customer = apps.get_model('customers', 'Customer')
+    payment_intent = data.get('PaymentIntent ID')
     refund_amount = data.get('Amount')
     customer_email = data.get('Email')
-    try:
-        client = StripeImportClient()
-        refund = client.create_refund({
-            'payment_intent': payment_intent,
-            'reason': 'duplicate',
-        })
-        if refund:
-            customer = Customer.objects.filter(email=customer_email).first()
-            if customer:
-                payment_method = customer.payment_methods.filter().first()
-                if payment_method:
-                    Refund.objects.create(
-                        payment_method=payment_method,
-                        amount=Decimal(f'{refund_amount}'),
-                        customer=customer
-                    )
-            print(f'created {refund}')
-    except Charge.DoesNotExist:
-        logger.error(
-            f'payment intent {payment_intent} does not exist in the system')
-    except django_fsm.TransitionNotAllowed as e:
-        logger.error(
-            f'refund failed, this is most likely because we have already refunded this order: {e}')
-    except stripe.error.InvalidRequestError as e:
-        logger.error(
-            f'Fail to refund in stripe, this could be because transaction was already refunded: {e}')
-    except Exception as e:
-        logger.error(f'Refund failed, {e}')
 
+    # keyed on the payment intent, so the rows of an interrupted chunk get the refund Stripe already issued back
+    # instead of an "already refunded" error, and their records are still created
+    refund = StripeImportClient().create_refund({
+        'payment_intent': payment_intent,
+        'reason': 'duplicate',
+    }, idempotency_key=f'refund-import-{payment_intent}')
+    if refund:
+        customer = Customer.objects.filter(email=customer_email).first()
+        if customer:
+            payment_method = customer.payment_methods.filter().first()
+            if payment_method:
+                Refund.objects.get_or_create(
+                    payment_processor_refund_id=refund.id,
+                    defaults={
+                        'payment_method': payment_method,
+                        'amount': Decimal(f'{refund_amount}'),
+                        'customer': customer,
+                    },
+                )
+        print(f'created {refund}')
 
-@app.task
-def import_refunds_from_file(decoded_file):
-    reader = csv.DictReader(decoded_file)
-    for line in reader:
-        import_stripe_refund_from_line.delay(line)
+
+@non_atomic_import_handler
+def import_refunds_from_rows(rows: List[Dict]) -> List[Dict]:
+    # refunds are issued outside of the chunk's transaction, a failed row can never roll back a refund's record
+    return import_rows(rows, import_stripe_refund_from_line)
@@ -1,8 +1,7 @@
 from apps.core.views import CoreUploadCSVView
-from apps.billing.tasks import import_refunds_from_file
 
 
 class ImportRefundView(CoreUploadCSVView):
     template_name = 'uploads/refunds.html'
-    async_function = import_refunds_from_file
+    import_handler = 'apps.billing.tasks.import_refunds_from_rows'
     view_name = 'bulk_upload_refunds'
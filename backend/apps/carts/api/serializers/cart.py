@@ -16,7 +16,16 @@ class CartReadOnlySerializer(serializers.ModelSerializer):
     def get_line_items(self, obj):
         if obj:
             from apps.carts.api.serializers import CartLineItemReadOnlySerializer
-            return [CartLineItemReadOnlySerializer(instance=line_item).data for line_item in obj.line_items.filter()]
+            from apps.products.libs import ProductCatalog
+
+            if 'products' not in self.context:
+                self.context['products'] = ProductCatalog.get_products_by_id()
+            # line items are expected to be prefetched with their variant, see `CartViewSet.get_queryset`
+            return CartLineItemReadOnlySerializer(
+                obj.line_items.all(),
+                many=True,
+                context={'products': self.context['products']},
+            ).data
         return []
 
     def get_customer(self, obj):
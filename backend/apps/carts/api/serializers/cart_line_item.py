@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework.fields import SerializerMethodField
 
 from apps.carts.models import CartLineItem
 from apps.products.api.serializers import ProductReadOnlySerializer
@@ -7,7 +8,7 @@ from apps.products.models import Product
 
 
 class CartLineItemReadOnlySerializer(serializers.ModelSerializer):
-    product = ProductReadOnlySerializer()
+    product = SerializerMethodField()
     product_variant = ProductVariantReadOnlySerializer()
 
     class Meta:
@@ -15,6 +16,13 @@ class CartLineItemReadOnlySerializer(serializers.ModelSerializer):
         fields = 'id', 'product', 'quantity', 'product_variant',
         read_only_fields = fields
 
+    def get_product(self, obj):
+        # products serialized once for all line items, see `ProductCatalog.get_products_by_id`
+        products = self.context.get('products', {})
+        if f'{obj.product_id}' in products:
+            return products[f'{obj.product_id}']
+        return ProductReadOnlySerializer(obj.product).data
+
 
 class CartLineItemWriteSerializer(CartLineItemReadOnlySerializer):
     product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.filter())
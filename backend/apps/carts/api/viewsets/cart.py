@@ -1,10 +1,13 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch
 from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.viewsets import mixins
 
 from apps.carts.api.serializers import CartReadOnlySerializer, CartWriteSerializer
+from apps.carts.libs import CartLineItemsEngine
 from apps.carts.models import Cart, CartLineItem
-from apps.products.models import Product, ProductVariant
 
 
 class CartViewSet(
@@ -34,49 +37,21 @@ class CartViewSet(
         if not customer_id and not self.request.user and not self.request.user.is_superuser:
             return self.queryset.none()
 
-        return self.queryset.filter(customer_id=customer_id)
+        return self.queryset.filter(customer_id=customer_id).prefetch_related(
+            Prefetch('line_items', queryset=CartLineItem.objects.select_related('product_variant')),
+        )
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
 
         requested_line_items = request.data.get('line_items')
         if requested_line_items:
-            instance.line_items.filter().delete()
-
-        for line_item in requested_line_items:
-            # step 2: get the correct product with proper sku id based on the subscription's # of servings
-            product = Product.objects.get(id=line_item['product']['id'])
-            if product.product_type != 'recipe':
-                product_variant = ProductVariant.objects.get(
-                    id=line_item['product_variant']['id']
-                )
-            else:
-                product_variant = ProductVariant.objects.get(
-                    product=product,
-                    sku_id__iendswith=f'-{instance.customer_child.subscription.number_of_servings}'
-                )
             try:
-                cart_line_item = CartLineItem.objects.get(
-                    cart=instance,
-                    product=product,
-                    product_variant=product_variant
-                )
-            except CartLineItem.DoesNotExist:
-                cart_line_item = CartLineItem.objects.create(
-                    cart=instance,
-                    product=product,
-                    product_variant=product_variant,
-                )
-
-            quantity = line_item.get('quantity', None)
-            if quantity is not None:
-                if quantity > 0:
-                    cart_line_item.quantity = quantity
-                    cart_line_item.save()
-                else:
-                    cart_line_item.delete()
+                CartLineItemsEngine(instance).apply(requested_line_items)
+            except ObjectDoesNotExist as e:
+                raise ValidationError({'line_items': [f'{e}']})
 
-        instance.refresh_from_db()
+        instance = self.get_object()
         return Response(self.serializer_class(instance=instance).data)
 
     def partial_update(self, request, *args, **kwargs):
@@ -0,0 +1,126 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+
+@dataclass
+class CartLineItemsDiff:
+    created: List['CartLineItem'] = field(default_factory=list)
+    updated: List['CartLineItem'] = field(default_factory=list)
+    deleted: List['CartLineItem'] = field(default_factory=list)
+
+
+class CartLineItemsEngine:
+    """
+    Replaces the line items of a cart with the ones requested by the api: products and variants are resolved with a
+    query each, the requested state is diffed against the current line items and the diff is applied in bulk.
+
+    Requested line items are `{'product': {'id': ...}, 'product_variant': {'id': ...}, 'quantity': ...}` dicts. The
+    variant of a recipe is picked from the servings of the child's subscription, a missing quantity defaults to 1 and
+    a quantity of 0 removes the line item.
+    """
+    def __init__(self, cart: 'Cart'):
+        self.cart = cart
+
+    def _get_number_of_servings(self) -> int:
+        CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
+        return CustomerSubscription.objects.values_list('number_of_servings', flat=True).get(
+            customer_child_id=self.cart.customer_child_id,
+        )
+
+    def _resolve(self, requested_line_items: List[Dict]) -> List[Tuple['Product', 'ProductVariant', Dict]]:
+        Product = apps.get_model('products', 'Product')
+        ProductVariant = apps.get_model('products', 'ProductVariant')
+
+        product_ids = {line_item['product']['id'] for line_item in requested_line_items}
+        products = {f'{product.id}': product for product in Product.objects.filter(id__in=product_ids)}
+        for line_item in requested_line_items:
+            if f'{line_item["product"]["id"]}' not in products:
+                raise Product.DoesNotExist(f'Product {line_item["product"]["id"]} does not exist')
+
+        recipe_ids = {product.id for product in products.values() if product.product_type == 'recipe'}
+        variant_ids = {
+            line_item['product_variant']['id'] for line_item in requested_line_items
+            if products[f'{line_item["product"]["id"]}'].id not in recipe_ids
+        }
+        variants_query = Q(id__in=variant_ids)
+        if recipe_ids:
+            variants_query |= Q(
+                product_id__in=recipe_ids,
+                sku_id__iendswith=f'-{self._get_number_of_servings()}',
+            )
+        variants = {}
+        recipe_variants = {}
+        for variant in ProductVariant.objects.filter(variants_query).order_by('id'):
+            variants[f'{variant.id}'] = variant
+            if variant.product_id in recipe_ids:
+                recipe_variants.setdefault(variant.product_id, variant)
+
+        resolved = []
+        for line_item in requested_line_items:
+            product = products[f'{line_item["product"]["id"]}']
+            if product.id in recipe_ids:
+                variant = recipe_variants.get(product.id)
+            else:
+                variant = variants.get(f'{line_item["product_variant"]["id"]}')
+            if not variant:
+                raise ProductVariant.DoesNotExist(f'No variant of {product} matches the cart of {self.cart}')
+            resolved.append((product, variant, line_item))
+        return resolved
+
+    def diff(self, requested_line_items: List[Dict]) -> CartLineItemsDiff:
+        CartLineItem = apps.get_model('carts', 'CartLineItem')
+
+        # later entries for the same product and variant win, like successive edits of the same line item
+        quantities = {}
+        for product, variant, line_item in self._resolve(requested_line_items):
+            key = (product.id, variant.id)
+            quantities.setdefault(key, 1)
+            quantity = line_item.get('quantity')
+            if quantity is not None:
+                if quantity > 0:
+                    quantities[key] = quantity
+                else:
+                    quantities.pop(key)
+
+        diff = CartLineItemsDiff()
+        current_line_items = {}
+        # `all` so line items prefetched by the caller are reused
+        for line_item in sorted(self.cart.line_items.all(), key=lambda line_item: (line_item.created_at, line_item.id)):
+            key = (line_item.product_id, line_item.product_variant_id)
+            if key in quantities and key not in current_line_items:
+                current_line_items[key] = line_item
+            else:
+                diff.deleted.append(line_item)
+
+        for (product_id, variant_id), quantity in quantities.items():
+            line_item = current_line_items.get((product_id, variant_id))
+            if not line_item:
+                diff.created.append(CartLineItem(
+                    cart=self.cart,
+                    product_id=product_id,
+                    product_variant_id=variant_id,
+                    quantity=quantity,
+                ))
+            elif line_item.quantity != quantity:
+                line_item.quantity = quantity
+                diff.updated.append(line_item)
+        return diff
+
+    def apply(self, requested_line_items: List[Dict]) -> CartLineItemsDiff:
+        CartLineItem = apps.get_model('carts', 'CartLineItem')
+
+        diff = self.diff(requested_line_items)
+        now = timezone.now()
+        for line_item in diff.updated:
+            line_item.modified_at = now
+        with transaction.atomic():
+            CartLineItem.objects.filter(id__in=[line_item.id for line_item in diff.deleted]).delete()
+            bulk_update_with_history(diff.updated, CartLineItem, fields=['quantity', 'modified_at'])
+            bulk_create_with_history(diff.created, CartLineItem)
+        return diff
@@ -1,12 +1,18 @@
+from uuid import uuid4
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
+from apps.carts.models import CartLineItem
 from apps.carts.tests.factories.cart_line_item import CartLineItemFactory
 from apps.customers.tests.factories import (
     CustomerChildFactory,
     CustomerFactory,
     CustomerSubscriptionFactory,
 )
+from apps.products.libs import ProductCatalog, RecipeCatalog
 from apps.products.tests.factories import ProductFactory, ProductVariantFactory
 
 
@@ -23,6 +29,7 @@ class CartAPITestSuite(APITestCase):
             ProductVariantFactory(product=product, sku_id='SKU-24')
 
     def setUp(self) -> None:
+        RecipeCatalog.invalidate()
         with self.captureOnCommitCallbacks(execute=True):
             self.customer_child = CustomerChildFactory(parent=self.customer)
         self.cart = self.customer_child.cart
@@ -84,3 +91,63 @@ class CartAPITestSuite(APITestCase):
         }
         response = self.client.patch(f'{url}?customer={self.customer.id}', data=patch_data, format='json')
         self.assertEqual(len(response.json()['lineItems']), 0)
+
+    def test_will_keep_existing_line_items_when_updating_cart(self):
+        url = reverse('cart-detail', args=[f'{self.cart.id}'])
+        kept_line_item = CartLineItemFactory(
+            cart=self.cart,
+            product=self.products[0],
+            product_variant=self.products[0].variants.get(sku_id='SKU-12'),
+            quantity=1,
+        )
+        removed_line_item = CartLineItemFactory(cart=self.cart, product=self.products[1], quantity=1)
+        patch_data = {
+            'line_items': [
+                {'product': {'id': f'{self.products[0].id}'}, 'quantity': 3},
+            ]
+        }
+
+        response = self.client.patch(f'{url}?customer={self.customer.id}', data=patch_data, format='json')
+
+        self.assertEqual(
+            [(line_item['id'], line_item['quantity']) for line_item in response.json()['lineItems']],
+            [(f'{kept_line_item.id}', 3)],
+        )
+        self.assertFalse(CartLineItem.objects.filter(id=removed_line_item.id).exists())
+
+    def test_will_reject_unknown_products(self):
+        url = reverse('cart-detail', args=[f'{self.cart.id}'])
+        patch_data = {'line_items': [{'product': {'id': f'{uuid4()}'}, 'quantity': 1}]}
+
+        response = self.client.patch(f'{url}?customer={self.customer.id}', data=patch_data, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_will_update_cart_in_a_constant_number_of_queries(self):
+        url = reverse('cart-detail', args=[f'{self.cart.id}'])
+        ProductCatalog.get_products_by_id()
+
+        def _patch(products):
+            patch_data = {
+                'line_items': [{'product': {'id': f'{product.id}'}, 'quantity': 2} for product in products]
+            }
+            with CaptureQueriesContext(connection) as queries:
+                self.client.patch(f'{url}?customer={self.customer.id}', data=patch_data, format='json')
+            return len(queries)
+
+        self.assertEqual(_patch(self.products[:1]), _patch(self.products))
+
+    def test_will_list_carts_in_a_constant_number_of_queries(self):
+        url = reverse('cart-list')
+        ProductCatalog.get_products_by_id()
+
+        def _list():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(f'{url}?customer={self.customer.id}')
+            return len(queries)
+
+        CartLineItemFactory(cart=self.cart, product=self.products[0], quantity=1)
+        single_line_item_queries = _list()
+        CartLineItemFactory(cart=self.cart, product=self.products[1], quantity=1)
+
+        self.assertEqual(_list(), single_line_item_queries)
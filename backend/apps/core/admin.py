@@ -1,9 +1,9 @@
-from django.contrib.admin import register
+from django.contrib.admin import ModelAdmin, action, register
 from django.db import models
 from django_json_widget.widgets import JSONEditorWidget
 from simple_history.admin import SimpleHistoryAdmin
 
-from apps.core.models import APIRequestLog
+from apps.core.models import APIRequestLog, CSVImport, CSVImportStatusEnum, OutboxEvent
 
 
 class CoreAdmin(SimpleHistoryAdmin):
@@ -22,3 +22,33 @@ class APIRequestLogAdmin(CoreAdmin):
         models.JSONField: {'widget': JSONEditorWidget},
     }
     search_fields = 'id', 'request_url', 'object_type', 'object_id', 'response_status_code',
+
+
+@register(OutboxEvent)
+class OutboxEventAdmin(ModelAdmin):
+    list_display = 'id', 'topic', 'aggregate_id', 'created_at', 'dispatched_at',
+    list_filter = 'topic',
+    readonly_fields = 'id', 'topic', 'aggregate_id', 'payload', 'created_at', 'dispatched_at',
+    search_fields = 'aggregate_id',
+    actions = 'replay',
+
+    @action(description='Replay selected events')
+    def replay(self, request, queryset):
+        replayed = queryset.filter(dispatched_at__isnull=False).update(dispatched_at=None)
+        self.message_user(request, f'{replayed} events will be relayed again')
+
+
+@register(CSVImport)
+class CSVImportAdmin(CoreAdmin):
+    list_display = 'id', 'file', 'handler', 'status', 'processed_rows', 'created_at', 'completed_at',
+    list_filter = 'status', 'handler',
+    readonly_fields = 'id', 'file', 'handler', 'status', 'processed_rows', 'error', 'failed_rows', 'completed_at',
+    actions = 'resume',
+
+    @action(description='Resume selected imports')
+    def resume(self, request, queryset):
+        from apps.core.tasks import process_csv_import
+        csv_imports = queryset.exclude(status=CSVImportStatusEnum.completed)
+        for csv_import in csv_imports:
+            process_csv_import.delay(f'{csv_import.id}')
+        self.message_user(request, f'{len(csv_imports)} imports will resume from their last processed row')
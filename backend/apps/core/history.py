@@ -0,0 +1,101 @@
+import threading
+import weakref
+from collections import defaultdict
+
+from django.db import models, router, transaction
+from simple_history.models import HistoricalRecords
+
+
+_local = threading.local()
+
+
+def _get_batches() -> weakref.WeakValueDictionary:
+    # batches are only referenced by the `on_commit` callback that flushes them, they go away with it when their
+    # transaction (or savepoint) is rolled back
+    if not hasattr(_local, 'batches'):
+        _local.batches = weakref.WeakValueDictionary()
+    return _local.batches
+
+
+class HistoryBatch:
+    """
+    Historical records of a transaction (or of one of its savepoints), written with a bulk insert per history model
+    once the transaction is committed. Successive changes of the same object within the transaction are merged into
+    a single record of its final state.
+    """
+    def __init__(self, using: str):
+        self.using = using
+        self.records = []
+        self.positions = {}
+
+    def add(self, record: 'HistoricalRecordModel'):
+        key = (type(record), record.id)
+        position = self.positions.get(key)
+        if position is not None and record.history_type == '~' and self.records[position].history_type != '-':
+            record.history_type = self.records[position].history_type
+            self.records[position] = record
+            return
+        self.positions[key] = len(self.records)
+        self.records.append(record)
+
+    def flush(self):
+        records_by_model = defaultdict(list)
+        for record in self.records:
+            records_by_model[type(record)].append(record)
+        for model, records in records_by_model.items():
+            model.objects.using(self.using).bulk_create(records)
+
+
+class HistoricalRecordModel(models.Model):
+    """
+    Base of the historical models of `BufferedHistoricalRecords`: new records saved inside a transaction are buffered
+    and written when it commits, outside of one they are written right away.
+    """
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding or args or set(kwargs) - {'using'}:
+            return super().save(*args, **kwargs)
+
+        using = kwargs.get('using') or router.db_for_write(type(self))
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            return super().save(*args, **kwargs)
+
+        # one batch per savepoint, so a rolled back savepoint discards its records along with its `on_commit` callback
+        key = (using, tuple(connection.savepoint_ids))
+        batches = _get_batches()
+        batch = batches.get(key)
+        if batch is None:
+            batch = batches[key] = HistoryBatch(using)
+            transaction.on_commit(batch.flush, using=using)
+        batch.add(self)
+
+
+class BufferedHistoricalRecords(HistoricalRecords):
+    """
+    `HistoricalRecords` that keeps history writes off the hot path: records are written in bulk when the transaction
+    commits (see `HistoricalRecordModel`), saves that changed nothing but `modified_at` are not recorded, and models
+    with `track_history = False` are not recorded at all. History tables and admin views are unchanged.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('bases', (HistoricalRecordModel, ))
+        super().__init__(*args, **kwargs)
+
+    @staticmethod
+    def _has_changes(instance) -> bool:
+        # `modified_at` is set on every save
+        return bool(set(instance.get_dirty_fields(check_relationship=True)) - {'modified_at'})
+
+    def post_save(self, instance, created, using=None, **kwargs):
+        if not getattr(instance, 'track_history', True):
+            return
+        if not created and not self._has_changes(instance):
+            return
+        super().post_save(instance, created, using=using, **kwargs)
+
+    def post_delete(self, instance, using=None, **kwargs):
+        if not getattr(instance, 'track_history', True):
+            return
+        super().post_delete(instance, using=using, **kwargs)
@@ -0,0 +1,96 @@
+import codecs
+import csv
+from contextlib import nullcontext
+from itertools import islice
+from typing import Callable, Dict, IO, Iterator, List
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from sentry_sdk.utils import logger
+
+from apps.core.models import CSVImportStatusEnum
+
+
+def read_csv_in_chunks(file: IO[bytes], chunk_size: int, skip_rows: int = 0) -> Iterator[List[Dict]]:
+    """
+    Lazily decodes a binary CSV file and yields its rows as lists of at most `chunk_size` dicts, skipping the first
+    `skip_rows` rows. Only one chunk is ever held in memory, whatever the size of the file.
+    """
+    reader = csv.DictReader(codecs.iterdecode(file, 'utf-8'))
+    rows = islice(reader, skip_rows, None)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_rows(rows: List[Dict], import_row: Callable[[Dict], None]) -> List[Dict]:
+    """
+    Imports each row in a savepoint of its own, so a row that fails is rolled back alone instead of taking the whole
+    chunk with it. Returns the failed rows as `{'row': <index in rows>, 'error': ...}` dicts for `run_csv_import` to
+    record on the `CSVImport`.
+    """
+    failed_rows = []
+    for index, row in enumerate(rows):
+        try:
+            with transaction.atomic():
+                import_row(row)
+        except Exception as e:
+            logger.error(f'Could not import row {row}: {e}')
+            failed_rows.append({'row': index, 'error': f'{e}'})
+    return failed_rows
+
+
+def non_atomic_import_handler(handler: Callable[[List[Dict]], List[Dict]]):
+    """
+    Marks an import handler that calls 3rd parties (e.g. issues refunds), `run_csv_import` then runs it outside of the
+    chunk's transaction so nothing a 3rd party already did is rolled back on our side. Such handlers commit their own
+    work, row by row (see `import_rows`), and must be safe to run again for the rows of an interrupted chunk.
+    """
+    handler.atomic = False
+    return handler
+
+
+def run_csv_import(csv_import: 'CSVImport', chunk_size: int = None) -> int:
+    """
+    Streams the file of a `CSVImport` through its handler, committing the handler's work together with the import's
+    progress one chunk at a time. Picks up after the last committed chunk when the import was interrupted. Rows a
+    handler reports as failed (see `import_rows`) are recorded in `failed_rows` with their line in the file.
+
+    Returns the number of rows processed so far.
+    """
+    CSVImport = apps.get_model('core', 'CSVImport')
+    handler = import_string(csv_import.handler)
+    chunk_size = chunk_size or settings.CSV_IMPORT_CHUNK_SIZE
+    processed_rows = csv_import.processed_rows
+    failed_rows = list(csv_import.failed_rows)
+
+    CSVImport.objects.filter(id=csv_import.id).update(
+        status=CSVImportStatusEnum.processing,
+        error='',
+        modified_at=timezone.now(),
+    )
+    with csv_import.file.open('rb') as file:
+        for chunk in read_csv_in_chunks(file, chunk_size, skip_rows=processed_rows):
+            with transaction.atomic() if getattr(handler, 'atomic', True) else nullcontext():
+                for failed_row in handler(chunk) or []:
+                    # the header is line 1
+                    failed_rows.append({**failed_row, 'row': processed_rows + failed_row['row'] + 2})
+                processed_rows += len(chunk)
+                # progress is written without history, it would otherwise add a historical row per chunk
+                CSVImport.objects.filter(id=csv_import.id).update(
+                    processed_rows=processed_rows,
+                    failed_rows=failed_rows,
+                    modified_at=timezone.now(),
+                )
+
+    CSVImport.objects.filter(id=csv_import.id).update(
+        status=CSVImportStatusEnum.completed,
+        completed_at=timezone.now(),
+        modified_at=timezone.now(),
+    )
+    return processed_rows
@@ -0,0 +1,59 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+
+from libs.api_request import _build_session
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', f'{len(body)}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compares a new session per request with the pooled session of `libs.api_request` against a local stub.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=8)
+
+    def _run(self, url: str, total: int, threads: int, get_session) -> float:
+        def call(_):
+            get_session().get(url, timeout=5).raise_for_status()
+
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(call, range(total)))
+        return time.monotonic() - started_at
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}/'
+        total, threads = options['requests'], options['threads']
+
+        try:
+            pooled_session = _build_session()
+            results = {
+                'new session per request': self._run(url, total, threads, requests.Session),
+                'pooled session': self._run(url, total, threads, lambda: pooled_session),
+            }
+        finally:
+            server.shutdown()
+
+        for name, seconds in results.items():
+            self.stdout.write(f'{name:<24} {seconds:.3f}s, {total / seconds:.0f} requests/s ({threads} threads)')
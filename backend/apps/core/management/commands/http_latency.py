@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from libs.api_request import get_latency_stats
+
+
+class Command(BaseCommand):
+    help = 'Prints call counts and average latencies of outbound requests, per host.'
+
+    def handle(self, *args, **options):
+        stats = get_latency_stats()
+        if not stats:
+            self.stdout.write('No outbound requests recorded (latencies are only kept on redis caches).')
+            return
+
+        self.stdout.write(f'{"host":<40} {"calls":>8} {"failed":>8} {"slow":>8} {"avg (s)":>8}')
+        for host, host_stats in stats.items():
+            self.stdout.write(
+                f'{host:<40} {host_stats["calls"]:>8} {host_stats["failed_calls"]:>8} '
+                f'{host_stats["slow_calls"]:>8} {host_stats["average_seconds"]:>8.3f}'
+            )
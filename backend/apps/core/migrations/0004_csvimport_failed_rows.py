@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_csvimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvimport',
+            name='failed_rows',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='historicalcsvimport',
+            name='failed_rows',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,9 +1,15 @@
-import json
 import uuid
+from typing import Dict, Iterable, List
 
 from dirtyfields import DirtyFieldsMixin
+from django.conf import settings
+from django.core.files.storage import get_storage_class
 from django.db import models
-from simple_history.models import HistoricalRecords
+from django.utils import timezone
+from model_utils import Choices
+
+from apps.core.history import BufferedHistoricalRecords
+from apps.core.request_log import build_api_request_log
 
 
 # Create your models here.
@@ -27,7 +33,9 @@ class CoreModel(DirtyFieldsMixin, models.Model):
         db_index=True,
         verbose_name='last modified at',
     )
-    history = HistoricalRecords(inherit=True)
+    history = BufferedHistoricalRecords(inherit=True)
+    # high-churn tables that are logs in their own right opt out of history rows
+    track_history = True
 
     def is_new(self) -> bool:
         return self._state.adding
@@ -38,26 +46,16 @@ class CoreModel(DirtyFieldsMixin, models.Model):
         
 class APIRequestLogManager(models.Manager):
     def create_from_logged_request(self, request):
-        json_payload = json.dumps({})
-        if request.body and type(request.body) == dict:
-            json_payload = json.dumps(request.body)
-
-        logged_request = self.create(
-            request_url=request.url,
-            request_headers=request.headers,
-            request_json_payload=json.loads(json_payload) if request.body else '{}',
-            response_status_code=request.response.status_code,
-            response_headers=request.response.headers,
-            response_json_payload=json.loads(request.response.raw_body) if request.response.raw_body else '{}',
-            object_type=request.object_type,
-            object_id=request.object_id,
-        )
-        return logged_request
+        return self.create(**build_api_request_log(request))
 
 
 class APIRequestLog(CoreModel):
     """
     This model is meant to log every outbound HTTP(s) request to 3rd party services such as Shopify, ReCharge, etc.
+
+    Logs are written in batches off the request path and kept for `API_REQUEST_LOG_RETENTION_DAYS` days, with
+    credentials redacted (see `apps.core.request_log`). Integrations must not read them back as a cache of responses,
+    see `libs.api_request.get_cached_api_response` instead.
     """
     request_url = models.TextField(null=True, blank=True)
     request_headers = models.TextField(null=True, blank=True)
@@ -69,6 +67,104 @@ class APIRequestLog(CoreModel):
     object_id = models.CharField(max_length=1024, null=True, blank=True, db_index=True)
 
     objects = APIRequestLogManager()
+    track_history = False
 
     def __str__(self):
         return f'{self.request_url}'
+
+
+class OutboxEventManager(models.Manager):
+    def publish(self, topic: str, aggregate_id, payload: Dict = None) -> 'OutboxEvent':
+        """
+        Records that `topic` happened to `aggregate_id`. Call it inside the transaction that makes the change, the
+        event is then committed (or rolled back) together with it.
+        """
+        return self.create(topic=topic, aggregate_id=f'{aggregate_id}', payload=payload or {})
+
+    def publish_many(self, topic: str, aggregate_ids: Iterable) -> List['OutboxEvent']:
+        return self.bulk_create([
+            self.model(topic=topic, aggregate_id=f'{aggregate_id}') for aggregate_id in aggregate_ids
+        ])
+
+    def replay(self, topic: str = None, since=None) -> int:
+        """
+        Marks dispatched events as pending again so the relay sends them out once more.
+        """
+        events = self.filter(dispatched_at__isnull=False)
+        if topic:
+            events = events.filter(topic=topic)
+        if since:
+            events = events.filter(created_at__gte=since)
+        return events.update(dispatched_at=None)
+
+
+class OutboxEvent(models.Model):
+    """
+    Transactional outbox: side effects of a state change (syncing an order to Avalara, analytics events, emails...)
+    are recorded as events in the same transaction as the change itself and relayed to the workers in batches by
+    `apps.core.outbox.relay_outbox_events`.
+
+    Deliberately not a `CoreModel`: events are written on hot paths and are their own audit trail, so they have no
+    history and a sequential id the relay can drain them by. Dispatched events are kept `OUTBOX_EVENT_RETENTION_DAYS`
+    for replays (see `apps.core.outbox.purge_outbox_events`).
+    """
+    id = models.BigAutoField(primary_key=True)
+    topic = models.CharField(max_length=128)
+    aggregate_id = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OutboxEventManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], name='outbox_event_pending_idx', condition=models.Q(dispatched_at__isnull=True)),
+            models.Index(fields=['topic', 'created_at'], name='outbox_event_topic_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.topic} - {self.aggregate_id}'
+
+
+class CSVImportStatusEnum:
+    pending = 'pending'
+    processing = 'processing'
+    completed = 'completed'
+    failed = 'failed'
+
+
+def get_csv_import_storage():
+    storage_class = get_storage_class(settings.CSV_IMPORT_STORAGE)
+    if settings.CSV_IMPORT_STORAGE == 'storages.backends.s3boto3.S3Boto3Storage':
+        # uploads may hold customer data, they are never public
+        return storage_class(bucket_name=settings.CSV_IMPORT_BUCKET_NAME, default_acl='private', querystring_auth=True)
+    return storage_class()
+
+
+class CSVImport(CoreModel):
+    """
+    A CSV file uploaded through a `CoreUploadCSVView`. The file is kept in storage and streamed by
+    `apps.core.tasks.process_csv_import`, which hands it to `handler` (the dotted path of a function taking a list of
+    rows) one chunk at a time. `processed_rows` only moves forward once a chunk is committed, so a failed import
+    resumes right after the last committed chunk. Rows that could not be imported are listed in `failed_rows`.
+    """
+    file = models.FileField(upload_to='csv-imports/%Y/%m/%d/', storage=get_csv_import_storage)
+    handler = models.CharField(max_length=255)
+    status = models.TextField(
+        choices=Choices(
+            CSVImportStatusEnum.pending,
+            CSVImportStatusEnum.processing,
+            CSVImportStatusEnum.completed,
+            CSVImportStatusEnum.failed,
+        ),
+        default=CSVImportStatusEnum.pending,
+    )
+    processed_rows = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    # `{'row': <line in the file>, 'error': ...}` of the rows the handler could not import
+    failed_rows = models.JSONField(blank=True, default=list)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.file.name} - {self.status}'
@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, List
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from sentry_sdk.utils import logger
+
+
+@dataclass(frozen=True)
+class OutboxHandler:
+    task_name: str
+    # batch handlers are called once with every aggregate id of a batch, the others once per aggregate id
+    batch: bool = False
+    # name of a boolean setting the handler is gated behind
+    enabled_setting: str = None
+
+    @property
+    def is_enabled(self) -> bool:
+        return not self.enabled_setting or bool(getattr(settings, self.enabled_setting))
+
+
+class OutboxTopicEnum:
+    order_paid = 'order.paid'
+    order_refunded = 'order.refunded'
+    order_partially_refunded = 'order.partially_refunded'
+    order_charge_failed = 'order.charge_failed'
+    subscription_created = 'subscription.created'
+    subscription_activated = 'subscription.activated'
+    subscription_cancelled = 'subscription.cancelled'
+
+
+OUTBOX_HANDLERS: Dict[str, List[OutboxHandler]] = {
+    OutboxTopicEnum.order_paid: [
+        OutboxHandler('apps.orders.tasks.notifications.send_order_confirmation_email'),
+        OutboxHandler('apps.orders.tasks.notifications.sync_order_placed_event'),
+        OutboxHandler('apps.orders.tasks.order.sync_orders_to_tax_client', batch=True),
+        OutboxHandler('apps.orders.tasks.loyalty.sync_order_to_yotpo', enabled_setting='YOTPO_ORDER_SYNC_ENABLED'),
+    ],
+    OutboxTopicEnum.order_refunded: [
+        OutboxHandler('apps.orders.tasks.order.sync_refunded_order_to_shopify'),
+        OutboxHandler('apps.orders.tasks.order.sync_refund_to_tax_client'),
+        OutboxHandler('apps.orders.tasks.loyalty.sync_refund_to_yotpo', enabled_setting='YOTPO_ORDER_SYNC_ENABLED'),
+    ],
+    OutboxTopicEnum.order_partially_refunded: [
+        OutboxHandler('apps.orders.tasks.order.sync_partial_refund_to_shopify'),
+        OutboxHandler('apps.orders.tasks.loyalty.sync_refund_to_yotpo', enabled_setting='YOTPO_ORDER_SYNC_ENABLED'),
+    ],
+    OutboxTopicEnum.order_charge_failed: [
+        OutboxHandler('apps.orders.tasks.notifications.sync_order_payment_failed_to_analytics'),
+    ],
+    OutboxTopicEnum.subscription_created: [
+        OutboxHandler('apps.customers.tasks.notification.sync_subscription_created_event'),
+    ],
+    OutboxTopicEnum.subscription_activated: [
+        OutboxHandler('apps.customers.tasks.notification.sync_subscription_activated_event'),
+    ],
+    OutboxTopicEnum.subscription_cancelled: [
+        OutboxHandler('apps.customers.tasks.notification.sync_subscription_cancelled_event'),
+    ],
+}
+
+
+def relay_outbox_batch(batch_size: int = None) -> int:
+    """
+    Claims the oldest pending outbox events and sends one message per handler and topic to the workers, instead of
+    one per handler and event. Events are marked as dispatched in the transaction that claimed them, so a relay that
+    dies midway leaves them pending: delivery is at-least-once.
+    """
+    from apps.core.tasks import run_outbox_handler
+    OutboxEvent = apps.get_model('core', 'OutboxEvent')
+
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.filter(
+                dispatched_at__isnull=True,
+            ).select_for_update(
+                skip_locked=True,
+            ).order_by('id')[:batch_size or settings.OUTBOX_RELAY_BATCH_SIZE]
+        )
+        if not events:
+            return 0
+
+        aggregate_ids_by_topic = {}
+        for event in events:
+            # a dict dedupes the aggregate ids of a topic while keeping them in the order they happened
+            aggregate_ids_by_topic.setdefault(event.topic, {})[event.aggregate_id] = None
+
+        for topic, aggregate_ids in aggregate_ids_by_topic.items():
+            if topic not in OUTBOX_HANDLERS:
+                logger.error(f'No outbox handlers registered for topic {topic}')
+            for handler in OUTBOX_HANDLERS.get(topic, []):
+                if handler.is_enabled:
+                    run_outbox_handler.delay(handler.task_name, list(aggregate_ids), handler.batch)
+
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(dispatched_at=timezone.now())
+
+    return len(events)
+
+
+def purge_outbox_events(batch_size: int = None) -> int:
+    """
+    Deletes a batch of events dispatched more than `OUTBOX_EVENT_RETENTION_DAYS` ago, oldest first, returns how many
+    were deleted. Events still pending are kept whatever their age.
+    """
+    OutboxEvent = apps.get_model('core', 'OutboxEvent')
+    batch_size = batch_size or settings.OUTBOX_RELAY_BATCH_SIZE
+    # ids are sequential: walking the primary key finds the old dispatched events first, without an extra index
+    expired_ids = OutboxEvent.objects.filter(
+        dispatched_at__lt=timezone.now() - timedelta(days=settings.OUTBOX_EVENT_RETENTION_DAYS),
+    ).order_by('id').values_list('id', flat=True)[:batch_size]
+    # events have no history and nothing references them, the collector (and its signals) can be skipped
+    expired_events = OutboxEvent.objects.filter(id__in=list(expired_ids))
+    return expired_events._raw_delete(expired_events.db)
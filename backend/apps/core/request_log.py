@@ -0,0 +1,128 @@
+import json
+from datetime import timedelta
+from typing import Dict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from furl import furl
+from sentry_sdk.utils import logger
+
+
+QUEUE_KEY = 'api-request-log-queue'
+REDACTED = '[REDACTED]'
+# credentials our clients send or receive, they never make it to the logs
+REDACTED_HEADERS = {
+    'authorization',
+    'proxy-authorization',
+    'cookie',
+    'set-cookie',
+    'x-api-key',
+    'x-guid',
+    'x-shopify-access-token',
+}
+
+
+def _get_redis_client(cache_name):
+    get_client = getattr(getattr(caches[cache_name], 'client', None), 'get_client', None)
+    return get_client(write=True) if get_client else None
+
+
+def redact_headers(headers: Dict) -> str:
+    return json.dumps({
+        key: REDACTED if key.lower() in REDACTED_HEADERS else f'{value}' for key, value in (headers or {}).items()
+    })
+
+
+def redact_url(url: str) -> str:
+    # e.g. the `https://{api_key}:{password}@{shop}` urls of the Shopify REST client
+    url = furl(url)
+    if url.username or url.password:
+        url.username = REDACTED if url.username else url.username
+        url.password = REDACTED if url.password else url.password
+    return url.url
+
+
+def build_api_request_log(request: 'APIRequestDTO') -> Dict:
+    """
+    Fields of the `APIRequestLog` of a request made through `libs.api_request`, as JSON serializable values.
+    """
+    return {
+        'request_url': redact_url(request.url),
+        'request_headers': redact_headers(request.headers),
+        'request_json_payload': request.body if isinstance(request.body, (dict, list)) else {},
+        'response_status_code': request.response.status_code,
+        'response_headers': redact_headers(request.response.headers),
+        'response_json_payload': request.response.parsed_body,
+        'object_type': request.object_type,
+        'object_id': f'{request.object_id}' if request.object_id is not None else None,
+    }
+
+
+def enqueue_api_request_log(request: 'APIRequestDTO'):
+    """
+    Queues the log of a request in the `celery` cache, `flush_api_request_logs` writes queued logs in batches. Caches
+    that cannot hold a queue (e.g. the file based caches of local environments) write the log right away.
+
+    Logging is best effort: the request was already sent, a log that cannot be queued must not fail (and retry) it.
+    Logs are dropped while `API_REQUEST_LOG_QUEUE_MAX_LENGTH` logs are waiting to be written.
+    """
+    try:
+        log = build_api_request_log(request)
+        redis_client = _get_redis_client('celery')
+        if redis_client is None:
+            APIRequestLog = apps.get_model('core', 'APIRequestLog')
+            APIRequestLog.objects.create(**log)
+            return
+        pipeline = redis_client.pipeline(transaction=True)
+        pipeline.rpush(QUEUE_KEY, json.dumps(log))
+        # the newest logs are trimmed, the oldest ones may be in the middle of being flushed
+        pipeline.ltrim(QUEUE_KEY, 0, settings.API_REQUEST_LOG_QUEUE_MAX_LENGTH - 1)
+        pipeline.execute()
+    except Exception:
+        logger.exception(f'Could not log the {request.method} request to {redact_url(request.url)}')
+
+
+def flush_api_request_logs(batch_size: int = None) -> int:
+    """
+    Writes a batch of queued logs with a single insert, returns how many were written. Logs are only taken off the
+    queue once they are written: a failed insert leaves them queued for the next flush, a flush interrupted between
+    the two may write a batch twice. Flushes must not run concurrently (see `apps.core.tasks`).
+    """
+    APIRequestLog = apps.get_model('core', 'APIRequestLog')
+    redis_client = _get_redis_client('celery')
+    if redis_client is None:
+        return 0
+
+    batch_size = batch_size or settings.API_REQUEST_LOG_BATCH_SIZE
+    queued_logs = redis_client.lrange(QUEUE_KEY, 0, batch_size - 1)
+    if not queued_logs:
+        return 0
+
+    logs = []
+    for queued_log in queued_logs:
+        try:
+            logs.append(APIRequestLog(**json.loads(queued_log)))
+        except (ValueError, TypeError) as e:
+            # a log that cannot be read back would block the queue forever
+            logger.error(f'Dropped unreadable API request log {queued_log!r}: {e}')
+
+    APIRequestLog.objects.bulk_create(logs)
+    # logs are only ever appended, the batch written is still at the head of the queue
+    redis_client.ltrim(QUEUE_KEY, len(queued_logs), -1)
+    return len(queued_logs)
+
+
+def purge_api_request_logs(batch_size: int = None) -> int:
+    """
+    Deletes a batch of logs older than `API_REQUEST_LOG_RETENTION_DAYS`, oldest first, returns how many were deleted.
+    """
+    APIRequestLog = apps.get_model('core', 'APIRequestLog')
+    batch_size = batch_size or settings.API_REQUEST_LOG_BATCH_SIZE
+    expired_ids = APIRequestLog.objects.filter(
+        created_at__lt=timezone.now() - timedelta(days=settings.API_REQUEST_LOG_RETENTION_DAYS),
+    ).order_by('created_at').values_list('id', flat=True)[:batch_size]
+    # logs have no history and nothing references them, the collector (and its signals) can be skipped
+    expired_logs = APIRequestLog.objects.filter(id__in=list(expired_ids))
+    return expired_logs._raw_delete(expired_logs.db)
@@ -2,13 +2,20 @@ from __future__ import absolute_import, unicode_literals
 
 import logging
 from http.client import RemoteDisconnected
+from typing import List
 
 import stripe
 
+from celery import current_app, shared_task
+from celery.exceptions import SoftTimeLimitExceeded
 from celery_once import QueueOnce
+from django.apps import apps
+from django.utils import timezone
 from requests import HTTPError, exceptions
 
 from apps.core.exceptions import APIRateLimitError
+from libs import celery_helpers
+from libs.rate_limiting import CircuitOpenError
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +26,7 @@ class HttpErrorRetryTask(QueueOnce):
         'unlock_before_run': False
     }
     retry_backoff = True
-    autoretry_for = (HTTPError, exceptions.ConnectionError, RemoteDisconnected, )
+    autoretry_for = (HTTPError, exceptions.ConnectionError, RemoteDisconnected, CircuitOpenError, )
     retry_kwargs = {'max_retries': 10}
 
     def on_failure(self, exc, task_id, args, kwargs, einfo):
@@ -39,6 +46,131 @@ class StripeErrorRetryTask(HttpErrorRetryTask):
         HTTPError,
         exceptions.ConnectionError,
         RemoteDisconnected,
+        CircuitOpenError,
         stripe.error.StripeError,
         stripe.error.APIConnectionError,
     )
+
+
+@shared_task(bind=True, max_retries=5)
+def run_outbox_handler(self, task_name: str, aggregate_ids: List[str], batch: bool = False):
+    """
+    Runs an outbox handler for a batch of aggregates. Per-aggregate handlers are called in-process one id at a time,
+    and only the ids that failed are retried, so the ones that went through are not sent twice. Batch handlers skip
+    the aggregates they already handled, a failed batch is retried as a whole.
+    """
+    handler = current_app.tasks[task_name]
+    if batch:
+        try:
+            return handler(aggregate_ids)
+        except Exception as e:
+            logger.error(f'Outbox handler {task_name} failed for {len(aggregate_ids)} aggregates: {e}')
+            raise self.retry(
+                args=(task_name, aggregate_ids, batch),
+                countdown=60 * 2 ** self.request.retries,
+            )
+
+    failed_aggregate_ids = []
+    for aggregate_id in aggregate_ids:
+        try:
+            handler(aggregate_id)
+        except Exception as e:
+            logger.error(f'Outbox handler {task_name} failed for {aggregate_id}: {e}')
+            failed_aggregate_ids.append(aggregate_id)
+
+    if failed_aggregate_ids:
+        raise self.retry(
+            args=(task_name, failed_aggregate_ids, batch),
+            countdown=60 * 2 ** self.request.retries,
+        )
+
+    return f'Ran {task_name} for {len(aggregate_ids)} aggregates'
+
+
+@shared_task(soft_time_limit=60 * 60)
+@celery_helpers.prevent_multiple
+def relay_outbox_events():
+    from apps.core.outbox import relay_outbox_batch
+
+    relayed = 0
+    while True:
+        batch_relayed = relay_outbox_batch()
+        if not batch_relayed:
+            break
+        relayed += batch_relayed
+
+    return f'Relayed {relayed} outbox events'
+
+
+@shared_task(soft_time_limit=60 * 60)
+@celery_helpers.prevent_multiple
+def purge_outbox_events():
+    from apps.core.outbox import purge_outbox_events as purge_batch
+
+    purged = 0
+    while True:
+        batch_purged = purge_batch()
+        if not batch_purged:
+            break
+        purged += batch_purged
+
+    return f'Deleted {purged} dispatched outbox events'
+
+
+@shared_task(soft_time_limit=60 * 60)
+@celery_helpers.prevent_multiple
+def flush_api_request_logs():
+    from apps.core.request_log import flush_api_request_logs as flush_batch
+
+    flushed = 0
+    while True:
+        batch_flushed = flush_batch()
+        if not batch_flushed:
+            break
+        flushed += batch_flushed
+
+    return f'Wrote {flushed} API request logs'
+
+
+@shared_task(soft_time_limit=60 * 60)
+@celery_helpers.prevent_multiple
+def purge_api_request_logs():
+    from apps.core.request_log import purge_api_request_logs as purge_batch
+
+    purged = 0
+    while True:
+        batch_purged = purge_batch()
+        if not batch_purged:
+            break
+        purged += batch_purged
+
+    return f'Deleted {purged} expired API request logs'
+
+
+@shared_task(soft_time_limit=60 * 60)
+@celery_helpers.prevent_multiple
+def process_csv_import(csv_import_id: str):
+    from apps.core.imports import run_csv_import
+    from apps.core.models import CSVImportStatusEnum
+    CSVImport = apps.get_model('core', 'CSVImport')
+
+    csv_import = CSVImport.objects.get(id=csv_import_id)
+    if csv_import.status == CSVImportStatusEnum.completed:
+        return f'{csv_import} was already imported'
+
+    try:
+        processed_rows = run_csv_import(csv_import)
+    except SoftTimeLimitExceeded:
+        # committed chunks are kept, pick up from the last one in a fresh task once this one released its lock
+        CSVImport.objects.filter(id=csv_import_id).update(status=CSVImportStatusEnum.pending)
+        process_csv_import.apply_async(args=(csv_import_id,), countdown=10)
+        return f'{csv_import} will resume in a new task'
+    except Exception as e:
+        CSVImport.objects.filter(id=csv_import_id).update(
+            status=CSVImportStatusEnum.failed,
+            error=f'{e}',
+            modified_at=timezone.now(),
+        )
+        raise
+
+    return f'Imported {processed_rows} rows from {csv_import}'
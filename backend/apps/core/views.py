@@ -1,6 +1,7 @@
 from django.apps import apps
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils.decorators import method_decorator
@@ -40,13 +41,19 @@ class OnboardingView(TemplateView):
 
 
 class CoreUploadCSVView(TemplateView):
+    """
+    Stores the uploaded CSV file and enqueues its id, the rows are streamed to `import_handler` (the dotted path of a
+    function taking a list of rows) in chunks by `apps.core.tasks.process_csv_import`.
+    """
     template_name = 'index.html'
-    async_function = callable
+    import_handler = ''
     view_name = ''
 
     def post(self, request, *args, **kwargs):
-        csv_file = request.FILES['csv_file']
-        decoded_file = csv_file.read().decode('utf-8').splitlines()
-        self.async_function.delay(decoded_file)
+        from apps.core.tasks import process_csv_import
+        CSVImport = apps.get_model('core', 'CSVImport')
+
+        csv_import = CSVImport.objects.create(file=request.FILES['csv_file'], handler=self.import_handler)
+        transaction.on_commit(lambda: process_csv_import.delay(f'{csv_import.id}'))
         messages.add_message(request=request, level=messages.SUCCESS, message='File Will be processed shortly!')
         return redirect(reverse(self.view_name))
@@ -0,0 +1,54 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # indexes are built concurrently so the subscriptions table is not locked while they are created
+    atomic = False
+
+    dependencies = [
+        ('customers', '0014_auto_20220701_1214'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='customersubscription',
+            index=models.Index(
+                condition=models.Q(('is_active', True)),
+                fields=['next_order_charge_date', 'id'],
+                name='subscription_renewal_idx',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='customersubscription',
+            index=models.Index(
+                condition=models.Q(('is_active', True), ('synced_to_klaviyo', False)),
+                fields=['-activated_at'],
+                name='sub_klaviyo_active_queue_idx',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='customersubscription',
+            index=models.Index(
+                condition=models.Q(('is_active', False), ('synced_to_klaviyo', False)),
+                fields=['-deactivated_at'],
+                name='sub_klaviyo_inactive_queue_idx',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='customersubscription',
+            index=models.Index(
+                condition=models.Q(('is_active', True), ('updated_profile_fields_to_klaviyo', False)),
+                fields=['-activated_at'],
+                name='sub_profile_active_queue_idx',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='customersubscription',
+            index=models.Index(
+                condition=models.Q(('is_active', False), ('updated_profile_fields_to_klaviyo', False)),
+                fields=['-activated_at'],
+                name='sub_profile_inactive_queue_idx',
+            ),
+        ),
+    ]
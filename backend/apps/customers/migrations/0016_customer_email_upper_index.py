@@ -0,0 +1,19 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    # built concurrently so the customers table is not locked while the index is created
+    atomic = False
+
+    dependencies = [
+        ('customers', '0015_customersubscription_work_queue_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='customer',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='customer_email_upper_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models, transaction
+from django.db.models.functions import Upper
 from model_utils import Choices
 from apps.core.models import CoreModel
 
@@ -42,6 +43,12 @@ class Customer(PersonMixin, CoreModel, AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = 'first_name', 'last_name', 'password'
 
+    class Meta(CoreModel.Meta):
+        indexes = [
+            # case-insensitive `email__iexact` lookups (login, CSV imports) compare `UPPER(email)`
+            models.Index(Upper('email'), name='customer_email_upper_idx'),
+        ]
+
     def __str__(self) -> str:
         return f'{self.full_name} - {self.email}'
 
@@ -8,14 +8,10 @@ from django_fsm import FSMField, transition
 from model_utils import Choices
 from sentry_sdk.utils import logger
 
-from apps.core.models import CoreModel
+from apps.core.models import CoreModel, OutboxEvent
+from apps.core.outbox import OutboxTopicEnum
 from apps.customers.models import Customer, CustomerChild
 from apps.customers.models.validators.customer_subscription import validate_charge_date
-from apps.customers.tasks import (
-    sync_subscription_cancelled_event,
-    sync_subscription_activated_event,
-    sync_subscription_created_event,
-)
 from apps.customers.tasks.recurring import _send_email
 
 
@@ -53,6 +49,36 @@ class CustomerSubscription(CoreModel):
         default=SubscriptionStatusEnum.inactive,
     )
 
+    class Meta(CoreModel.Meta):
+        # partial indexes matching the renewal and Klaviyo/Segment scanners, see `apps.customers.tasks.recurring`
+        indexes = [
+            models.Index(
+                fields=['next_order_charge_date', 'id'],
+                name='subscription_renewal_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['-activated_at'],
+                name='sub_klaviyo_active_queue_idx',
+                condition=models.Q(is_active=True, synced_to_klaviyo=False),
+            ),
+            models.Index(
+                fields=['-deactivated_at'],
+                name='sub_klaviyo_inactive_queue_idx',
+                condition=models.Q(is_active=False, synced_to_klaviyo=False),
+            ),
+            models.Index(
+                fields=['-activated_at'],
+                name='sub_profile_active_queue_idx',
+                condition=models.Q(is_active=True, updated_profile_fields_to_klaviyo=False),
+            ),
+            models.Index(
+                fields=['-activated_at'],
+                name='sub_profile_inactive_queue_idx',
+                condition=models.Q(is_active=False, updated_profile_fields_to_klaviyo=False),
+            ),
+        ]
+
     def __str__(self):
         return f'{self.customer_child}, {self.number_of_servings} cups every {self.frequency} week(s)'
 
@@ -137,14 +163,6 @@ class CustomerSubscription(CoreModel):
         except Exception as e:
             logger.error(e)
 
-        sync_subscription_cancelled_event.delay(self.id)
-
-    def _send_subscription_activated_event(self):
-        sync_subscription_activated_event.delay(self.id)
-
-    def _sync_new_subscription_to_segment(self):
-        sync_subscription_created_event.delay(self.id)
-
     def save(self, *args, **kwargs):
         changed_fields = self.get_dirty_fields()
         # when number of servings change, ensure the cart line items contain the appropriate skus
@@ -152,14 +170,17 @@ class CustomerSubscription(CoreModel):
             if int(self.number_of_servings) < 24:
                 transaction.on_commit(lambda: self.customer_child.cart.line_items.filter().delete())
 
+        # analytics events are published to the outbox in the same transaction as the change, see `apps.core.outbox`
+        outbox_topics = []
         if self.is_new():
-            transaction.on_commit(self._sync_new_subscription_to_segment)
+            outbox_topics.append(OutboxTopicEnum.subscription_created)
         if not self.is_new() and 'is_active' in changed_fields:
             # new customers should not be affected by this. only existing ones
             if not self.is_active:
                 transaction.on_commit(self._send_subscription_cancellation_notification)
+                outbox_topics.append(OutboxTopicEnum.subscription_cancelled)
             else:
-                transaction.on_commit(self._send_subscription_activated_event)
+                outbox_topics.append(OutboxTopicEnum.subscription_activated)
 
         if self.is_active and self.next_order_charge_date:
             next_order_charge_date = self.next_order_charge_date
@@ -174,4 +195,7 @@ class CustomerSubscription(CoreModel):
             if not self.next_order_changes_enabled_date:
                 self.next_order_changes_enabled_date = next_order_charge_date - timedelta(days=1)
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            for topic in outbox_topics:
+                OutboxEvent.objects.publish(topic, self.id)
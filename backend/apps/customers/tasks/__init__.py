@@ -9,7 +9,7 @@ from apps.customers.tasks.recurring import (
     send_upcoming_charge_notification_to_active_subscribers,
 )
 from apps.customers.tasks.imports import (
-    create_customers_from_file,
-    create_subscriptions_from_file,
-    update_next_order_charge_dates_from_file,
+    create_customers_from_rows,
+    create_subscriptions_from_rows,
+    update_next_order_charge_dates_from_rows,
 )
@@ -1,10 +1,13 @@
-import csv
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional
 
-from celery import shared_task
 from django.apps import apps
-from django.core.exceptions import MultipleObjectsReturned
+from django.db import transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
+from apps.core.outbox import OutboxTopicEnum
+from apps.customers.tasks.loyalty import create_loyalty_customer, update_to_loyalty_client
 from apps.orders.libs import OrderConfirmationEmailStatus
 from apps.orders.libs import OrderPaymentStatusEnum
 from celery_app import app
@@ -45,126 +48,248 @@ def _save_customer_child_data(child_data: Dict):
     return f'Imported {child}'
 
 
-def _create_customer_records_from_line_data(data: Dict):
+def email_lookup_key(email: str) -> str:
+    # matches the `UPPER(email)` that `email__iexact` lookups and the `customer_email_upper_idx` index are built on
+    return email.upper()
+
+
+def get_customers_by_email(emails: Iterable[str]) -> Dict[str, Optional['Customer']]:
+    """
+    Loads the customers of a chunk of rows with a single query, keyed by `email_lookup_key`. Like `email__iexact`
+    lookups, emails shared by several customers are ambiguous: they are kept as `None` so callers can skip them.
+    """
     Customer = apps.get_model('customers', 'Customer')
+    customers = {}
+    for customer in Customer.objects.annotate(
+        upper_email=Upper('email'),
+    ).filter(
+        upper_email__in={email_lookup_key(email) for email in emails},
+    ):
+        key = email_lookup_key(customer.email)
+        customers[key] = None if key in customers else customer
+    return customers
+
+
+def get_first_children(parent_ids: Iterable[str]) -> Dict[str, 'CustomerChild']:
     CustomerChild = apps.get_model('customers', 'CustomerChild')
-    Cart = apps.get_model('carts', 'Cart')
+    children = {}
+    # same child as `customer.children.first()`, which falls back to ordering by primary key
+    for child in CustomerChild.objects.filter(parent_id__in=parent_ids).order_by('parent_id', 'id'):
+        children.setdefault(child.parent_id, child)
+    return children
+
+
+def create_customers(customers: List['Customer']):
+    """
+    Bulk counterpart of `Customer.save` for new customers, their loyalty program accounts are created once the
+    chunk is committed.
+    """
+    Customer = apps.get_model('customers', 'Customer')
+    bulk_create_with_history(customers, Customer)
+
+    def _create_loyalty_customers():
+        for customer in customers:
+            create_loyalty_customer(customer)
 
-    try:
-        customer = Customer.objects.get(email__iexact=data['email'])
-    except Customer.DoesNotExist:
-        customer = Customer(
-            email=data['email'], first_name=data['first_name'], last_name=data['last_name'])
-    except MultipleObjectsReturned:
-        return 'Already Imported'
-
-    if not customer.recharge_customer_id:
-        customer.recharge_customer_id = data['customer_id']
-        customer.save()
-    if not customer.external_customer_id:
-        customer.first_name = data['first_name']
-        customer.last_name = data['last_name']
-        customer.external_customer_id = data['external_customer_id']
-        if bool(int(data['number_active_subscriptions'])):
-            customer.has_active_subscriptions = True
-            customer.status = 'subscriber'
-        else:
-            customer.status = 'deactivated'
-        customer.save()
-        print(f'created new customer: {customer}')
-
-        if not customer.children.count():
-            child, _ = CustomerChild.objects.get_or_create(
-                parent=customer,
-                first_name=f"{customer.first_name}'s Little One",
-                last_name=customer.last_name,
-            )
-
-            if not child.cart:
-                cart, _ = Cart.objects.get_or_create(
-                    customer=customer,
-                    customer_child=child,
-                )
-            print(f'create {child} for {customer}')
-
-
-@shared_task
-def create_customers_from_file(decoded_file):
-    reader = csv.DictReader(decoded_file)
-    for line in reader:
-        _create_customer_records_from_line_data(line)
-
-
-def _create_customer_subscription_from_line_data(data: Dict):
+    if customers:
+        transaction.on_commit(_create_loyalty_customers)
+
+
+def update_customers(customers: List['Customer'], fields: List[str]):
+    """
+    Bulk counterpart of `Customer.save` for existing customers, see `create_customers`.
+    """
     Customer = apps.get_model('customers', 'Customer')
-    CustomerChild = apps.get_model('customers', 'CustomerChild')
+    renamed_customers = [
+        customer for customer in customers
+        if {'email', 'first_name', 'last_name'}.intersection(customer.get_dirty_fields())
+    ]
+    now = timezone.now()
+    for customer in customers:
+        customer.modified_at = now
+    bulk_update_with_history(customers, Customer, fields=[*fields, 'modified_at'])
+
+    def _update_loyalty_customers():
+        for customer in renamed_customers:
+            update_to_loyalty_client(customer)
+
+    if renamed_customers:
+        transaction.on_commit(_update_loyalty_customers)
+
+
+def get_or_create_carts(children: Iterable['CustomerChild']) -> Dict[str, 'Cart']:
+    """
+    Returns the carts of `children` keyed by child id, creating the missing ones in bulk. Children created in bulk
+    skip the on-commit hook `CustomerChild.save` creates their cart with, so they get it from here.
+    """
     Cart = apps.get_model('carts', 'Cart')
+    children = list(children)
+    carts = {cart.customer_child_id: cart for cart in Cart.objects.filter(customer_child__in=children)}
+    new_carts = [
+        Cart(customer_id=child.parent_id, customer_child=child) for child in children if child.id not in carts
+    ]
+    bulk_create_with_history(new_carts, Cart)
+    carts.update({cart.customer_child_id: cart for cart in new_carts})
+    return carts
+
+
+def get_or_create_cart_line_items(line_items: List['CartLineItem']):
+    """
+    Bulk `get_or_create` of cart line items on their cart, variant and product, quantities of existing ones are left
+    untouched.
+    """
     CartLineItem = apps.get_model('carts', 'CartLineItem')
+    existing_line_items = set(CartLineItem.objects.filter(
+        cart_id__in={line_item.cart_id for line_item in line_items},
+    ).values_list('cart_id', 'product_variant_id', 'product_id'))
+
+    new_line_items = []
+    for line_item in line_items:
+        key = (line_item.cart_id, line_item.product_variant_id, line_item.product_id)
+        if key not in existing_line_items:
+            existing_line_items.add(key)
+            new_line_items.append(line_item)
+    bulk_create_with_history(new_line_items, CartLineItem)
+
+
+def create_subscriptions(subscriptions: List['CustomerSubscription']):
+    """
+    Bulk counterpart of `CustomerSubscription.save` for new subscriptions, publishing their created events at once.
+    """
     CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
-    ProductVariant = apps.get_model('products', 'ProductVariant')
+    OutboxEvent = apps.get_model('core', 'OutboxEvent')
+    bulk_create_with_history(subscriptions, CustomerSubscription)
+    OutboxEvent.objects.publish_many(
+        OutboxTopicEnum.subscription_created,
+        [subscription.id for subscription in subscriptions],
+    )
 
-    try:
-        customer = Customer.objects.get(email__iexact=data['customer_email'])
-        customer_child = customer.children.first()
-        if not customer_child:
-            customer_child, _ = CustomerChild.objects.get_or_create(
-                parent=customer,
-                first_name=f"{customer.first_name}'s Little One"
-            )
-
-        cart, _ = Cart.objects.get_or_create(
-            customer=customer,
-            customer_child=customer_child,
+
+def create_customers_from_rows(rows: List[Dict]):
+    Customer = apps.get_model('customers', 'Customer')
+    CustomerChild = apps.get_model('customers', 'CustomerChild')
+
+    customers = get_customers_by_email(line['email'] for line in rows)
+    new_customers = {}
+    updated_customers = {}
+    customers_without_external_id = {}
+    for data in rows:
+        key = email_lookup_key(data['email'])
+        if key in customers and not customers[key]:
+            print(f'{data["email"]} was already imported')
+            continue
+
+        customer = customers.get(key) or new_customers.get(key)
+        if not customer:
+            customer = new_customers[key] = Customer(
+                email=data['email'], first_name=data['first_name'], last_name=data['last_name'])
+        elif not customer.is_new():
+            updated_customers[customer.id] = customer
+
+        if not customer.recharge_customer_id:
+            customer.recharge_customer_id = data['customer_id']
+        if not customer.external_customer_id:
+            customer.first_name = data['first_name']
+            customer.last_name = data['last_name']
+            customer.external_customer_id = data['external_customer_id']
+            if bool(int(data['number_active_subscriptions'])):
+                customer.has_active_subscriptions = True
+                customer.status = 'subscriber'
+            else:
+                customer.status = 'deactivated'
+            customers_without_external_id[customer.id] = customer
+
+    create_customers(list(new_customers.values()))
+    update_customers(
+        [customer for customer in updated_customers.values() if customer.is_dirty()],
+        fields=['recharge_customer_id', 'first_name', 'last_name', 'external_customer_id', 'has_active_subscriptions',
+                'status'],
+    )
+
+    customers_with_children = get_first_children(customers_without_external_id)
+    new_children = [
+        CustomerChild(
+            parent=customer,
+            first_name=f"{customer.first_name}'s Little One",
+            last_name=customer.last_name,
         )
+        for customer in customers_without_external_id.values() if customer.id not in customers_with_children
+    ]
+    bulk_create_with_history(new_children, CustomerChild)
+    get_or_create_carts(new_children)
+    print(f'imported {len(new_customers)} new customers and {len(new_children)} children')
 
-        subscription = CustomerSubscription.objects.filter(
-            customer=customer,
-            customer_child=customer_child,
-        ).first()
-        if not subscription:
-            subscription, _ = CustomerSubscription.objects.get_or_create(
-                customer=customer,
-                customer_child=customer_child,
-                defaults={
-                    'is_active': False if data.get('cancelled_at', False) else 'active',
-                    'status': 'inactive' if data.get('cancelled_at', False) else 'active',
-                    'frequency': data['charge_interval_frequency'],
-                    'deactivated_at': data['cancelled_at'] if data['cancelled_at'] else None,
-                    'number_of_servings': '12' if data['recurring_price'] == '5.49' else '24',
-                },
-            )
-
-            variant = ProductVariant.objects.filter(
-                external_variant_id=data['external_variant_id']).first()
-            if variant:
-                line_item, _ = CartLineItem.objects.get_or_create(
-                    cart=cart,
-                    product_variant=variant,
-                    product=variant.product,
-                    defaults={
-                        'quantity': data['quantity'],
-                    }
-                )
-                print(f'created line item for cart: {cart}')
-    except Customer.DoesNotExist:
-        print(f"No customer with email {data['customer_email']}")
-    except MultipleObjectsReturned:
-        print(f'{data["customer_email"]} already exists')
-
-
-@shared_task
-def create_subscriptions_from_file(decoded_file):
-    reader = csv.DictReader(decoded_file)
-    for line in reader:
-        _create_customer_subscription_from_line_data(line)
 
+def create_subscriptions_from_rows(rows: List[Dict]):
+    CustomerChild = apps.get_model('customers', 'CustomerChild')
+    CartLineItem = apps.get_model('carts', 'CartLineItem')
+    CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
 
-@app.task
-def update_next_order_charge_dates_from_file(decoded_file):
-    reader = csv.DictReader(decoded_file)
+    customers = get_customers_by_email(line['customer_email'] for line in rows)
+    children = get_first_children(customer.id for customer in customers.values() if customer)
+    new_children = []
+    for customer in customers.values():
+        if customer and customer.id not in children:
+            children[customer.id] = CustomerChild(parent=customer, first_name=f"{customer.first_name}'s Little One")
+            new_children.append(children[customer.id])
+    bulk_create_with_history(new_children, CustomerChild)
+    carts = get_or_create_carts(children.values())
+
+    # subscriptions are one to one with children, a child that has one already is skipped
+    subscribed_child_ids = set(CustomerSubscription.objects.filter(
+        customer_child__in=list(children.values()),
+    ).values_list('customer_child_id', flat=True))
+    variants = {}
+    for variant in ProductVariant.objects.filter(
+        external_variant_id__in={line['external_variant_id'] for line in rows},
+    ).order_by('id'):
+        variants.setdefault(variant.external_variant_id, variant)
+
+    new_subscriptions = []
+    new_line_items = []
+    for data in rows:
+        key = email_lookup_key(data['customer_email'])
+        if key not in customers:
+            print(f"No customer with email {data['customer_email']}")
+            continue
+        if not customers[key]:
+            print(f'{data["customer_email"]} already exists')
+            continue
+
+        customer_child = children[customers[key].id]
+        if customer_child.id in subscribed_child_ids:
+            continue
+
+        subscribed_child_ids.add(customer_child.id)
+        new_subscriptions.append(CustomerSubscription(
+            customer=customers[key],
+            customer_child=customer_child,
+            is_active=not data.get('cancelled_at', False),
+            status='inactive' if data.get('cancelled_at', False) else 'active',
+            frequency=data['charge_interval_frequency'],
+            deactivated_at=data['cancelled_at'] if data['cancelled_at'] else None,
+            number_of_servings='12' if data['recurring_price'] == '5.49' else '24',
+        ))
+
+        variant = variants.get(data['external_variant_id'])
+        if variant:
+            new_line_items.append(CartLineItem(
+                cart=carts[customer_child.id],
+                product_variant=variant,
+                product_id=variant.product_id,
+                quantity=data['quantity'],
+            ))
+
+    create_subscriptions(new_subscriptions)
+    get_or_create_cart_line_items(new_line_items)
+    print(f'imported {len(new_subscriptions)} subscriptions and {len(new_line_items)} cart line items')
+
+
+def update_next_order_charge_dates_from_rows(rows: List[Dict]):
     Customer = apps.get_model('customers', 'Customer')
 
-    for line in reader:
+    for line in rows:
         try:
             customer = Customer.objects.get(email=line['Row Labels'])
             with locking.acquire_shared_lock_context(
@@ -192,12 +317,10 @@ def update_next_order_charge_dates_from_file(decoded_file):
     return 'Completed updating next order charge dates for customers.'
 
 
-@app.task
-def send_confirmation_email_from_file(decoded_file):
+def send_confirmation_email_from_rows(rows: List[Dict]):
     Order = apps.get_model('orders', 'Order')
-    reader = csv.DictReader(decoded_file)
-    
-    for line in reader:
+
+    for line in rows:
         try:
             order_id = line.get('ID')
             order = Order.objects.get(id=order_id)        
@@ -1,131 +1,177 @@
+from typing import Callable, Dict, Iterable, List
+
 import analytics
 from celery import shared_task
 from django.apps import apps
 from django.conf import settings
+from django.utils import timezone
 
 from apps.core.tasks import HttpErrorRetryTask
+from apps.customers.libs import SubscriptionProfileBuilder, SubscriptionProfileDTO
 from libs import locking
 
 
-@shared_task(base=HttpErrorRetryTask)
-def sync_subscription_cancelled_event(subscription_id: str):
+def _get_address_properties(address: 'Location') -> Dict:
+    return {
+        'shipping_city': address.city if address and address.city else '',
+        'shipping_state': address.state if address and address.state else '',
+        'zip_code': address.zipcode if address and address.zipcode else '',
+    }
+
+
+def _get_profile_properties(profile: SubscriptionProfileDTO, active_subscription: bool) -> Dict:
+    customer = profile.customer
+    subscription = profile.subscription
+    return {
+        'customer_id': str(customer.id),
+        'first_name': customer.first_name,
+        'last_name': customer.last_name,
+        'email': customer.email,
+        'active_subscription': active_subscription,
+        'child_name': profile.child.first_name,
+        'child_birthdate': profile.child.birth_date,
+        'allergies': profile.allergies,
+        'pack_size': subscription.number_of_servings,
+        'order_count': profile.number_of_orders,
+        'total_spent': f'{profile.amount_spent}',
+        'order_frequency': subscription.frequency,
+        **_get_address_properties(profile.address),
+        'subscription_product': profile.subscription_products,
+        'activated_subscription_at': subscription.activated_at,
+    }
+
+
+def enqueue_subscription_cancelled_event(profile: SubscriptionProfileDTO):
+    customer = profile.customer
+    subscription = profile.subscription
+    analytics.identify(
+        str(customer.id),
+        {
+            'email': customer.email,
+            'active_subscription': False,
+            'tags': ['Unsubscribed Customer'],
+            'subscription_product': profile.subscription_products,
+            'cancelled_subscription_at': subscription.deactivated_at,
+        }
+    )
+    analytics.track(
+        str(customer.id),
+        'Cancelled Subscription',
+        properties={
+            **_get_profile_properties(profile, active_subscription=True),
+            'cancelled_subscription_at': subscription.deactivated_at,
+        }
+    )
+
+
+def enqueue_subscription_activated_event(profile: SubscriptionProfileDTO):
+    customer = profile.customer
+    subscription = profile.subscription
+    analytics.identify(
+        str(customer.id),
+        {
+            'email': customer.email,
+            'active_subscription': True,
+            'tags': ['Active Subscriber'],
+            'subscription_product': profile.subscription_products,
+            'activated_subscription_at': subscription.activated_at,
+        }
+    )
+    analytics.track(
+        str(customer.id),
+        'Started Subscription',
+        properties=_get_profile_properties(profile, active_subscription=True),
+    )
+
+
+def enqueue_klaviyo_profile_fields_event(profile: SubscriptionProfileDTO):
+    customer = profile.customer
+    subscription = profile.subscription
+    analytics.identify(
+        str(customer.id),
+        {
+            'email': customer.email,
+            'active_subscription': subscription.is_active,
+            'tags': ['Active Subscriber'] if subscription.is_active else ['Unsubscribed Customer'],
+            'subscription_product': profile.subscription_products,
+            'activated_subscription_at': subscription.activated_at,
+            'cancelled_subscription_at': subscription.deactivated_at,
+        }
+    )
+    analytics.track(
+        str(customer.id),
+        'Updating Profile',
+        properties={
+            **_get_profile_properties(profile, active_subscription=subscription.is_active),
+            'cancelled_subscription_at': subscription.deactivated_at,
+        }
+    )
+
+
+def sync_subscription_events_to_segment(
+    subscriptions: Iterable['CustomerSubscription'],
+    enqueue_event: Callable[[SubscriptionProfileDTO], None],
+) -> List[Exception]:
+    """
+    Builds the profiles of a page of subscriptions in a few queries, queues one event per subscription, flushes the
+    Segment queue once and flags every subscription whose event was queued as synced with a single update.
+
+    Returns the errors raised while queueing events, so callers can decide how to report them.
+    """
     CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
+    if settings.IS_TESTING or settings.DEBUG:
+        return []
 
+    errors = []
+    synced_subscription_ids = []
+    for profile in SubscriptionProfileBuilder(subscriptions).build():
+        try:
+            enqueue_event(profile)
+        except Exception as e:
+            errors.append(e)
+        else:
+            synced_subscription_ids.append(profile.subscription.id)
+
+    if synced_subscription_ids:
+        analytics.flush()
+        CustomerSubscription.objects.filter(id__in=synced_subscription_ids).update(
+            synced_to_klaviyo=True,
+            updated_profile_fields_to_klaviyo=True,
+            modified_at=timezone.now(),
+        )
+    return errors
+
+
+def _sync_subscription_event(subscription_id: str, enqueue_event: Callable[[SubscriptionProfileDTO], None]):
+    CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
+    subscription = CustomerSubscription.objects.select_related(
+        'customer',
+        'customer_child',
+    ).get(id=subscription_id)
+    errors = sync_subscription_events_to_segment([subscription], enqueue_event)
+    if errors:
+        raise errors[0]
+
+
+@shared_task(base=HttpErrorRetryTask)
+def sync_subscription_cancelled_event(subscription_id: str):
     with locking.acquire_shared_lock_context(
         f'sync-subscription-cancelled-event-{subscription_id}',
         'celery',
     ):
-        subscription = CustomerSubscription.objects.get(id=subscription_id)
-        customer = subscription.customer
-        cart = subscription.customer_child.cart
-        if not settings.IS_TESTING and not settings.DEBUG:
-            child = subscription.customer_child
-            line_items_list = list(cart.line_items.filter().order_by(
-                'product__title'
-            ).values_list(
-                'product__title', flat=True
-            ))
-            analytics.identify(
-                str(customer.id),
-                {
-                    'email': customer.email,
-                    'active_subscription': False,
-                    'tags': ['Unsubscribed Customer'],
-                    'subscription_product': line_items_list,
-                    'cancelled_subscription_at': subscription.deactivated_at,
-                }
-            )
-            customer_address = customer.addresses.first()
-            analytics.track(
-                str(customer.id),
-                'Cancelled Subscription',
-                properties={
-                    'customer_id': str(customer.id),
-                    'first_name': customer.first_name,
-                    'last_name': customer.last_name,
-                    'email': customer.email,
-                    'active_subscription': True,
-                    'child_name': child.first_name,
-                    'child_birthdate': child.birth_date,
-                    'allergies': list(child.allergies.filter().values_list('name', flat=True)),
-                    'pack_size': subscription.number_of_servings,
-                    'order_count': customer.number_of_orders,
-                    'total_spent': f'{customer.amount_spent}',
-                    'order_frequency': subscription.frequency,
-                    'shipping_city': customer_address.city if customer_address and customer_address.city else '',
-                    'shipping_state': customer_address.state if customer_address and customer_address.state else '',
-                    'zip_code': customer_address.zipcode if customer_address and customer_address.zipcode else '',
-                    'subscription_product': line_items_list,
-                    'activated_subscription_at': subscription.activated_at,
-                    'cancelled_subscription_at': subscription.deactivated_at,
-                }
-            )
-
-            analytics.flush()
-            subscription.synced_to_klaviyo = True
-            subscription.updated_profile_fields_to_klaviyo = True
-            subscription.save()
-            return 'Will sync to segment in batches of 100, for scalability'
+        _sync_subscription_event(subscription_id, enqueue_subscription_cancelled_event)
+        return 'Will sync to segment in batches of 100, for scalability'
 
 
 @shared_task(base=HttpErrorRetryTask)
 def sync_subscription_activated_event(subscription_id: str):
-    CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
-
     with locking.acquire_shared_lock_context(
         f'sync-subscription-activated-event-{subscription_id}',
         'celery',
         timeout=60
     ):
-        subscription = CustomerSubscription.objects.get(id=subscription_id)
-        customer = subscription.customer
-        if not settings.IS_TESTING and not settings.DEBUG:
-            cart = subscription.customer_child.cart
-            child = subscription.customer_child
-            line_items_list = list(cart.line_items.filter().order_by(
-                'product__title'
-            ).values_list(
-                'product__title', flat=True
-            ))
-            analytics.identify(
-                str(customer.id),
-                {
-                    'email': customer.email,
-                    'active_subscription': True,
-                    'tags': ['Active Subscriber'],
-                    'subscription_product': line_items_list,
-                    'activated_subscription_at': subscription.activated_at,
-                }
-            )
-            customer_address = customer.addresses.first()
-            analytics.track(
-                str(customer.id),
-                'Started Subscription',
-                properties={
-                    'customer_id': str(customer.id),
-                    'first_name': customer.first_name,
-                    'last_name': customer.last_name,
-                    'email': customer.email,
-                    'active_subscription': True,
-                    'child_name': child.first_name,
-                    'child_birthdate': child.birth_date,
-                    'allergies': list(child.allergies.filter().values_list('name', flat=True)),
-                    'pack_size': subscription.number_of_servings,
-                    'order_count': customer.number_of_orders,
-                    'total_spent': f'{customer.amount_spent}',
-                    'order_frequency': subscription.frequency,
-                    'shipping_city': customer_address.city if customer_address and customer_address.city else '',
-                    'shipping_state': customer_address.state if customer_address and customer_address.state else '',
-                    'zip_code': customer_address.zipcode if customer_address and customer_address.zipcode else '',
-                    'subscription_product': line_items_list,
-                    'activated_subscription_at': subscription.activated_at,
-                }
-            )
-            analytics.flush()
-            subscription.synced_to_klaviyo = True
-            subscription.updated_profile_fields_to_klaviyo = True
-            subscription.save()
-            return 'Will sync to segment in batches of 100, for scalability'
+        _sync_subscription_event(subscription_id, enqueue_subscription_activated_event)
+        return 'Will sync to segment in batches of 100, for scalability'
 
 
 @shared_task(base=HttpErrorRetryTask)
@@ -180,62 +226,10 @@ def sync_subscription_created_event(subscription_id:  str):
 
 @shared_task(base=HttpErrorRetryTask)
 def sync_klaviyo_profile_fields_event(subscription_id: str):
-    CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
-
     with locking.acquire_shared_lock_context(
         f'sync-klaviyo-profile-fields-event-{subscription_id}',
         'celery',
         timeout=60
     ):
-        subscription = CustomerSubscription.objects.get(id=subscription_id)
-        customer = subscription.customer
-        if not settings.IS_TESTING and not settings.DEBUG:
-            cart = subscription.customer_child.cart
-            line_items_list = list(cart.line_items.filter().order_by(
-                'product__title'
-            ).values_list(
-                'product__title', flat=True
-            ))
-            child = subscription.customer_child
-            analytics.identify(
-                str(customer.id),
-                {
-                    'email': customer.email,
-                    'active_subscription': subscription.is_active,
-                    'tags': ['Active Subscriber'] if subscription.is_active else ['Unsubscribed Customer'],
-                    'subscription_product': line_items_list,
-                    'activated_subscription_at': subscription.activated_at,
-                    'cancelled_subscription_at': subscription.deactivated_at,
-                }
-            )
-            customer_address = customer.addresses.first()
-
-            analytics.track(
-                str(customer.id),
-                'Updating Profile',
-                properties={
-                    'customer_id': str(customer.id),
-                    'first_name': customer.first_name,
-                    'last_name': customer.last_name,
-                    'email': customer.email,
-                    'active_subscription': subscription.is_active,
-                    'child_name': child.first_name,
-                    'child_birthdate': child.birth_date,
-                    'allergies': list(child.allergies.filter().values_list('name', flat=True)),
-                    'pack_size': subscription.number_of_servings,
-                    'order_count': customer.number_of_orders,
-                    'total_spent': f'{customer.amount_spent}',
-                    'order_frequency': subscription.frequency,
-                    'shipping_city': customer_address.city if customer_address and customer_address.city else '',
-                    'shipping_state': customer_address.state if customer_address and customer_address.state else '',
-                    'zip_code': customer_address.zipcode if customer_address and customer_address.zipcode else '',
-                    'subscription_product': line_items_list,
-                    'activated_subscription_at': subscription.activated_at,
-                    'cancelled_subscription_at': subscription.deactivated_at,
-                }
-            )
-            analytics.flush()
-            subscription.synced_to_klaviyo = True
-            subscription.updated_profile_fields_to_klaviyo = True
-            subscription.save()
-            return 'Will sync to segment in batches of 100, for scalability'
+        _sync_subscription_event(subscription_id, enqueue_klaviyo_profile_fields_event)
+        return 'Will sync to segment in batches of 100, for scalability'
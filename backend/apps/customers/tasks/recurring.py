@@ -12,11 +12,13 @@ from django.utils import timezone
 from apps.core.exceptions import APIRateLimitError
 from apps.core.tasks import HttpErrorRetryTask
 from libs import celery_helpers
+from libs.api_request import cache_api_response, get_cached_api_response
 from libs.email import _scrub_email_address
 from apps.customers.tasks.notification import (
-    sync_subscription_activated_event,
-    sync_subscription_cancelled_event,
-    sync_klaviyo_profile_fields_event,
+    enqueue_klaviyo_profile_fields_event,
+    enqueue_subscription_activated_event,
+    enqueue_subscription_cancelled_event,
+    sync_subscription_events_to_segment,
 )
 
 
@@ -82,16 +84,12 @@ def send_upcoming_charge_notification_to_active_subscribers():
 
 
 def _get_subscriptions(client, customer):
-    APIRequestLog = apps.get_model('core', 'APIRequestLog')
     created = True
-    subscription_log = APIRequestLog.objects.filter(
-        object_type='ReChargeCustomerSubscription',
-        object_id=customer.recharge_customer_id,
-        response_status_code=200,
-    ).first()
-    if subscription_log:
+    cache_key = f'recharge-subscriptions-{customer.recharge_customer_id}'
+    cached_response = get_cached_api_response(cache_key)
+    if cached_response:
         created = False
-        subscriptions = subscription_log.response_json_payload['subscriptions']
+        subscriptions = cached_response['subscriptions']
     else:
         subscriptions_request = client.get_subscriptions_with_recharge_customer_id(
             recharge_customer_id=customer.recharge_customer_id,
@@ -100,6 +98,7 @@ def _get_subscriptions(client, customer):
         if subscriptions_request.response.status_code == 429:
             raise APIRateLimitError
 
+        cache_api_response(cache_key, subscriptions_request.response)
         subscriptions = subscriptions_request.response.parsed_body['subscriptions']
     return subscriptions, created
 
@@ -116,16 +115,11 @@ def _cancel_subscription_request(client, recharge_subscription_id):
 
 
 def _get_queued_orders(client, customer):
-    APIRequestLog = apps.get_model('core', 'APIRequestLog')
-
-    request_log = APIRequestLog.objects.filter(
-        object_type='ReChargeCustomerQueuedOrder',
-        object_id=customer.recharge_customer_id,
-        response_status_code=200,
-    ).first()
+    cache_key = f'recharge-queued-orders-{customer.recharge_customer_id}'
+    cached_response = get_cached_api_response(cache_key)
     created = False
-    if request_log:
-        queued_orders = request_log.response_json_payload['orders']
+    if cached_response:
+        queued_orders = cached_response['orders']
     else:
         request = client.get_queued_orders(
             recharge_customer_id=customer.recharge_customer_id,
@@ -133,6 +127,7 @@ def _get_queued_orders(client, customer):
         )
         if request.response.status_code == 429:
             raise APIRateLimitError
+        cache_api_response(cache_key, request.response)
         created = True
         queued_orders = request.response.parsed_body['orders']
     return queued_orders, created
@@ -148,20 +143,25 @@ def _delete_queued_order_request(client, recharge_order_id):
     return response.json()
 
 
+SEGMENT_SYNC_CHUNK_SIZE = 200
+
+
+def _get_subscriptions_to_sync_to_segment(**filters):
+    CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
+    return CustomerSubscription.objects.filter(**filters).select_related('customer', 'customer_child')
+
+
 @celery_helpers.prevent_multiple
 @shared_task(base=HttpErrorRetryTask, soft_time_limit=60 * 60 * 1000)
 def sync_active_subscriptions_to_segment():
-    CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
-    errors = []
-    active_subscriptions_that_have_not_been_synced_to_klaviyo = CustomerSubscription.objects.filter(
+    active_subscriptions_that_have_not_been_synced_to_klaviyo = _get_subscriptions_to_sync_to_segment(
         is_active=True,
         synced_to_klaviyo=False,
-    ).order_by('-activated_at')[:50]
-    for subscription in active_subscriptions_that_have_not_been_synced_to_klaviyo:
-        try:
-            sync_subscription_activated_event(subscription.id)
-        except Exception as e:
-            errors.append(e)
+    ).order_by('-activated_at')[:SEGMENT_SYNC_CHUNK_SIZE]
+    errors = sync_subscription_events_to_segment(
+        active_subscriptions_that_have_not_been_synced_to_klaviyo,
+        enqueue_subscription_activated_event,
+    )
 
     if errors:
         raise Exception(errors)
@@ -172,18 +172,14 @@ def sync_active_subscriptions_to_segment():
 @celery_helpers.prevent_multiple
 @shared_task(base=HttpErrorRetryTask, soft_time_limit=60 * 60 * 1000)
 def sync_inactive_subscriptions_to_segment():
-    CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
-    errors = []
-
-    inactive_subscriptions_that_have_not_been_synced_to_klaviyo = CustomerSubscription.objects.filter(
+    inactive_subscriptions_that_have_not_been_synced_to_klaviyo = _get_subscriptions_to_sync_to_segment(
         is_active=False,
         synced_to_klaviyo=False,
-    ).order_by('-deactivated_at')[:50]
-    for subscription in inactive_subscriptions_that_have_not_been_synced_to_klaviyo:
-        try:
-            sync_subscription_cancelled_event(subscription.id)
-        except Exception as e:
-            errors.append(e)
+    ).order_by('-deactivated_at')[:SEGMENT_SYNC_CHUNK_SIZE]
+    errors = sync_subscription_events_to_segment(
+        inactive_subscriptions_that_have_not_been_synced_to_klaviyo,
+        enqueue_subscription_cancelled_event,
+    )
 
     if errors:
         raise Exception(errors)
@@ -194,17 +190,14 @@ def sync_inactive_subscriptions_to_segment():
 @celery_helpers.prevent_multiple
 @shared_task(base=HttpErrorRetryTask, soft_time_limit=60 * 60 * 1000)
 def update_active_subscriber_profiles_to_segment():
-    CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
-    errors = []
-    active_subscriptions_whose_profile_have_not_been_updated_in_klaviyo = CustomerSubscription.objects.filter(
+    active_subscriptions_whose_profile_have_not_been_updated_in_klaviyo = _get_subscriptions_to_sync_to_segment(
         is_active=True,
         updated_profile_fields_to_klaviyo=False,
-    ).order_by('-activated_at')[:50]
-    for subscription in active_subscriptions_whose_profile_have_not_been_updated_in_klaviyo:
-        try:
-            sync_klaviyo_profile_fields_event(subscription.id)
-        except Exception as e:
-            errors.append(e)
+    ).order_by('-activated_at')[:SEGMENT_SYNC_CHUNK_SIZE]
+    errors = sync_subscription_events_to_segment(
+        active_subscriptions_whose_profile_have_not_been_updated_in_klaviyo,
+        enqueue_klaviyo_profile_fields_event,
+    )
 
     if errors:
         raise Exception(errors)
@@ -215,17 +208,14 @@ def update_active_subscriber_profiles_to_segment():
 @celery_helpers.prevent_multiple
 @shared_task(base=HttpErrorRetryTask, soft_time_limit=60 * 60 * 1000)
 def update_cancelled_subscriber_profiles_to_segment():
-    CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
-    errors = []
-    cancelled_subscriptions_whose_profile_have_not_been_updated_in_klaviyo = CustomerSubscription.objects.filter(
+    cancelled_subscriptions_whose_profile_have_not_been_updated_in_klaviyo = _get_subscriptions_to_sync_to_segment(
         is_active=False,
         updated_profile_fields_to_klaviyo=False,
-    ).order_by('-activated_at')[:50]
-    for subscription in cancelled_subscriptions_whose_profile_have_not_been_updated_in_klaviyo:
-        try:
-            sync_klaviyo_profile_fields_event(subscription.id)
-        except Exception as e:
-            errors.append(e)
+    ).order_by('-activated_at')[:SEGMENT_SYNC_CHUNK_SIZE]
+    errors = sync_subscription_events_to_segment(
+        cancelled_subscriptions_whose_profile_have_not_been_updated_in_klaviyo,
+        enqueue_klaviyo_profile_fields_event,
+    )
 
     if errors:
         raise Exception(errors)
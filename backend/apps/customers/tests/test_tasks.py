@@ -1,12 +1,25 @@
 from datetime import timedelta
+from decimal import Decimal
 from unittest import mock
 from django.utils import timezone
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
+from apps.addresses.tests.factories.location import LocationFactory
+from apps.carts.models import Cart
+from apps.carts.tests.factories import CartFactory, CartLineItemFactory
+from apps.core.models import OutboxEvent
+from apps.core.outbox import OutboxTopicEnum
+from apps.customers.libs import SubscriptionProfileBuilder
+from apps.customers.models import Customer, CustomerSubscription
 from apps.customers.tasks import (
     send_upcoming_charge_notification_to_active_subscribers
 )
-from apps.customers.tests.factories import CustomerSubscriptionFactory
+from apps.customers.tasks.imports import create_customers_from_rows, create_subscriptions_from_rows
+from apps.customers.tasks.recurring import sync_active_subscriptions_to_segment
+from apps.customers.tests.factories import CustomerChildFactory, CustomerFactory, CustomerSubscriptionFactory
+from apps.orders.tests.factories import OrderFactory
+from apps.products.tests.factories import ProductFactory, ProductVariantFactory
+from apps.recipes.tests.factories import IngredientFactory
 
 
 # class CustomerTaskTestSuite(TestCase):
@@ -16,3 +29,111 @@ from apps.customers.tests.factories import CustomerSubscriptionFactory
 #             send_upcoming_charge_notification_to_active_subscribers()
 #
 #         self.assertTrue(mocked.called)
+
+
+class SegmentSubscriptionSyncTestSuite(TestCase):
+    def setUp(self):
+        self.subscription = CustomerSubscriptionFactory(is_active=True, activated_at=timezone.now())
+        customer = self.subscription.customer
+        child = self.subscription.customer_child
+        child.allergies.add(IngredientFactory(name='Peanut'), IngredientFactory(name='Egg'))
+        cart = CartFactory(customer=customer, customer_child=child)
+        CartLineItemFactory(cart=cart, product=ProductFactory(title='Sweet Potato'))
+        CartLineItemFactory(cart=cart, product=ProductFactory(title='Apple Oats'))
+        OrderFactory(customer=customer, payment_status='paid', charged_amount=Decimal('20.50'))
+        OrderFactory(customer=customer, payment_status='refunded', charged_amount=Decimal('10'))
+        OrderFactory(customer=customer, payment_status='failed', charged_amount=Decimal('99'))
+        self.address = LocationFactory(customer=customer, city='Miami')
+        self.other_subscription = CustomerSubscriptionFactory(is_active=True, activated_at=timezone.now())
+
+    def test_builds_profiles_for_a_page_of_subscriptions(self):
+        with self.assertNumQueries(4):
+            profiles = SubscriptionProfileBuilder([self.subscription, self.other_subscription]).build()
+
+        profile, other_profile = profiles
+        self.assertEqual(profile.number_of_orders, 2)
+        self.assertEqual(profile.amount_spent, Decimal('20.50'))
+        self.assertEqual(profile.allergies, ['Egg', 'Peanut'])
+        self.assertEqual(profile.subscription_products, ['Apple Oats', 'Sweet Potato'])
+        self.assertEqual(profile.address, self.address)
+        self.assertEqual(other_profile.number_of_orders, 0)
+        self.assertEqual(other_profile.amount_spent, Decimal('0'))
+        self.assertEqual(other_profile.allergies, [])
+        self.assertIsNone(other_profile.address)
+
+    @override_settings(IS_TESTING=False, DEBUG=False)
+    def test_will_flush_once_and_flag_the_whole_page_as_synced(self):
+        with mock.patch('apps.customers.tasks.notification.analytics') as mocked_analytics:
+            sync_active_subscriptions_to_segment()
+
+        self.assertEqual(mocked_analytics.identify.call_count, 2)
+        self.assertEqual(mocked_analytics.track.call_count, 2)
+        mocked_analytics.flush.assert_called_once()
+        self.subscription.refresh_from_db()
+        self.other_subscription.refresh_from_db()
+        self.assertTrue(self.subscription.synced_to_klaviyo)
+        self.assertTrue(self.subscription.updated_profile_fields_to_klaviyo)
+        self.assertTrue(self.other_subscription.synced_to_klaviyo)
+
+
+class BulkCustomerImportTestSuite(TestCase):
+    def _build_customer_row(self, email, **kwargs):
+        return {
+            'email': email,
+            'first_name': 'Jane',
+            'last_name': 'Doe',
+            'customer_id': f'recharge-{email}',
+            'external_customer_id': f'shopify-{email}',
+            'number_active_subscriptions': '1',
+            **kwargs,
+        }
+
+    def test_will_create_customers_with_a_child_and_a_cart(self):
+        with mock.patch('apps.customers.tasks.imports.create_loyalty_customer'):
+            create_customers_from_rows([
+                self._build_customer_row('new@example.com'),
+                self._build_customer_row('other@example.com', number_active_subscriptions='0'),
+            ])
+
+        customer = Customer.objects.get(email='new@example.com')
+        self.assertEqual(customer.status, 'subscriber')
+        self.assertEqual(customer.external_customer_id, 'shopify-new@example.com')
+        self.assertEqual(Customer.objects.get(email='other@example.com').status, 'deactivated')
+        child = customer.children.get()
+        self.assertEqual(child.first_name, "Jane's Little One")
+        self.assertTrue(Cart.objects.filter(customer=customer, customer_child=child).exists())
+
+    def test_will_match_existing_customers_case_insensitively(self):
+        customer = CustomerFactory(email='existing@example.com', external_customer_id=None)
+        CustomerChildFactory(parent=customer)
+
+        with mock.patch('apps.customers.tasks.imports.update_to_loyalty_client'):
+            create_customers_from_rows([self._build_customer_row('EXISTING@example.com')])
+
+        customer.refresh_from_db()
+        self.assertEqual(Customer.objects.filter(email__iexact='existing@example.com').count(), 1)
+        self.assertEqual(customer.external_customer_id, 'shopify-EXISTING@example.com')
+        self.assertEqual(customer.children.count(), 1)
+
+    def test_will_create_one_subscription_per_child(self):
+        customer = CustomerFactory(email='subscriber@example.com')
+        variant = ProductVariantFactory()
+        row = {
+            'customer_email': 'Subscriber@example.com',
+            'cancelled_at': '',
+            'charge_interval_frequency': '2',
+            'recurring_price': '5.49',
+            'external_variant_id': variant.external_variant_id,
+            'quantity': '3',
+        }
+
+        create_subscriptions_from_rows([row, {**row, 'quantity': '5'}])
+
+        subscription = CustomerSubscription.objects.get(customer=customer)
+        self.assertTrue(subscription.is_active)
+        self.assertEqual(subscription.number_of_servings, 12)
+        self.assertEqual(subscription.customer_child.cart.line_items.get().quantity, 3)
+        self.assertTrue(OutboxEvent.objects.filter(
+            topic=OutboxTopicEnum.subscription_created,
+            aggregate_id=str(subscription.id),
+        ).exists())
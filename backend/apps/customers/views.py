@@ -13,12 +13,6 @@ from django.urls import reverse
 
 from apps.core.views import CoreUploadCSVView
 from apps.customers.forms import CustomerLoginForm, PasswordResetForm
-from apps.customers.tasks import (
-    create_customers_from_file,
-    create_subscriptions_from_file,
-    update_next_order_charge_dates_from_file,
-)
-from apps.customers.tasks.imports import send_confirmation_email_from_file
 
 
 class LoginView(auth_views.LoginView):
@@ -57,14 +51,14 @@ class SyncUnsyncedOrdersToShopify(View):
 @method_decorator(staff_member_required, name='dispatch')
 class UpdateSubscriptionNextOrderChargeDateCSVView(CoreUploadCSVView):
     template_name = 'uploads/next-order-subscription-dates.html'
-    async_function = update_next_order_charge_dates_from_file
+    import_handler = 'apps.customers.tasks.imports.update_next_order_charge_dates_from_rows'
     view_name = 'update-next-order-charge-dates-csv'
 
 
 @method_decorator(staff_member_required, name='dispatch')
 class SendCustomerConfirmationEmails(CoreUploadCSVView):
     template_name = 'uploads/send-confirmation-email.html'
-    async_function = send_confirmation_email_from_file
+    import_handler = 'apps.customers.tasks.imports.send_confirmation_email_from_rows'
     view_name = 'send-confirmation-email-from-csv'
     
     
\ No newline at end of file
@@ -1,3 +1,5 @@
+from typing import List
+
 from django.apps import apps
 
 from libs.helpers import ModelChoiceEnum
@@ -86,22 +88,15 @@ class DiscountBuilder:
         )
         self.customer_discounts.append(customer_discount)
 
-    def build(self):
-        self._remove_existing_discounts()
+    def _get_eligible_children(self) -> List['CustomerChild']:
         if not self.discount or len(self.carts) == 0:
             raise CannotCreateDiscountForCustomerError(
                 'Cannot create a discount for customer without a discount code and cart'
             )
-        if self.discount.discount_type == 'fixed amount':
-            if self._is_customer_eligible(self.carts[0]):
-                first_child = self.carts[0].customer_child
-                self._create_discount(first_child)
-        else:
-            for cart in self.carts:
-                if self._is_customer_eligible(cart):
-                    child = cart.customer_child
-                    self._create_discount(child)
+        carts = self.carts[:1] if self.discount.discount_type == 'fixed amount' else self.carts
+        return [cart.customer_child for cart in carts if self._is_customer_eligible(cart)]
 
+    def _validate_customer_discounts(self):
         if not self.customer_discounts:
             raise CannotCreateDiscountForCustomerError(
                 'No items in your subscription(s) are eligible for this discount'
@@ -115,4 +110,22 @@ class DiscountBuilder:
                     f'customer: {self.customer}'
                 )
 
+    def build(self):
+        self._remove_existing_discounts()
+        for child in self._get_eligible_children():
+            self._create_discount(child)
+        self._validate_customer_discounts()
+        return self
+
+    def preview(self):
+        """
+        Same checks as `build` without writing anything: `customer_discounts` are the unsaved discounts `build` would
+        assign, for read-only pricing like order summaries.
+        """
+        CustomerDiscount = apps.get_model('discounts', 'CustomerDiscount')
+        self.customer_discounts = [
+            CustomerDiscount(customer_id=child.parent_id, customer_child=child, discount=self.discount)
+            for child in self._get_eligible_children()
+        ]
+        self._validate_customer_discounts()
         return self
@@ -1,12 +1,13 @@
-import csv
 from decimal import Decimal
 from time import sleep
+from typing import Dict, List
 
 from celery import shared_task
 from django.apps import apps
 from django.conf import settings
 from django.utils import timezone
 
+from apps.core.imports import import_rows
 from apps.core.tasks import HttpErrorRetryTask
 from celery_app import app
 from libs import celery_helpers, locking
@@ -60,11 +61,8 @@ def import_discount_code_from_line(data):
             _discount.delete()
 
 
-@app.task
-def import_discount_codes_from_file(decoded_file):
-    reader = csv.DictReader(decoded_file)
-    for line in reader:
-        import_discount_code_from_line.delay(line)
+def import_discount_codes_from_rows(rows: List[Dict]) -> List[Dict]:
+    return import_rows(rows, import_discount_code_from_line)
 
 
 def _create_new_loyalty_customer(customer):
@@ -91,7 +89,7 @@ def _fetch_loyalty_customer(customer):
     return loyalty_customer
 
 
-@shared_task(base=HttpErrorRetryTask, rate_limit='2/s')
+@shared_task(base=HttpErrorRetryTask)
 def create_customer_referral_coupon_from_loyalty_client(customer_id):
     Customer = apps.get_model('customers', 'Customer')
     customer = Customer.objects.get(id=customer_id)
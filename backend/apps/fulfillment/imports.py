@@ -1,13 +1,22 @@
-import csv
+from typing import Dict, Iterable
 
 from django.apps import apps
-from celery_app import app
+from django.db import transaction
+from simple_history.utils import bulk_create_with_history
 
+from apps.fulfillment.libs import ZipcodeLookup
 
-def upload_fulfillment_center_zipcodes_from_csv(reader):
+
+def upload_fulfillment_center_zipcodes_from_csv(rows: Iterable[Dict]):
+    """
+    Assigns the zipcodes of a chunk of rows to their fulfillment centers with a handful of bulk queries, the same
+    zipcode can be served by several fulfillment centers.
+    """
     FulfillmentCenter = apps.get_model('fulfillment', 'FulfillmentCenter')
-    FulfillmentCenterZipCode = apps.get_model('fulfillment', 'FulfillmentCenterZipCode')
-    for line in reader:
+    FulfillmentCenterZipcode = apps.get_model('fulfillment', 'FulfillmentCenterZipcode')
+
+    locations_by_zipcode = {}
+    for line in rows:
         location = line.get('Ship From')
         zipcode = line.get('Zip Code')
 
@@ -15,25 +24,39 @@ def upload_fulfillment_center_zipcodes_from_csv(reader):
             print(f'{zipcode} is not supported')
             continue
 
-        fulfillment_center = FulfillmentCenter.objects.get_or_create(
-            location=location.lower()
-        )[0]
-        fulfillment_center_zipcode = FulfillmentCenterZipCode.objects.get_or_create(
-            zipcode=zipcode
-        )[0]
-        fulfillment_center_zipcode.warehouses.add(fulfillment_center)
+        locations_by_zipcode.setdefault(zipcode, set()).add(location.lower())
+
+    if not locations_by_zipcode:
+        return "Zipcodes successfully uploaded"
+
+    # there are only a few fulfillment centers, they are created one by one to keep their save side effects
+    fulfillment_centers = {
+        location: FulfillmentCenter.objects.get_or_create(location=location)[0]
+        for location in set().union(*locations_by_zipcode.values())
+    }
+
+    zipcodes = {
+        zipcode.zipcode: zipcode
+        for zipcode in FulfillmentCenterZipcode.objects.filter(zipcode__in=locations_by_zipcode)
+    }
+    new_zipcodes = [
+        FulfillmentCenterZipcode(zipcode=zipcode) for zipcode in locations_by_zipcode if zipcode not in zipcodes
+    ]
+    for zipcode in bulk_create_with_history(new_zipcodes, FulfillmentCenterZipcode):
+        zipcodes[zipcode.zipcode] = zipcode
+
+    FulfillmentCenterZipcodeRelation = FulfillmentCenter.zipcodes.through
+    FulfillmentCenterZipcodeRelation.objects.bulk_create(
+        [
+            FulfillmentCenterZipcodeRelation(
+                fulfillmentcenter_id=fulfillment_centers[location].id,
+                fulfillmentcenterzipcode_id=zipcodes[zipcode].id,
+            )
+            for zipcode, locations in locations_by_zipcode.items()
+            for location in locations
+        ],
+        ignore_conflicts=True,
+    )
+    transaction.on_commit(ZipcodeLookup.invalidate)
 
     return "Zipcodes successfully uploaded"
-
-@app.task
-def import_fulfillment_center_zipcodes_from_csv(decoded_file):
-    reader = csv.DictReader(decoded_file)
-
-    upload_fulfillment_center_zipcodes_from_csv(reader)
-
-
-
-
-
-
-
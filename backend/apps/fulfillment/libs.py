@@ -0,0 +1,64 @@
+import threading
+from typing import Dict, FrozenSet, Tuple, Union
+from uuid import uuid4
+
+from django.apps import apps
+from django.core.cache import cache
+
+
+class ZipcodeLookup:
+    """
+    In-process table of the fulfillment centers serving each zipcode, so recipes can be filtered by zipcode without
+    querying the database. Zipcodes map to a bitmask over the (few) fulfillment center locations, and each bitmask
+    to its `frozenset` of locations.
+
+    The table is loaded with a single query and kept per table version, which is moved forward (see `invalidate`)
+    when zipcodes are uploaded or a `FulfillmentCenter` or `FulfillmentCenterZipcode` is saved.
+    """
+    VERSION_CACHE_KEY = 'zipcode-lookup-version'
+
+    _lock = threading.Lock()
+    _version = None
+    # (bitmask by zipcode, locations by bitmask), swapped as a whole so readers never see half of a new table
+    _table: Tuple[Dict[str, int], Dict[int, FrozenSet[str]]] = ({}, {})
+
+    @classmethod
+    def invalidate(cls):
+        cache.set(cls.VERSION_CACHE_KEY, uuid4().hex, None)
+
+    @staticmethod
+    def _build() -> Tuple[Dict[str, int], Dict[int, FrozenSet[str]]]:
+        FulfillmentCenterZipcode = apps.get_model('fulfillment', 'FulfillmentCenterZipcode')
+        # zipcodes no fulfillment center serves anymore are kept, with an empty bitmask
+        rows = list(FulfillmentCenterZipcode.objects.values_list('zipcode', 'warehouses__location'))
+
+        bits = {
+            location: 1 << index
+            for index, location in enumerate(sorted({location for _, location in rows if location is not None}))
+        }
+        masks = {}
+        for zipcode, location in rows:
+            masks[zipcode] = masks.get(zipcode, 0) | bits.get(location, 0)
+        locations = {
+            mask: frozenset(location for location, bit in bits.items() if mask & bit) for mask in set(masks.values())
+        }
+        return masks, locations
+
+    @classmethod
+    def _load(cls):
+        version = cache.get(cls.VERSION_CACHE_KEY, '0')
+        if version != cls._version:
+            with cls._lock:
+                if version != cls._version:
+                    cls._table = cls._build()
+                    cls._version = version
+
+    @classmethod
+    def get_locations(cls, zipcode: str) -> Union[None, FrozenSet[str]]:
+        """
+        Locations of the fulfillment centers serving `zipcode`, `None` for zipcodes that were never uploaded.
+        """
+        cls._load()
+        masks, locations = cls._table
+        mask = masks.get(zipcode)
+        return locations[mask] if mask is not None else None
@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from localflavor.us.models import USZipCodeField
 from apps.core.models import CoreModel
+from apps.fulfillment.libs import ZipcodeLookup
 
 
 class FulfillmentCenterZipcode(CoreModel):
@@ -9,6 +10,10 @@ class FulfillmentCenterZipcode(CoreModel):
     def __str__(self):
         return f'Fulfillment center zipcode: {self.zipcode}'
 
+    def save(self, *args, **kwargs):
+        transaction.on_commit(ZipcodeLookup.invalidate)
+        super().save(*args, **kwargs)
+
 
 class FulfillmentCenter(CoreModel):
     location = models.CharField(max_length=255, unique=True)
@@ -20,4 +25,14 @@ class FulfillmentCenter(CoreModel):
     def __str__(self):
         return f'Fulfillment center: {self.location}'
 
+    @staticmethod
+    def _invalidate_recipe_catalog():
+        from apps.products.libs import RecipeCatalog
+        RecipeCatalog.invalidate()
+
+    def save(self, *args, **kwargs):
+        transaction.on_commit(self._invalidate_recipe_catalog)
+        transaction.on_commit(ZipcodeLookup.invalidate)
+        super().save(*args, **kwargs)
+
 
@@ -0,0 +1,34 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.fulfillment.libs import ZipcodeLookup
+from apps.fulfillment.tests.factories import FulfillmentCenterFactory, FulfillmentCenterZipcodeFactory
+
+
+class ZipcodeLookupTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.wallace = FulfillmentCenterFactory(location='wallace')
+        self.reno = FulfillmentCenterFactory(location='reno')
+        FulfillmentCenterZipcodeFactory(zipcode='33165').warehouses.add(self.wallace)
+        FulfillmentCenterZipcodeFactory(zipcode='33166').warehouses.add(self.wallace, self.reno)
+        FulfillmentCenterZipcodeFactory(zipcode='33167')
+        ZipcodeLookup.invalidate()
+
+    def test_will_map_zipcodes_to_their_fulfillment_centers(self):
+        self.assertEqual(ZipcodeLookup.get_locations('33165'), frozenset({'wallace'}))
+        self.assertEqual(ZipcodeLookup.get_locations('33166'), frozenset({'wallace', 'reno'}))
+        self.assertEqual(ZipcodeLookup.get_locations('33167'), frozenset())
+        self.assertIsNone(ZipcodeLookup.get_locations('33199'))
+
+    def test_will_not_query_once_loaded(self):
+        ZipcodeLookup.get_locations('33165')
+        with CaptureQueriesContext(connection) as queries:
+            ZipcodeLookup.get_locations('33166')
+        self.assertEqual(len(queries), 0)
+
+    def test_will_reload_after_invalidation(self):
+        ZipcodeLookup.get_locations('33165')
+        FulfillmentCenterZipcodeFactory(zipcode='33168').warehouses.add(self.reno)
+        ZipcodeLookup.invalidate()
+        self.assertEqual(ZipcodeLookup.get_locations('33168'), frozenset({'reno'}))
@@ -1,4 +1,4 @@
-from apps.orders.api.serializers.order import OrderReadOnlySerializer
-from apps.orders.api.serializers.order_line_item import OrderLineItemReadOnlySerializer
+from apps.orders.api.serializers.order import OrderHistorySerializer, OrderReadOnlySerializer
+from apps.orders.api.serializers.order_line_item import OrderLineItemHistorySerializer, OrderLineItemReadOnlySerializer
 from apps.orders.api.serializers.shipping_rate import ShippingRateReadOnlySerializer
 
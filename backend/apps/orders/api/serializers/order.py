@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
-from apps.orders.api.serializers.order_line_item import OrderLineItemReadOnlySerializer
+from apps.orders.api.serializers.order_line_item import OrderLineItemHistorySerializer, OrderLineItemReadOnlySerializer
 from apps.customers.api.serializers import CustomerReadOnlySerializer
+from apps.customers.api.serializers.customer import CustomerBaseSerializer
 from apps.orders.models import Order
 
 ORDER_FIELDS = ['id', 'customer', 'customer_child', 'fulfillment_status', 'payment_status',
@@ -21,3 +22,14 @@ class OrderReadOnlySerializer(serializers.ModelSerializer):
 
     def get_order_line_items(self, obj):
         return [OrderLineItemReadOnlySerializer(item).data for item in obj.line_items.filter()]
+
+
+class OrderHistorySerializer(OrderReadOnlySerializer):
+    """
+    Lightweight counterpart of `OrderReadOnlySerializer` for order listings: the customer and the products of line
+    items are flat references. Expects line items to be prefetched with their product and variant.
+    """
+    customer = CustomerBaseSerializer(read_only=True)
+
+    def get_order_line_items(self, obj):
+        return OrderLineItemHistorySerializer(obj.line_items.all(), many=True).data
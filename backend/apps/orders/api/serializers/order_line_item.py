@@ -5,7 +5,7 @@ from rest_framework import serializers
 
 from apps.orders.models import OrderLineItem
 from apps.products.api.serializers import ProductReadOnlySerializer
-from apps.products.api.serializers.product import ProductVariantReadOnlySerializer
+from apps.products.api.serializers.product import ProductReferenceSerializer, ProductVariantReadOnlySerializer
 
 
 class OrderLineItemReadOnlySerializer(serializers.ModelSerializer):
@@ -16,3 +16,7 @@ class OrderLineItemReadOnlySerializer(serializers.ModelSerializer):
         model = OrderLineItem
         fields = ['id', 'quantity', 'product', 'product_variant']
         read_only_fields = fields
+
+
+class OrderLineItemHistorySerializer(OrderLineItemReadOnlySerializer):
+    product = ProductReferenceSerializer()
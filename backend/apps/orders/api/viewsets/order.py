@@ -1,29 +1,32 @@
-from decimal import Decimal
-
 from django.apps import apps
-from django.db.models import Sum
+from django.db.models import Prefetch, Sum
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import APIException
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 
-from apps.addresses.models import Location
 from apps.billing.models import PaymentMethod
 from apps.carts.models import Cart
 from apps.customers.models import CustomerSubscription
-from apps.discounts.libs import DiscountBuilder, CannotCreateDiscountForCustomerError
-from apps.orders.api.serializers import OrderReadOnlySerializer
+from apps.discounts.libs import CannotCreateDiscountForCustomerError
+from apps.orders.api.serializers import OrderHistorySerializer, OrderReadOnlySerializer
 from apps.orders.libs import (
     CannotBuildOrderError,
     OrderBuilder,
-    OrderSummaryDetailDTO,
     OrderPaymentStatusEnum,
-    PaymentCalculator,
+    OrderSummaryBuilder,
 )
-from apps.discounts.models import Discount, CustomerDiscount
-from apps.orders.models import Order, ShippingRate
+from apps.discounts.models import CustomerDiscount
+from apps.orders.models import Order, OrderLineItem
 from libs.tax_nexus.avalara import TaxProcessorClient
-from libs.tax_nexus.avalara.client import CouldNotCalculateTaxForPurchaseError
+
+
+class OrderHistoryPagination(CursorPagination):
+    ordering = '-created_at'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
 
 
 class OrderViewSet(
@@ -34,6 +37,7 @@ class OrderViewSet(
 ):
     queryset = Order.objects.filter().prefetch_related('customer')
     serializer_class = OrderReadOnlySerializer
+    pagination_class = OrderHistoryPagination
     tax_client = TaxProcessorClient()
 
     def get_queryset(self):
@@ -41,6 +45,13 @@ class OrderViewSet(
             customer_id=self.request.query_params.get('customer'),
         )
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset().select_related('customer').prefetch_related(
+            Prefetch('line_items', queryset=OrderLineItem.objects.select_related('product', 'product_variant')),
+        )
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(OrderHistorySerializer(page, many=True).data)
+
     def create(self, request, *args, **kwargs):
         data = request.data
         customer_id = data.get('customer', None)
@@ -143,55 +154,9 @@ class OrderViewSet(
         Customer = apps.get_model('customers', 'Customer')
         customer = Customer.objects.get(id=customer_id)
 
-        children = customer.children.filter().prefetch_related('cart')
-        discount_code = self.request.query_params.get('discount')
-        running_summary = {
-            "subtotal": Decimal('0'),
-            "discounts": Decimal('0'),
-            "shipping": Decimal('0'),
-            "taxes": Decimal('0'),
-            "total": Decimal('0')
-        }
-        if discount_code:
-            discount = Discount.objects.filter(is_active=True, codename__iexact=discount_code).first()
-            discount_builder = DiscountBuilder()\
-                .set_discount(discount)\
-                .set_customer(customer)
-
-            for child in children:
-                discount_builder.add_cart(child.cart)
-
-            try:
-                discount_builder.build()
-            except CannotCreateDiscountForCustomerError as e:
-                raise APIException(e)
-
-        for child in children:
-            customer_discount = CustomerDiscount.objects.filter(customer_child=child, is_active=True).first()
-            default_shipping_rate = ShippingRate.objects.filter(is_default=True).first()
-            summary_data = OrderSummaryDetailDTO(
-                cart=child.cart,
-                customer_discount=customer_discount,
-                shipping_rate=default_shipping_rate,
-            )
-
-            try:
-                tax_calculation = self.tax_client \
-                    .set_customer_discount(customer_discount) \
-                    .set_shipping_rate(summary_data.shipping_rate) \
-                    .calculate_tax(child.cart)
-                total_tax = tax_calculation.get('total_tax')
-            # The first time a user requests a summary, they might not have an address
-            except (Location.DoesNotExist, CouldNotCalculateTaxForPurchaseError):
-                total_tax = Decimal(0)
-            summary_data.tax_amount = total_tax
-
-            summary = PaymentCalculator.summary(summary_data)
-
-            running_summary['subtotal'] += summary['subtotal']
-            running_summary['discounts'] += summary['discounts']
-            running_summary['taxes'] += summary['taxes']
-            running_summary['total'] += summary['total']
-            running_summary['shipping'] += summary['shipping']
+        try:
+            running_summary = OrderSummaryBuilder(customer, self.request.query_params.get('discount')).build()
+        except CannotCreateDiscountForCustomerError as e:
+            raise APIException(e)
 
         return Response(running_summary, status=status.HTTP_200_OK)
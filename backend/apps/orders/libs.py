@@ -1,11 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from datetime import date, timedelta
 from decimal import Decimal
-from typing import List, Union
+from typing import Dict, Iterable, List, Tuple, Union
 
 from django.apps import apps
-from django.db.models import Sum
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, Q, Sum
+from django.utils import timezone
+from sentry_sdk.utils import logger
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
 from libs.helpers import ModelChoiceEnum
+from libs.payment_processors.exceptions import CouldNotChargeOrderError, CouldNotProcessChargeError
 
 
 class OrderFulfillmentStatusEnum(ModelChoiceEnum):
@@ -46,9 +54,48 @@ class OrderSummaryDetailDTO:
     customer_discount: Union[None, 'CustomerDiscount'] = None
     shipping_rate: Union[None, 'ShippingRate'] = None
     tax_amount: Decimal = Decimal('0')
+    # snapshots of the cart's line items when they were already read, the cart is queried otherwise
+    line_item_snapshots: Union[None, Tuple['LineItemSnapshotDTO', ...]] = None
+
+
+@dataclass(frozen=True)
+class LineItemSnapshotDTO:
+    """
+    The parts of a cart or order line item that pricing, tax and fulfillment payloads read, copied once so they can be
+    reused without touching the line item's product and variant again.
+    """
+    quantity: int
+    price: Decimal
+    title: str
+    product_type: Union[None, str] = None
+    sku_id: Union[None, str] = None
+    external_variant_id: Union[None, str] = None
+
+    @classmethod
+    def from_line_item(cls, line_item: Union['CartLineItem', 'OrderLineItem']) -> 'LineItemSnapshotDTO':
+        return cls(
+            quantity=line_item.quantity,
+            price=line_item.product_variant.price,
+            product_type=line_item.product.product_type,
+            title=line_item.product.title,
+            sku_id=line_item.product_variant.sku_id,
+            external_variant_id=line_item.product_variant.external_variant_id,
+        )
+
+    @classmethod
+    def from_line_items(cls, line_items) -> Tuple['LineItemSnapshotDTO', ...]:
+        return tuple(cls.from_line_item(line_item) for line_item in line_items)
 
 
 class PaymentCalculator:
+    """
+    Prices a set of line items. Line items are read once into `LineItemSnapshotDTO`s (pass snapshots directly with
+    `set_line_item_snapshots` to share them with other payload builders) and `calculate` works on those alone, so it
+    makes no queries of its own.
+    """
+    TWENTY_FOUR_PACK_SERVINGS = 24
+    TWENTY_FOUR_PACK_DISCOUNT = Decimal('20')
+
     def __init__(self):
         self.subtotal_amount = Decimal('0')
         self.running_subtotal_amount = Decimal('0')
@@ -56,11 +103,13 @@ class PaymentCalculator:
         self.discount_total_amount = Decimal('0')
         self.amount_total = Decimal('0')
         self.tax_total = Decimal('0')
+        self.number_of_servings = 0
         self.shipping_rate = None
         self.order = None
         self.cart = None
         self.applied_discount = None
         self.line_items = None
+        self.line_item_snapshots = None
 
     def set_tax(self, tax_total: 'Decimal'):
         self.tax_total = tax_total
@@ -72,8 +121,7 @@ class PaymentCalculator:
 
     def set_cart(self, cart: 'Cart'):
         self.cart = cart
-        self.line_items = cart.line_items.filter()
-        return self
+        return self.set_line_items(cart.line_items.select_related('product', 'product_variant'))
 
     def set_applied_discount(self, applied_discount: 'CustomerDiscount'):
         self.applied_discount = applied_discount
@@ -81,17 +129,32 @@ class PaymentCalculator:
 
     def set_order(self, order: 'Order'):
         self.order = order
-        self.line_items = order.line_items.filter()
+        return self.set_line_items(order.line_items.select_related('product', 'product_variant'))
+
+    def set_line_items(self, line_items: List):
+        self.line_items = line_items
+        self.line_item_snapshots = None
+        return self
+
+    def set_line_item_snapshots(self, line_item_snapshots: Iterable[LineItemSnapshotDTO]):
+        self.line_item_snapshots = tuple(line_item_snapshots)
         return self
 
+    def get_line_item_snapshots(self) -> Tuple[LineItemSnapshotDTO, ...]:
+        if self.line_item_snapshots is None:
+            self.line_item_snapshots = LineItemSnapshotDTO.from_line_items(self.line_items or [])
+        return self.line_item_snapshots
+
     @classmethod
     def summary(cls, order_summary_detail_dto: OrderSummaryDetailDTO):
-        calculations = cls()\
+        calculator = cls()\
             .set_tax(order_summary_detail_dto.tax_amount)\
             .set_cart(order_summary_detail_dto.cart)\
             .set_shipping_rate(order_summary_detail_dto.shipping_rate)\
-            .set_applied_discount(order_summary_detail_dto.customer_discount)\
-            .calculate()
+            .set_applied_discount(order_summary_detail_dto.customer_discount)
+        if order_summary_detail_dto.line_item_snapshots is not None:
+            calculator.set_line_item_snapshots(order_summary_detail_dto.line_item_snapshots)
+        calculations = calculator.calculate()
         return {
             'shipping': order_summary_detail_dto.shipping_rate.price,
             'taxes': order_summary_detail_dto.tax_amount,
@@ -106,7 +169,9 @@ class PaymentCalculator:
         CustomerDiscount = apps.get_model('discounts', 'CustomerDiscount')
         return cls()\
             .set_cart(cart)\
-            .set_applied_discount(CustomerDiscount.objects.filter(customer=cart.customer, is_active=True).first())\
+            .set_applied_discount(
+                CustomerDiscount.objects.filter(customer=cart.customer, is_active=True).select_related('discount').first()
+            )\
             .set_shipping_rate(ShippingRate.objects.filter(is_default=True).first())\
             .calculate()
 
@@ -121,14 +186,14 @@ class PaymentCalculator:
 
     def get_subtotal(self):
         return sum([
-            line_item.quantity * line_item.product_variant.price
-            for line_item in self.line_items.filter()
+            line_item.quantity * line_item.price
+            for line_item in self.get_line_item_snapshots()
         ])
 
     def get_number_of_servings(self):
         return sum([
-            line_item.quantity if line_item.product.product_type == 'recipe' else 0
-            for line_item in self.line_items
+            line_item.quantity if line_item.product_type == 'recipe' else 0
+            for line_item in self.get_line_item_snapshots()
         ])
 
     def _get_discount_amount(self):
@@ -148,18 +213,23 @@ class PaymentCalculator:
         self.running_subtotal_amount -= discount_amount
 
     def is_24_pack(self):
-        return self.get_number_of_servings() >= 24
+        return self.get_number_of_servings() >= self.TWENTY_FOUR_PACK_SERVINGS
 
     def calculate(self):
 
-        # 1: calculate subtotal for cart
-        self.subtotal_amount = self.get_subtotal()
+        # 1: calculate subtotal and servings for cart in a single pass over the snapshots
+        self.subtotal_amount = Decimal('0')
+        self.number_of_servings = 0
+        for line_item in self.get_line_item_snapshots():
+            self.subtotal_amount += line_item.quantity * line_item.price
+            if line_item.product_type == 'recipe':
+                self.number_of_servings += line_item.quantity
         self.running_subtotal_amount = self.subtotal_amount
         # 2: apply discounts
 
         # automatic $20 discount for 24-packs
-        if self.is_24_pack():
-            self.running_subtotal_amount -= Decimal('20')
+        if self.number_of_servings >= self.TWENTY_FOUR_PACK_SERVINGS:
+            self.running_subtotal_amount -= self.TWENTY_FOUR_PACK_DISCOUNT
 
         # apply the customer discount code to the running subtotal
         self.apply_discount_to_running_subtotal()
@@ -174,6 +244,99 @@ class PaymentCalculator:
         return self
 
 
+class OrderSummaryBuilder:
+    """
+    Prices the carts of all the children of a customer from a single snapshot: children with their cart and line items,
+    their active discounts and the default shipping rate are read up front, and the tax quotes of the carts are
+    requested concurrently (see `TaxProcessorClient.quote_summaries`).
+
+    It makes no writes: a discount code is previewed with `DiscountBuilder.preview`, applying it is up to the customer
+    discounts api.
+    """
+    def __init__(self, customer: 'Customer', discount_code: str = None):
+        self.customer = customer
+        self.discount_code = discount_code
+
+    def _get_children(self) -> List['CustomerChild']:
+        CartLineItem = apps.get_model('carts', 'CartLineItem')
+        CustomerDiscount = apps.get_model('discounts', 'CustomerDiscount')
+        return list(self.customer.children.filter(cart__isnull=False).select_related('cart').prefetch_related(
+            Prefetch('cart__line_items', queryset=CartLineItem.objects.select_related('product', 'product_variant')),
+            Prefetch(
+                'assigned_discounts',
+                queryset=CustomerDiscount.objects.filter(is_active=True).select_related('discount').order_by('pk'),
+                to_attr='active_discounts',
+            ),
+        ))
+
+    def _get_customer_discounts(self, children: List['CustomerChild']) -> Dict[str, Union[None, 'CustomerDiscount']]:
+        from apps.discounts.libs import CustomerDiscountStatusEnum, DiscountBuilder
+
+        Discount = apps.get_model('discounts', 'Discount')
+        if not self.discount_code:
+            return {
+                child.id: child.active_discounts[0] if child.active_discounts else None
+                for child in children
+            }
+
+        discount = Discount.objects.filter(is_active=True, codename__iexact=self.discount_code).first()
+        discount_builder = DiscountBuilder()\
+            .set_discount(discount)\
+            .set_customer(self.customer)
+        for child in children:
+            discount_builder.add_cart(child.cart)
+        previewed_discounts = {
+            customer_discount.customer_child_id: customer_discount
+            for customer_discount in discount_builder.preview().customer_discounts
+        }
+
+        # applying the code would replace the unredeemed discounts of the customer
+        customer_discounts = {}
+        for child in children:
+            kept_discounts = [
+                customer_discount for customer_discount in child.active_discounts
+                if customer_discount.status != CustomerDiscountStatusEnum.unredeemed
+            ]
+            customer_discounts[child.id] = previewed_discounts.get(child.id) or next(iter(kept_discounts), None)
+        return customer_discounts
+
+    def build(self) -> Dict[str, Decimal]:
+        from libs.tax_nexus.avalara import TaxProcessorClient
+
+        ShippingRate = apps.get_model('orders', 'ShippingRate')
+        children = self._get_children()
+        customer_discounts = self._get_customer_discounts(children)
+        default_shipping_rate = ShippingRate.objects.filter(is_default=True).first()
+        summaries = [
+            OrderSummaryDetailDTO(
+                cart=child.cart,
+                customer_discount=customer_discounts[child.id],
+                shipping_rate=default_shipping_rate,
+                line_item_snapshots=LineItemSnapshotDTO.from_line_items(child.cart.line_items.all()),
+            )
+            for child in children
+        ]
+
+        # the first time a user requests a summary, they might not have an address: taxes are left at 0
+        address = self.customer.addresses.order_by('-created_at').first()
+        if address and summaries:
+            tax_amounts = TaxProcessorClient.quote_summaries(self.customer, address, summaries)
+            for summary, tax_amount in zip(summaries, tax_amounts):
+                summary.tax_amount = tax_amount
+
+        running_summary = {
+            'subtotal': Decimal('0'),
+            'discounts': Decimal('0'),
+            'shipping': Decimal('0'),
+            'taxes': Decimal('0'),
+            'total': Decimal('0'),
+        }
+        for summary in summaries:
+            for key, amount in PaymentCalculator.summary(summary).items():
+                running_summary[key] += amount
+        return running_summary
+
+
 class OrderBuilder:
     def __init__(self, *args, **kwargs):
         self.customer = None
@@ -358,3 +521,372 @@ class OrderBuilder:
         self.order.save()
 
         return self
+
+
+class BulkOrderBuilder:
+    """
+    Builds renewal orders for a chunk of subscriptions at once.
+
+    Everything `OrderBuilder.from_subscription` looks up per subscription (cart line items, active discount,
+    shipping address, payment method and the default shipping rate) is fetched for the whole chunk up front,
+    totals are calculated in memory and the orders, line items and their history rows are bulk created. The number
+    of queries is constant per chunk, regardless of how many subscriptions it contains.
+
+    When a charge date is set, only subscriptions still due on that date are picked up and their rows are locked
+    for the duration of the build, so running the same chunk twice (e.g. a retried shard) cannot create duplicate
+    orders: the first run advances `next_order_charge_date` in the same transaction that creates the orders.
+    """
+    CHUNK_SIZE = 500
+
+    def __init__(self):
+        self.subscription_ids = []
+        self.charge_date = None
+        self.subscriptions = []
+        self.orders = []
+        self.errors = []
+        self.shipping_rate = None
+        self._line_items_by_cart = {}
+        self._discounts_by_child = {}
+        self._addresses_by_customer = {}
+        self._payment_methods_by_customer = {}
+
+    @classmethod
+    def from_subscription_ids(cls, subscription_ids: List, charge_date: date = None) -> 'BulkOrderBuilder':
+        return cls().add_subscription_ids(subscription_ids).set_charge_date(charge_date).build()
+
+    def add_subscription_ids(self, subscription_ids: List):
+        self.subscription_ids.extend(subscription_ids)
+        return self
+
+    def set_charge_date(self, charge_date: date = None):
+        self.charge_date = charge_date
+        return self
+
+    def _load_subscriptions(self):
+        CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
+        subscriptions = CustomerSubscription.objects.filter(
+            id__in=self.subscription_ids,
+        )
+        if self.charge_date:
+            subscriptions = subscriptions.filter(
+                next_order_charge_date=self.charge_date,
+            ).select_for_update(skip_locked=True, of=('self', ))
+
+        self.subscriptions = list(
+            subscriptions.select_related(
+                'customer',
+                'customer_child__cart',
+            )
+        )
+
+    def _load_related_records(self):
+        CartLineItem = apps.get_model('carts', 'CartLineItem')
+        CustomerDiscount = apps.get_model('discounts', 'CustomerDiscount')
+        Location = apps.get_model('addresses', 'Location')
+        PaymentMethod = apps.get_model('billing', 'PaymentMethod')
+        ShippingRate = apps.get_model('orders', 'ShippingRate')
+
+        customer_ids = {subscription.customer_id for subscription in self.subscriptions}
+        child_ids = {subscription.customer_child_id for subscription in self.subscriptions}
+
+        for line_item in CartLineItem.objects.filter(
+            cart__customer_child_id__in=child_ids,
+        ).select_related('product', 'product_variant'):
+            self._line_items_by_cart.setdefault(line_item.cart_id, []).append(line_item)
+
+        # mirrors `customer.discounts.filter(customer_child=..., is_active=True).order_by('-applied_at').first()`
+        for customer_discount in CustomerDiscount.objects.filter(
+            customer_id__in=customer_ids,
+            customer_child_id__in=child_ids,
+            is_active=True,
+        ).select_related('discount').order_by('customer_id', 'customer_child_id', '-applied_at').distinct(
+            'customer_id', 'customer_child_id',
+        ):
+            self._discounts_by_child[(customer_discount.customer_id, customer_discount.customer_child_id)] = \
+                customer_discount
+
+        # mirrors `customer.addresses.first()`
+        self._addresses_by_customer = {
+            address.customer_id: address
+            for address in Location.objects.filter(
+                customer_id__in=customer_ids,
+            ).order_by('customer_id', 'pk').distinct('customer_id')
+        }
+
+        self._payment_methods_by_customer = {
+            payment_method.customer_id: payment_method
+            for payment_method in PaymentMethod.objects.filter(
+                customer_id__in=customer_ids,
+                is_valid=True,
+                setup_for_future_charges=True,
+            ).order_by('customer_id', '-created_at').distinct('customer_id')
+        }
+
+        self.shipping_rate = ShippingRate.objects.filter(is_default=True).first()
+
+    def _build_order(self, subscription: 'CustomerSubscription'):
+        Order = apps.get_model('orders', 'Order')
+
+        cart = subscription.customer_child.cart
+        line_items = self._line_items_by_cart.get(cart.id, [])
+        customer_discount = self._discounts_by_child.get((subscription.customer_id, subscription.customer_child_id))
+        shipping_address = self._addresses_by_customer.get(subscription.customer_id)
+        payment_method = self._payment_methods_by_customer.get(subscription.customer_id)
+
+        if not sum(line_item.quantity for line_item in line_items):
+            raise CannotBuildOrderError(f'A number of servings (12,24) is required to build an order: {subscription}')
+
+        if not payment_method:
+            raise CannotBuildOrderError(
+                f'Must set a payment method. Ensure the customer has a valid payment method: {subscription}'
+            )
+
+        if not shipping_address:
+            raise CannotBuildOrderError(f'An address is required to build an order: {subscription}')
+
+        if not self.shipping_rate:
+            raise CannotBuildOrderError('A default shipping rate is required to build an order')
+
+        calculator = PaymentCalculator()\
+            .set_line_items(line_items)\
+            .set_shipping_rate(self.shipping_rate)\
+            .set_applied_discount(customer_discount)\
+            .calculate()
+
+        order = Order(
+            customer=subscription.customer,
+            customer_child=subscription.customer_child,
+            payment_method=payment_method,
+            shipping_rate=self.shipping_rate,
+            shipping_address=shipping_address,
+            applied_discount=customer_discount,
+            tags=['From Re-platform', ],
+            amount_total=calculator.amount_total,
+            subtotal_amount=calculator.subtotal_amount,
+            discount_amount_total=calculator.discount_total_amount,
+        )
+        return order, line_items
+
+    def _update_subscriptions(self):
+        CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
+
+        now = timezone.now()
+        for subscription in self.subscriptions:
+            subscription.update_next_order_dates()
+            subscription.modified_at = now
+
+        bulk_update_with_history(
+            self.subscriptions,
+            CustomerSubscription,
+            fields=['next_order_charge_date', 'next_order_changes_enabled_date', 'modified_at'],
+        )
+        self._remove_onetime_line_items()
+
+    def _remove_onetime_line_items(self):
+        """
+        Bulk equivalent of `Cart.remove_onetime_line_items` that writes the deletion history rows in one insert
+        instead of one per line item through the `post_delete` signal.
+        """
+        CartLineItem = apps.get_model('carts', 'CartLineItem')
+        HistoricalCartLineItem = CartLineItem.history.model
+
+        # read once: only the line items written to history are deleted, not ones added in the meantime
+        onetime_line_items = list(CartLineItem.objects.filter(
+            cart__customer_child_id__in=[subscription.customer_child_id for subscription in self.subscriptions],
+            product__is_recurring=False,
+        ))
+        if not onetime_line_items:
+            return
+
+        now = timezone.now()
+        HistoricalCartLineItem.objects.bulk_create([
+            HistoricalCartLineItem(
+                history_date=now,
+                history_type='-',
+                history_change_reason='',
+                **{field.attname: getattr(line_item, field.attname) for field in CartLineItem._meta.fields},
+            ) for line_item in onetime_line_items
+        ])
+        # nothing references cart line items, so the collector (and its per-row signals) can be skipped
+        deleted_line_items = CartLineItem.objects.filter(id__in=[line_item.id for line_item in onetime_line_items])
+        deleted_line_items._raw_delete(deleted_line_items.db)
+
+    def build(self):
+        Order = apps.get_model('orders', 'Order')
+        OrderLineItem = apps.get_model('orders', 'OrderLineItem')
+
+        with transaction.atomic():
+            self._load_subscriptions()
+            self._load_related_records()
+
+            order_line_items = []
+            for subscription in self.subscriptions:
+                try:
+                    order, line_items = self._build_order(subscription)
+                except CannotBuildOrderError as e:
+                    self.errors.append(e)
+                    continue
+
+                self.orders.append(order)
+                order_line_items.extend([
+                    OrderLineItem(
+                        order=order,
+                        product=line_item.product,
+                        product_variant=line_item.product_variant,
+                        quantity=line_item.quantity,
+                    ) for line_item in line_items
+                ])
+
+            bulk_create_with_history(self.orders, Order)
+            bulk_create_with_history(order_line_items, OrderLineItem)
+            self._update_subscriptions()
+
+        return self
+
+
+class OrderChargeEngine:
+    """
+    Charges batches of pending orders concurrently.
+
+    Orders are claimed with `SELECT ... FOR UPDATE SKIP LOCKED` and marked with `charge_claimed_at` in a short
+    transaction of their own, so several engines (e.g. on different workers) never pick up the same order and no row
+    lock is held while the payment processor is called. Charges are sent from a bounded thread pool (within the
+    shared Stripe rate limit of `ProviderGuard`), and the results are written back (releasing the claim) in a second
+    transaction. Every attempt uses an idempotency key derived from the order and its attempt number: if the process
+    dies after the processor charged the card but before the results are committed, the attempt number is not
+    advanced, and once the claim times out the retry replays the original charge instead of creating a new one.
+    """
+    BATCH_SIZE = 100
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or settings.STRIPE_CHARGE_CONCURRENCY
+        self.claimed_orders = []
+        self.charged_orders = []
+        self.failed_orders = []
+
+    @staticmethod
+    def idempotency_key(order: 'Order', attempt: int) -> str:
+        return f'order-{order.id}-charge-attempt-{attempt}'
+
+    def _claim_orders(self, orders: 'QuerySet', batch_size: int):
+        Order = apps.get_model('orders', 'Order')
+        now = timezone.now()
+        with transaction.atomic():
+            self.claimed_orders = list(
+                orders.filter(
+                    Q(charge_claimed_at__isnull=True) |
+                    Q(charge_claimed_at__lt=now - timedelta(seconds=settings.ORDER_CHARGE_CLAIM_TIMEOUT)),
+                    payment_status=str(OrderPaymentStatusEnum.pending),
+                    payment_processor_charge_id__isnull=True,
+                    customer_child__subscription__is_active=True,
+                    charge_attempts__lt=Order.MAX_FAILED_ORDER_CHARGE_ATTEMPTS,
+                ).exclude(
+                    fulfillment_status=str(OrderFulfillmentStatusEnum.cancelled),
+                ).select_related(
+                    'payment_method__customer',
+                    'payment_method__payment_processor',
+                ).select_for_update(
+                    skip_locked=True,
+                    of=('self', ),
+                ).order_by('created_at')[:batch_size]
+            )
+            Order.objects.filter(id__in=[order.id for order in self.claimed_orders]).update(charge_claimed_at=now)
+
+    def _process_charge(self, order: 'Order'):
+        """
+        Runs in a worker thread, it must not touch the database.
+        """
+        if order.amount_total <= Decimal('0'):
+            return None
+
+        if not order.payment_method:
+            raise CouldNotChargeOrderError(f'Order {order.id} does not have a payment method')
+
+        # rate limited by the Stripe client, see `ProviderGuard`
+        return order.payment_method.process_charge(
+            order.amount_total,
+            idempotency_key=self.idempotency_key(order, order.charge_attempts),
+        )
+
+    def _save_results(self, results: List):
+        from apps.core.outbox import OutboxTopicEnum
+        Order = apps.get_model('orders', 'Order')
+        OutboxEvent = apps.get_model('core', 'OutboxEvent')
+
+        now = timezone.now()
+        processed_charges = {}
+        for order, processed_charge, error in results:
+            order.modified_at = now
+            if error:
+                order.charge_failure_message = str(error)
+                if order.charge_attempts >= Order.MAX_FAILED_ORDER_CHARGE_ATTEMPTS:
+                    order.payment_status = str(OrderPaymentStatusEnum.failed)
+                self.failed_orders.append(order)
+                continue
+
+            if processed_charge:
+                processed_charges[order] = order.payment_method._processed_charge_dto(processed_charge)
+                order.payment_processor_charge_id = processed_charge.id
+            order.charged_amount = Decimal('0')
+            order.charged_at = now
+            order.payment_status = str(OrderPaymentStatusEnum.paid)
+            # the same side effects `Order.save` has when an order is marked as paid
+            transaction.on_commit(order._mark_discount_as_redeemed)
+            self.charged_orders.append(order)
+
+        if processed_charges:
+            billing_transaction_manager = next(iter(processed_charges)).payment_method.payment_processor\
+                .billing_transaction_manager
+            charges = billing_transaction_manager.save_charges_to_database(list(processed_charges.values()))
+            for order, charge in zip(processed_charges, charges):
+                order.charged_amount = charge.amount
+
+        for order in self.claimed_orders:
+            order.charge_claimed_at = None
+        bulk_update_with_history(
+            self.claimed_orders,
+            Order,
+            fields=[
+                'charge_attempts',
+                'charge_claimed_at',
+                'charge_failure_message',
+                'payment_status',
+                'payment_processor_charge_id',
+                'charged_amount',
+                'charged_at',
+                'modified_at',
+            ],
+        )
+        OutboxEvent.objects.publish_many(OutboxTopicEnum.order_paid, [order.id for order in self.charged_orders])
+        OutboxEvent.objects.publish_many(
+            OutboxTopicEnum.order_charge_failed,
+            [order.id for order in self.failed_orders if order.payment_status == str(OrderPaymentStatusEnum.failed)],
+        )
+
+    def charge_orders(self, orders: 'QuerySet' = None, batch_size: int = BATCH_SIZE):
+        Order = apps.get_model('orders', 'Order')
+        if orders is None:
+            orders = Order.objects.filter()
+
+        self._claim_orders(orders, batch_size)
+        for order in self.claimed_orders:
+            order.charge_attempts += 1
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [(order, executor.submit(self._process_charge, order)) for order in self.claimed_orders]
+
+        results = []
+        for order, future in futures:
+            try:
+                results.append((order, future.result(), None))
+            except Exception as e:
+                # any error (e.g. an invalid request or an open circuit) only fails its own order, the charges that
+                # went through are still saved
+                if not isinstance(e, (CouldNotChargeOrderError, CouldNotProcessChargeError)):
+                    logger.exception(e)
+                results.append((order, None, e))
+
+        with transaction.atomic():
+            self._save_results(results)
+
+        return self
@@ -0,0 +1,40 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # indexes are built concurrently so the orders table is not locked while they are created
+    atomic = False
+
+    dependencies = [
+        ('orders', '0023_auto_20220601_1528'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(
+                condition=models.Q(
+                    ('external_order_id__isnull', True), ('payment_status', 'paid'), ('synced_to_shopify', False),
+                ),
+                fields=['id'],
+                name='order_shopify_sync_queue_idx',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(
+                condition=models.Q(('payment_status', 'paid'), ('synced_to_avalara', False)),
+                fields=['id'],
+                name='order_avalara_sync_queue_idx',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(
+                condition=models.Q(('payment_status', 'pending')),
+                fields=['created_at'],
+                name='order_pending_payment_idx',
+            ),
+        ),
+    ]
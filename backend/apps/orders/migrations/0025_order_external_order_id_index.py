@@ -0,0 +1,18 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # built concurrently so the orders table is not locked while the index is created
+    atomic = False
+
+    dependencies = [
+        ('orders', '0024_order_work_queue_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['external_order_id'], name='order_external_order_id_idx'),
+        ),
+    ]
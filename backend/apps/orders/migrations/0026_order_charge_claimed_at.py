@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0025_order_external_order_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalorder',
+            name='charge_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='charge_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -5,7 +5,6 @@ from django.db import models, transaction
 from django.utils import timezone
 from django_fsm import FSMField, transition
 from model_utils import Choices
-from django.conf import settings
 
 from apps.addresses.models import Location
 from apps.orders.libs import (
@@ -18,7 +17,8 @@ from libs.payment_processors.exceptions import CouldNotChargeOrderError, CouldNo
 from libs.shopify_api_client import ShopifyAPIClient, CouldNotCancelOrderError
 
 from apps.billing.models import PaymentMethod
-from apps.core.models import CoreModel
+from apps.core.models import CoreModel, OutboxEvent
+from apps.core.outbox import OutboxTopicEnum
 from apps.customers.models import Customer, CustomerChild
 from apps.discounts.models import CustomerDiscount
 from apps.orders.models import (
@@ -26,15 +26,7 @@ from apps.orders.models import (
 )
 from apps.orders.tasks import (
     sync_order_to_shopify,
-    sync_refunded_order_to_shopify,
-    sync_order_to_tax_client,
-    sync_refund_to_tax_client,
-    sync_partial_refund_to_shopify,
-    sync_order_payment_failed_to_analytics,
     send_order_confirmation_email,
-    sync_order_placed_event,
-    sync_order_to_yotpo,
-    sync_refund_to_yotpo,
 )
 
 
@@ -121,9 +113,38 @@ class Order(CoreModel):
     )
     payment_processor_charge_id = models.CharField(max_length=256, null=True, blank=True)
     charge_attempts = models.SmallIntegerField(default=0)
+    # set while an `OrderChargeEngine` is charging the order, see `ORDER_CHARGE_CLAIM_TIMEOUT`
+    charge_claimed_at = models.DateTimeField(null=True, blank=True)
     charge_failure_message = models.TextField(blank=True)
     MAX_FAILED_ORDER_CHARGE_ATTEMPTS = 10
 
+    class Meta(CoreModel.Meta):
+        # partial indexes over the orders each recurring scanner still has work for, they stay as small as the backlog
+        # no matter how many orders have already been processed
+        indexes = [
+            models.Index(
+                fields=['id'],
+                name='order_shopify_sync_queue_idx',
+                condition=models.Q(
+                    synced_to_shopify=False,
+                    external_order_id__isnull=True,
+                    payment_status=str(OrderPaymentStatusEnum.paid),
+                ),
+            ),
+            models.Index(
+                fields=['id'],
+                name='order_avalara_sync_queue_idx',
+                condition=models.Q(synced_to_avalara=False, payment_status=str(OrderPaymentStatusEnum.paid)),
+            ),
+            models.Index(
+                fields=['created_at'],
+                name='order_pending_payment_idx',
+                condition=models.Q(payment_status=str(OrderPaymentStatusEnum.pending)),
+            ),
+            # order imports and Shopify webhooks look orders up by their Shopify id
+            models.Index(fields=['external_order_id'], name='order_external_order_id_idx'),
+        ]
+
     @transition(
         field='payment_status',
         source=[
@@ -209,31 +230,6 @@ class Order(CoreModel):
     def send_confirmation_email(self):
         send_order_confirmation_email.delay(self.id)
 
-    def _sync_paid_order_transaction(self):
-        """
-          Creates Celery task to send order to shopify, yotpo, and avalara
-        """
-        # temporarily disable this and use button in admin until we can get these issues resolved.
-        # self.sync_to_shopify()
-        if settings.YOTPO_ORDER_SYNC_ENABLED:
-            sync_order_to_yotpo.delay(self.id)
-        self.send_confirmation_email()
-        sync_order_to_tax_client.apply_async(args=(self.id,), countdown=4)
-
-    def _sync_refunded_order_transaction(self):
-        sync_refunded_order_to_shopify.delay(self.id)
-        sync_refund_to_tax_client.delay(self.id)
-        if settings.YOTPO_ORDER_SYNC_ENABLED:
-            sync_refund_to_yotpo.delay(self.id)
-
-    def _sync_partial_refunded_order_transaction(self):
-        sync_partial_refund_to_shopify.delay(self.id)
-        if settings.YOTPO_ORDER_SYNC_ENABLED:
-            sync_refund_to_yotpo.delay(self.id)
-
-    def _sync_order_charge_failed_analytics_event(self):
-        sync_order_payment_failed_to_analytics.delay(self.id)
-
     def _mark_discount_as_redeemed(self):
         if self.applied_discount:
             self.applied_discount.redeem()
@@ -245,25 +241,29 @@ class Order(CoreModel):
         return number_of_recipe_items >= 24
 
     def save(self, *args, **kwargs):
+        # side effects are published to the outbox in the same transaction as the change, see `apps.core.outbox`
+        outbox_topics = []
         if (
             self.charge_attempts >= self.MAX_FAILED_ORDER_CHARGE_ATTEMPTS and
             self.payment_status == str(OrderPaymentStatusEnum.pending)
         ):
             self.payment_status = OrderPaymentStatusEnum.failed
-            transaction.on_commit(self._sync_order_charge_failed_analytics_event)
+            outbox_topics.append(OutboxTopicEnum.order_charge_failed)
         else:
             if not self.is_new() and self.is_dirty() and 'payment_status' in self.get_dirty_fields():
                 if self.payment_status == OrderPaymentStatusEnum.paid:
-                    transaction.on_commit(self._sync_paid_order_transaction)
+                    outbox_topics.append(OutboxTopicEnum.order_paid)
                     transaction.on_commit(self._mark_discount_as_redeemed)
-                    sync_order_placed_event.delay(self.id)
                 if self.payment_status == OrderPaymentStatusEnum.refunded:
-                    transaction.on_commit(self._sync_refunded_order_transaction)
+                    outbox_topics.append(OutboxTopicEnum.order_refunded)
                 if self.payment_status == OrderPaymentStatusEnum.partially_refunded:
-                    transaction.on_commit(self._sync_partial_refunded_order_transaction)
+                    outbox_topics.append(OutboxTopicEnum.order_partially_refunded)
             # This will catch the case in which multiple partial refunds are applied.
             elif not self.is_new() and self.is_dirty() and 'refunded_at' in self.get_dirty_fields():
                 if self.payment_status == OrderPaymentStatusEnum.partially_refunded:
-                    transaction.on_commit(self._sync_partial_refunded_order_transaction)
+                    outbox_topics.append(OutboxTopicEnum.order_partially_refunded)
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            for topic in outbox_topics:
+                OutboxEvent.objects.publish(topic, self.id)
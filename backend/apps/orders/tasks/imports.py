@@ -6,6 +6,7 @@ from django.utils import timezone
 
 from apps.core.exceptions import APIRateLimitError
 from apps.core.tasks import ReChargeErrorRetryTask
+from libs.api_request import cache_api_response, get_cached_api_response
 from libs.recharge_rest_client import RechargeClient
 from libs.shopify_rest_client import ShopifyRestClient
 
@@ -22,6 +23,7 @@ def log_queued_orders_for_customer(customer_id: str):
     )
     if request.response.status_code == 429:
         raise APIRateLimitError
+    cache_api_response(f'recharge-customer-orders-{customer_id}', request.response)
 
     return f'Logged Queued Orders for {customer}'
 
@@ -57,18 +59,14 @@ def _cancel_queued_order(recharge_order_id: str, customer_id: str):
 @shared_task(base=ReChargeErrorRetryTask, rate_limit='2/s')
 def cancel_recharge_queued_orders(customer_id: str):
     Customer = apps.get_model('customers', 'Customer')
-    APIRequestLog = apps.get_model('core', 'APIRequestLog')
 
     customer = Customer.objects.get(id=customer_id)
 
-    request_log = APIRequestLog.objects.get(
-        response_status_code=200,
-        object_type='CustomerOrder',
-        object_id=customer_id,
-        request_url__icontains=f'https://api.rechargeapps.com/orders/'
-                               f'?external_customer_id={customer.external_customer_id}',
-    )
-    for recharge_queued_order in request_log.response_json_payload.get('orders', []):
+    # queued orders are fetched by `log_queued_orders_for_customer`
+    queued_orders = get_cached_api_response(f'recharge-customer-orders-{customer_id}')
+    if queued_orders is None:
+        return f'No queued orders were fetched for {customer}'
+    for recharge_queued_order in queued_orders.get('orders', []):
         _cancel_queued_order.delay(recharge_queued_order['id'], customer_id)
 
     return f'Cancelling orders for {customer}'
@@ -79,7 +79,7 @@ def _create_yotpo_loyalty_order(order) -> LoyaltyProgramOrder:
     return loyalty_order
 
 
-@shared_task(base=HttpErrorRetryTask, rate_limit='2/s',)
+@shared_task(base=HttpErrorRetryTask)
 def sync_order_to_yotpo(order_id: str):
     with locking.acquire_shared_lock_context(f'syncing-order-{order_id}-to-yotpo', 'celery'):
         """
@@ -110,7 +110,7 @@ def _get_refund_amount_in_cents(order) -> int:
         return _dollar_amount_to_cents(order.partial_refund_amount)
 
 
-@shared_task(base=HttpErrorRetryTask, rate_limit='2/s',)
+@shared_task(base=HttpErrorRetryTask)
 def sync_refund_to_yotpo(order_id: str):
     with locking.acquire_shared_lock_context(f'syncing-refund-for-order-#{order_id}-to-yotpo', 'celery'):
         order = _get_order_for_yotpo_sync(order_id)
@@ -1,12 +1,17 @@
-from time import sleep
+from datetime import date
+from typing import Dict, List, Tuple
 
 from celery import shared_task
 from django.apps import apps
 from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from sentry_sdk.utils import logger
+from simple_history.utils import bulk_update_with_history
 
 from apps.core.tasks import HttpErrorRetryTask
-from apps.orders.libs import OrderPaymentStatusEnum
+from apps.orders.libs import BulkOrderBuilder, OrderPaymentStatusEnum
 from libs import locking
 from libs.shopify_api_client import (
     CouldNotSyncRefundError,
@@ -16,6 +21,7 @@ from libs.shopify_api_client import (
     CouldNotApplyRefundError,
     CouldNotCreateTransactionError,
 )
+from libs.shopify_graphql_client import ShopifyGraphQLClient, ShopifyOrderSyncResultDTO
 from libs.tax_nexus.avalara import TaxProcessorClient
 from libs.tax_nexus.avalara.client import CouldNotRecordTaxForPurchaseError, CouldNotRecordTaxForRefundError
 
@@ -84,13 +90,34 @@ def _get_order_for_shopify_sync(order_id: str):
     return order
 
 
-@shared_task(base=HttpErrorRetryTask, rate_limit='2/s',)
+@shared_task(autoretry_for=(OperationalError, ), retry_backoff=True, retry_kwargs={'max_retries': 5})
+def create_orders_for_subscription_shard(subscription_ids: List[str], charge_date: str) -> List[str]:
+    """
+    Creates the renewal orders for one shard of subscriptions due on `charge_date`. Subscriptions that were already
+    renewed for that date (e.g. by a previous attempt of this shard) are skipped, so the task is safe to retry.
+    Returns the `CannotBuildOrderError` messages so the coordinator's chord callback can report on them.
+    """
+    builder = BulkOrderBuilder.from_subscription_ids(subscription_ids, date.fromisoformat(charge_date))
+    logger.info(f'Created {len(builder.orders)} orders for {len(subscription_ids)} subscriptions due {charge_date}')
+    return [str(error) for error in builder.errors]
+
+
+@shared_task
+def report_subscription_order_errors(shard_errors: List[List[str]], charge_date: str) -> str:
+    errors = [error for errors in shard_errors for error in errors]
+    if errors:
+        # todo: send email with issue?
+        logger.error(f'Could not create {len(errors)} renewal orders due {charge_date}: {errors}')
+
+    return f'Created new orders for active subscribers due {charge_date} with {len(errors)} errors'
+
+
+@shared_task(base=HttpErrorRetryTask)
 def sync_order_to_shopify(order_id: str) -> str:
     with locking.acquire_shared_lock_context(f'syncing-order-{order_id}-to-shopify', 'celery'):
         order = _get_order_for_shopify_sync(order_id)
         client = ShopifyAPIClient()
         try:
-            sleep(4)
             _create_shopify_customer(order.customer.id)
             order_response = client.create_order(order)
             order.external_order_id = order_response.id
@@ -98,7 +125,6 @@ def sync_order_to_shopify(order_id: str) -> str:
             order.synced_to_shopify = True
             order.synced_to_shopify_status = 'synced'
             order.save()
-            sleep(4)
             order.refresh_from_db()
             client.create_transaction_for_order(order.external_order_id)
         except CouldNotSyncOrderError as e:
@@ -113,7 +139,111 @@ def sync_order_to_shopify(order_id: str) -> str:
         return f'created shopify order for order {order} --> #{order_response.id}'
 
 
-@shared_task(base=HttpErrorRetryTask, rate_limit='5/s',)
+SHOPIFY_SYNC_FIELDS = [
+    'external_order_id',
+    'order_number',
+    'synced_to_shopify',
+    'synced_to_shopify_status',
+    'modified_at',
+]
+
+
+def _claim_orders_for_shopify_sync(order_ids: List[str]) -> Dict[str, str]:
+    # the same per-order locks as `sync_order_to_shopify`, so an order is never sent by two tasks at once
+    lock_keys = {}
+    for order_id in order_ids:
+        try:
+            lock_keys[order_id] = locking.acquire_shared_lock(f'syncing-order-{order_id}-to-shopify', 'celery', 3*60*60)
+        except locking.FailedToAcquireSharedLockError:
+            continue
+    return lock_keys
+
+
+def _save_shopify_sync_results(
+    orders_by_id: Dict[str, 'Order'],
+    results: List[ShopifyOrderSyncResultDTO],
+) -> Tuple[int, List[str]]:
+    Order = apps.get_model('orders', 'Order')
+    Customer = apps.get_model('customers', 'Customer')
+
+    now = timezone.now()
+    synced_orders, customers, errors = [], {}, []
+    for result in results:
+        order = orders_by_id[result.order_id]
+        if result.errors:
+            errors.append(f'{order}: {result.errors}')
+            continue
+
+        order.external_order_id = result.external_order_id
+        order.order_number = result.order_number
+        order.synced_to_shopify = True
+        order.synced_to_shopify_status = 'synced'
+        order.modified_at = now
+        synced_orders.append(order)
+
+        customer = order.customer
+        if result.external_customer_id and customer.external_customer_id != result.external_customer_id:
+            customer.external_customer_id = result.external_customer_id
+            customer.modified_at = now
+            customers[customer.id] = customer
+
+    with transaction.atomic():
+        bulk_update_with_history(synced_orders, Order, fields=SHOPIFY_SYNC_FIELDS)
+        bulk_update_with_history(list(customers.values()), Customer, fields=['external_customer_id', 'modified_at'])
+    return len(synced_orders), errors
+
+
+@shared_task(base=HttpErrorRetryTask)
+def sync_orders_to_shopify_in_bulk(order_ids: List[str]) -> str:
+    """
+    Syncs a batch of orders through the Shopify GraphQL Admin API, several orders per request.
+
+    Orders are claimed with the per-order locks of `sync_order_to_shopify` (orders already being synced are skipped)
+    and the results of each request are saved as soon as it returns, so a failure (or a retry) never sends again the
+    orders Shopify already created.
+    """
+    Order = apps.get_model('orders', 'Order')
+
+    lock_keys = _claim_orders_for_shopify_sync(order_ids)
+    try:
+        # checked once claimed, a task that held the locks before may have synced them in the meantime
+        orders = list(
+            Order.objects.filter(
+                id__in=list(lock_keys),
+                payment_status=str(OrderPaymentStatusEnum.paid),
+                synced_to_shopify=False,
+                order_number__isnull=True,
+                customer__addresses__isnull=False,
+                payment_processor_charge_id__isnull=False,
+                external_order_id__isnull=True,
+            ).distinct().select_related(
+                'customer',
+                'shipping_rate',
+                'applied_discount__discount',
+            )
+        )
+        orders_by_id = {f'{order.id}': order for order in orders}
+
+        client = ShopifyGraphQLClient()
+        synced, errors = 0, []
+        for index in range(0, len(orders), client.ORDERS_PER_REQUEST):
+            chunk_synced, chunk_errors = _save_shopify_sync_results(
+                orders_by_id,
+                client.create_orders(orders[index:index + client.ORDERS_PER_REQUEST]),
+            )
+            synced += chunk_synced
+            errors.extend(chunk_errors)
+    finally:
+        for lock_key in lock_keys.values():
+            locking.release_shared_lock(lock_key, 'celery')
+
+    if errors:
+        logger.error(errors)
+
+    return f'Created {synced} shopify orders, could not sync {len(errors)} orders'
+
+
+@shared_task(base=HttpErrorRetryTask)
 def sync_refunded_order_to_shopify(order_id: str) -> str:
     Order = apps.get_model('orders', 'Order')
     order = Order.objects.get(id=order_id)
@@ -126,7 +256,7 @@ def sync_refunded_order_to_shopify(order_id: str) -> str:
     return f'Successfully applied refund to shopify order {shopify_order.id}'
 
 
-@shared_task(base=HttpErrorRetryTask, rate_limit='5/s',)
+@shared_task(base=HttpErrorRetryTask)
 def sync_order_to_tax_client(order_id: str) -> str:
     Order = apps.get_model('orders', 'Order')
     order = Order.objects.get(id=order_id)
@@ -144,7 +274,50 @@ def sync_order_to_tax_client(order_id: str) -> str:
     return f'Successfully recorded purchase to avalara for order #{order.id}'
 
 
-@shared_task(base=HttpErrorRetryTask, rate_limit='5/s',)
+def _prefetch_orders_for_tax_client(orders: 'QuerySet') -> 'QuerySet':
+    """
+    Loads everything `TaxProcessorClient.charge_orders` reads up front.
+    """
+    Location = apps.get_model('addresses', 'Location')
+    return orders.select_related(
+        'customer',
+        'shipping_rate',
+        'applied_discount__discount',
+    ).prefetch_related(
+        'line_items__product',
+        'line_items__product_variant',
+        Prefetch('customer__addresses', queryset=Location.objects.order_by('-created_at')),
+    )
+
+
+def _record_orders_to_tax_client(orders: List['Order']) -> Tuple[List['Order'], List]:
+    """
+    Records invoices for the orders concurrently and marks the recorded ones as synced, in bulk.
+    """
+    Order = apps.get_model('orders', 'Order')
+    recorded_orders, errors = TaxProcessorClient.charge_orders(orders)
+
+    now = timezone.now()
+    for order in recorded_orders:
+        order.synced_to_avalara = True
+        order.modified_at = now
+    bulk_update_with_history(recorded_orders, Order, fields=['synced_to_avalara', 'modified_at'])
+    return recorded_orders, errors
+
+
+@shared_task(base=HttpErrorRetryTask)
+def sync_orders_to_tax_client(order_ids: List[str]) -> str:
+    Order = apps.get_model('orders', 'Order')
+    # outbox events are delivered at-least-once, orders that were recorded already are skipped
+    orders = list(_prefetch_orders_for_tax_client(Order.objects.filter(id__in=order_ids, synced_to_avalara=False)))
+    recorded_orders, errors = _record_orders_to_tax_client(orders)
+    if errors:
+        raise Exception(errors)
+
+    return f'Recorded {len(recorded_orders)} purchases to avalara'
+
+
+@shared_task(base=HttpErrorRetryTask)
 def sync_refund_to_tax_client(order_id: str) -> str:
     Order = apps.get_model('orders', 'Order')
     order = Order.objects.get(id=order_id)
@@ -1,99 +1,101 @@
-from time import sleep
-
-from celery import shared_task
+from celery import chord, shared_task
 from django.apps import apps
 from django.conf import settings
 from django.utils import timezone
 from sentry_sdk.utils import logger
 
 from apps.core.tasks import HttpErrorRetryTask
-from apps.orders.libs import OrderPaymentStatusEnum, OrderBuilder, CannotBuildOrderError
+from apps.orders.libs import BulkOrderBuilder, OrderChargeEngine, OrderPaymentStatusEnum
 from celery_app import app
-from libs import celery_helpers, locking
-from libs.locking import FailedToAcquireSharedLockError
-from libs.payment_processors.exceptions import CouldNotChargeOrderError, CouldNotProcessChargeError
+from libs import celery_helpers
+from libs.shopify_graphql_client import ShopifyGraphQLClient
+
+TAX_SYNC_CHUNK_SIZE = 200
 
 
 @shared_task
 def create_new_orders_for_active_subscribers():
+    """
+    Coordinates renewal order creation: due subscription ids are paged through by id in fixed-size shards, each shard
+    is built by a worker on the `orders` queue and a chord callback reports the errors of all shards at once.
+    """
+    from apps.orders.tasks.order import create_orders_for_subscription_shard, report_subscription_order_errors
     CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
     today = timezone.now().date()
 
-    errors = []
-    for subscription in CustomerSubscription.objects.filter(
+    due_subscriptions = CustomerSubscription.objects.filter(
         is_active=True,
         next_order_charge_date=today,
         customer__payment_methods__is_valid=True,
         customer__addresses__isnull=False,
-    ).distinct('customer_child'):
-        try:
-            order = OrderBuilder.from_subscription(subscription)
-            print(f'Created order {order}')
-        except CannotBuildOrderError as e:
-            errors.append(e)
-            # todo: send email with issue?
-        finally:
-            subscription.update_next_order_dates()
-            subscription.save()
-            subscription.customer_child.cart.remove_onetime_line_items()
+    ).order_by('id').distinct()
 
-    if errors:
-        logger.error(errors)
+    shards = []
+    last_id = None
+    while True:
+        shard_subscriptions = due_subscriptions
+        if last_id:
+            shard_subscriptions = shard_subscriptions.filter(id__gt=last_id)
+        subscription_ids = [
+            str(subscription_id) for subscription_id in
+            shard_subscriptions.values_list('id', flat=True)[:BulkOrderBuilder.CHUNK_SIZE]
+        ]
+        if not subscription_ids:
+            break
+
+        shards.append(create_orders_for_subscription_shard.s(subscription_ids, today.isoformat()))
+        last_id = subscription_ids[-1]
+
+    if not shards:
+        return 'No active subscribers are due for a new order'
 
-    return 'Created new orders for active subscribers'
+    chord(shards)(report_subscription_order_errors.s(today.isoformat()))
 
+    return f'Dispatched {len(shards)} shards to create new orders for active subscribers'
 
-@shared_task(base=HttpErrorRetryTask, rate_limit='2/s')
+
+@shared_task(base=HttpErrorRetryTask)
 def _charge_order(order_id: str):
     Order = apps.get_model('orders', 'Order')
 
-    with locking.acquire_shared_lock_context(f'_charge-order-{order_id}', 'celery'):
-        try:
-            order = Order.objects.get(
-                id=order_id,
-                payment_status=str(OrderPaymentStatusEnum.pending),
-                customer_child__subscription__is_active=True,
-                payment_processor_charge_id__isnull=True,
-            )
-            order.charge_attempts += 1
-            order.save()
-            order.refresh_from_db()
-            order.charge()
-            order.save()
-        except (
-            CouldNotChargeOrderError,
-            CouldNotProcessChargeError,
-            Order.DoesNotExist,
-            FailedToAcquireSharedLockError,
-        ) as e:
-            logger.error(e)
-            return f'Could not charge order: {order_id}'
-
-    return f'Charged order: {order}'
+    engine = OrderChargeEngine().charge_orders(Order.objects.filter(id=order_id), batch_size=1)
+    if not engine.charged_orders:
+        for order in engine.failed_orders:
+            logger.error(order.charge_failure_message)
+        return f'Could not charge order: {order_id}'
+
+    return f'Charged order: {engine.charged_orders[0]}'
 
 
 @shared_task
 @celery_helpers.prevent_multiple
 def charge_new_orders():
+    """
+    Charges pending orders in batches until there are none left. Orders that were already attempted during this run
+    are not claimed again, they will be retried on the next run.
+    """
     Order = apps.get_model('orders', 'Order')
+    started_at = timezone.now()
 
-    uncharged_orders = Order.objects.filter(
-        payment_status=str(OrderPaymentStatusEnum.pending),
-        payment_processor_charge_id__isnull=True,
-        customer_child__subscription__is_active=True,
-    )[:40]
+    charged, failed = 0, 0
+    while True:
+        engine = OrderChargeEngine().charge_orders(Order.objects.filter(modified_at__lt=started_at))
+        if not engine.claimed_orders:
+            break
 
-    for order in uncharged_orders:
-        _charge_order(order.id)
+        charged += len(engine.charged_orders)
+        failed += len(engine.failed_orders)
+        for order in engine.failed_orders:
+            logger.error(f'Could not charge order {order.id}: {order.charge_failure_message}')
 
-    return f'Sent {uncharged_orders.count()} orders to be charged'
+    return f'Charged {charged} orders, could not charge {failed} orders'
 
 
 @shared_task(soft_time_limit=60*60*1000)
 @celery_helpers.prevent_multiple
 def sync_unsynced_orders_to_shopify():
     Order = apps.get_model('orders', 'Order')
-    from apps.orders.tasks.order import sync_order_to_shopify
+    from apps.orders.tasks.order import sync_order_to_shopify, sync_orders_to_shopify_in_bulk
     unsynced_orders = Order.objects.filter(
         external_order_id__isnull=True,
         synced_to_shopify=False,
@@ -104,17 +106,21 @@ def sync_unsynced_orders_to_shopify():
         payment_processor_charge_id__isnull=False,
     ).order_by(
         'customer__email',
-    )[:15]
+    )
 
+    if settings.SHOPIFY_ORDER_SYNC_BACKEND == 'graphql':
+        order_ids = [f'{order_id}' for order_id in unsynced_orders.values_list('id', flat=True).distinct()]
+        batch_size = ShopifyGraphQLClient.ORDERS_PER_REQUEST * 10
+        for index in range(0, len(order_ids), batch_size):
+            sync_orders_to_shopify_in_bulk.delay(order_ids[index:index + batch_size])
+        return f'Sent {len(order_ids)} unsynced orders to be synced to shopify'
+
+    # the Shopify client throttles itself against the store's call limit, so the whole backlog can be drained at once
     errors = []
-    for order in unsynced_orders:
-        if not settings.TESTING:
-            # todo: revisit whether these should be async
-            sleep(4)
+    # customers with several addresses join once per address
+    for order_id in unsynced_orders.values_list('id', flat=True).distinct().iterator():
         try:
-            sync_order_to_shopify(order.id)
-            if not settings.TESTING:
-                sleep(4)
+            sync_order_to_shopify(order_id)
         except Exception as e:
             errors.append(e)
 
@@ -127,24 +133,36 @@ def sync_unsynced_orders_to_shopify():
 @shared_task(soft_time_limit=60*60*1000)
 @celery_helpers.prevent_multiple
 def sync_unsynced_orders_to_tax_client():
-    from apps.orders.tasks.order import sync_order_to_tax_client
+    """
+    Records every paid, unsynced order to the tax client, a chunk at a time: each chunk is loaded with its related
+    rows in a few queries, its invoices are recorded concurrently and the recorded orders are marked as synced in bulk.
+    """
+    from apps.orders.tasks.order import _prefetch_orders_for_tax_client, _record_orders_to_tax_client
     Order = apps.get_model('orders', 'Order')
     unsynced_orders = Order.objects.filter(
         synced_to_avalara=False,
         payment_status=str(OrderPaymentStatusEnum.paid),
-    )[:50]
-
-    errors = []
-    for order in unsynced_orders:
-        try:
-            sync_order_to_tax_client(order.id)
-        except Exception as e:
-            errors.append(e)
+    ).order_by('id')
+
+    synced, errors = 0, []
+    last_id = None
+    while True:
+        chunk = unsynced_orders
+        if last_id:
+            chunk = chunk.filter(id__gt=last_id)
+        orders = list(_prefetch_orders_for_tax_client(chunk)[:TAX_SYNC_CHUNK_SIZE])
+        if not orders:
+            break
+        last_id = orders[-1].id
+
+        recorded_orders, chunk_errors = _record_orders_to_tax_client(orders)
+        errors.extend(chunk_errors)
+        synced += len(recorded_orders)
 
     if errors:
         raise Exception(errors)
 
-    return f'Synced {unsynced_orders.count()} orders to tax client'
+    return f'Synced {synced} orders to tax client'
 
 
 @app.task
@@ -3,6 +3,8 @@ import uuid
 from decimal import Decimal
 from unittest import mock
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
@@ -13,8 +15,9 @@ from apps.customers.tests.factories import CustomerFactory, CustomerChildFactory
 from apps.discounts.libs import DiscountRuleTypeEnum
 from apps.discounts.tests.factories.rule import RuleFactory
 from apps.orders.libs import CannotBuildOrderError, OrderPaymentStatusEnum
+from apps.discounts.models import CustomerDiscount
 from apps.discounts.tests.factories import DiscountFactory
-from apps.orders.tests.factories import OrderFactory, ShippingRateFactory
+from apps.orders.tests.factories import OrderFactory, OrderLineItemFactory, ShippingRateFactory
 from apps.products.tests.factories import ProductFactory
 
 
@@ -35,7 +38,12 @@ def _mock_calculate_tax(*args, **kwargs):
     }
 
 
+def _mock_quote_summaries(customer, address, summaries, deadline=None):
+    return [Decimal(0.0) for _ in summaries]
+
+
 @mock.patch('libs.tax_nexus.avalara.client.TaxProcessorClient.calculate_tax', side_effect=_mock_calculate_tax)
+@mock.patch('libs.tax_nexus.avalara.client.TaxProcessorClient.quote_summaries', side_effect=_mock_quote_summaries)
 @mock.patch('apps.orders.tasks.sync_order_to_tax_client', side_effect=lambda: None)
 @mock.patch('apps.orders.tasks.sync_refund_to_tax_client', side_effect=lambda: None)
 class OrderViewSetAPITestSuite(APITestCase):
@@ -52,12 +60,44 @@ class OrderViewSetAPITestSuite(APITestCase):
     def test_cannot_fetch_another_customers_orders(self, *args):
         url = reverse('order-list')
         response = self.client.get(f'{url}?customer={self.random_customer.id}')
-        self.assertEqual([], response.json())
+        self.assertEqual([], response.json()['results'])
 
     def test_can_fetch_orders_placed_by_customer(self, *args):
         url = reverse('order-list')
         response = self.client.get(f'{url}?customer={self.order.customer.id}')
-        self.assertNotEqual([], response.json())
+        self.assertNotEqual([], response.json()['results'])
+
+    def test_will_list_orders_in_a_constant_number_of_queries(self, *args):
+        url = reverse('order-list')
+        customer = CustomerFactory()
+
+        def _list():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f'{url}?customer={customer.id}')
+            return len(queries), response.json()['results']
+
+        OrderLineItemFactory(order=OrderFactory(customer=customer))
+        single_order_queries, _ = _list()
+        for _ in range(5):
+            OrderLineItemFactory.create_batch(3, order=OrderFactory(customer=customer))
+
+        queries, orders = _list()
+        self.assertEqual(len(orders), 6)
+        self.assertEqual(queries, single_order_queries)
+        self.assertEqual(set(orders[0]['orderLineItems'][0]['product']), {'id', 'title', 'imageUrl', 'productType'})
+
+    def test_will_paginate_orders_from_the_most_recent(self, *args):
+        url = reverse('order-list')
+        customer = CustomerFactory()
+        orders = OrderFactory.create_batch(3, customer=customer)
+
+        response = self.client.get(f'{url}?customer={customer.id}&page_size=2')
+        next_response = self.client.get(response.json()['next'])
+
+        self.assertEqual(
+            [order['id'] for order in response.json()['results'] + next_response.json()['results']],
+            [f'{order.id}' for order in sorted(orders, key=lambda order: order.created_at, reverse=True)],
+        )
 
     def test_cannot_create_order_without_customer_id(self, *args):
         url = reverse('order-list')
@@ -189,6 +229,31 @@ class OrderViewSetAPITestSuite(APITestCase):
         value = Decimal('0')
         self.assertGreater(response.json()['discounts'], value)
 
+    def test_order_summary_will_not_apply_discount_code(self, *args):
+        url = reverse('order-summary')
+        cart = CartFactory(customer=self.random_customer, customer_child__parent=self.random_customer)
+        CartLineItemFactory(quantity=12, cart=cart)
+        discount = DiscountFactory(discount_type='percentage', is_active=True)
+
+        self.client.get(f'{url}?customer={self.random_customer.id}&discount={discount.codename}')
+
+        self.assertFalse(CustomerDiscount.objects.filter(customer=self.random_customer).exists())
+
+    def test_order_summary_will_quote_taxes_of_all_carts_at_once(self, *args):
+        url = reverse('order-summary')
+        for _ in range(3):
+            cart = CartFactory(customer=self.random_customer, customer_child__parent=self.random_customer)
+            CartLineItemFactory(quantity=12, cart=cart)
+
+        with mock.patch(
+            'libs.tax_nexus.avalara.client.TaxProcessorClient.quote_summaries',
+            side_effect=lambda customer, address, summaries, deadline=None: [Decimal('1.5') for _ in summaries],
+        ) as mocked:
+            response = self.client.get(f'{url}?customer={self.random_customer.id}')
+
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(Decimal(f'{response.json()["taxes"]}'), Decimal('4.5'))
+
     def test_can_retrieve_latest_customer_order_when_customer_has_one_order(self, *args):
         customer = CustomerFactory()
         self.client.force_login(customer)
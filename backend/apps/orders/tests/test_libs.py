@@ -1,10 +1,15 @@
+import uuid
 from decimal import Decimal
 from unittest import mock
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from apps.addresses.tests.factories.location import LocationFactory
 from apps.billing.tests.factories.payment_method import PaymentMethodFactory
+from apps.carts.models import CartLineItem
 from apps.carts.tests.factories import CartFactory
 from apps.carts.tests.factories.cart_line_item import CartLineItemFactory
 from apps.customers.tests.factories import (
@@ -14,9 +19,18 @@ from apps.customers.tests.factories import (
 )
 from apps.discounts.libs import DiscountRuleTypeEnum
 from apps.discounts.tests.factories.rule import RuleFactory
-from apps.orders.libs import CannotBuildOrderError, OrderBuilder, PaymentCalculator
+from libs.payment_processors.exceptions import CouldNotProcessChargeError
+from apps.orders.libs import (
+    BulkOrderBuilder,
+    CannotBuildOrderError,
+    LineItemSnapshotDTO,
+    OrderBuilder,
+    OrderChargeEngine,
+    PaymentCalculator,
+)
 from apps.discounts.tests.factories import CustomerDiscountFactory, DiscountFactory
-from apps.orders.tests.factories import ShippingRateFactory
+from apps.orders.models import Order
+from apps.orders.tests.factories import OrderFactory, ShippingRateFactory
 from apps.products.tests.factories import ProductFactory, ProductVariantFactory
 
 
@@ -117,3 +131,239 @@ class OrderBuilderTestSuite(TestCase):
 
         calculated_amount_total = calculator.amount_total
         self.assertLess(calculated_amount_total, amount_before_applied_discount)
+
+
+class PaymentCalculatorSnapshotTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.shipping_rate = ShippingRateFactory(is_default=True)
+        self.line_item_snapshots = [
+            LineItemSnapshotDTO(quantity=12, price=Decimal('5.49'), title='recipe-1', product_type='recipe'),
+            LineItemSnapshotDTO(quantity=12, price=Decimal('5.49'), title='recipe-2', product_type='recipe'),
+            LineItemSnapshotDTO(quantity=1, price=Decimal('4.00'), title='add-on', product_type='snack'),
+        ]
+
+    def test_will_calculate_totals_from_snapshots_without_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            calculator = PaymentCalculator()\
+                .set_line_item_snapshots(self.line_item_snapshots)\
+                .set_shipping_rate(self.shipping_rate)\
+                .calculate()
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(calculator.number_of_servings, 24)
+        self.assertTrue(calculator.is_24_pack())
+        self.assertEqual(calculator.subtotal_amount, Decimal('5.49') * 24 + Decimal('4.00'))
+        self.assertEqual(calculator.discount_total_amount, Decimal('20'))
+
+    def test_will_match_totals_calculated_from_cart(self):
+        cart = CartFactory()
+        for _ in range(2):
+            CartLineItemFactory(cart=cart, product__product_type='recipe', quantity=12)
+        from_cart = PaymentCalculator.from_cart(cart)
+
+        with CaptureQueriesContext(connection) as queries:
+            from_snapshots = PaymentCalculator()\
+                .set_line_item_snapshots(from_cart.get_line_item_snapshots())\
+                .set_shipping_rate(from_cart.shipping_rate)\
+                .set_applied_discount(from_cart.applied_discount)\
+                .calculate()
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(from_snapshots.amount_total, from_cart.amount_total)
+
+
+class BulkOrderBuilderTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.shipping_rate = ShippingRateFactory(is_default=True)
+
+    def _create_subscription(self, with_payment_method: bool = True, with_address: bool = True):
+        customer = CustomerFactory()
+        child = CustomerChildFactory(parent=customer)
+        cart = CartFactory(customer=customer, customer_child=child)
+        CartLineItemFactory(cart=cart, product__is_recurring=True, product_variant__price=Decimal('4.69'), quantity=12)
+        CartLineItemFactory(cart=cart, product__is_recurring=False, product_variant__price=Decimal('4.69'), quantity=1)
+        if with_payment_method:
+            PaymentMethodFactory(customer=customer, is_valid=True, setup_for_future_charges=True)
+        if with_address:
+            LocationFactory(customer=customer)
+        return CustomerSubscriptionFactory(
+            customer=customer,
+            customer_child=child,
+            is_active=True,
+            next_order_charge_date=timezone.now().date(),
+        )
+
+    def test_will_create_one_order_per_subscription(self):
+        subscriptions = [self._create_subscription() for _ in range(3)]
+        builder = BulkOrderBuilder.from_subscription_ids([subscription.id for subscription in subscriptions])
+
+        self.assertEqual(len(builder.orders), 3)
+        self.assertEqual(Order.objects.filter(customer__in=[s.customer for s in subscriptions]).count(), 3)
+        for order in Order.objects.filter(customer__in=[s.customer for s in subscriptions]):
+            self.assertEqual(order.line_items.count(), 2)
+            self.assertEqual(order.history.count(), 1)
+            self.assertEqual(order.subtotal_amount, PaymentCalculator.from_order(order).subtotal_amount)
+            self.assertEqual(order.amount_total, PaymentCalculator.from_order(order).amount_total)
+
+    def test_will_advance_next_order_dates_and_remove_onetime_line_items(self):
+        subscription = self._create_subscription()
+        BulkOrderBuilder.from_subscription_ids([subscription.id])
+        subscription.refresh_from_db()
+
+        self.assertGreater(subscription.next_order_charge_date, timezone.now().date())
+        self.assertFalse(subscription.customer_child.cart.line_items.filter(product__is_recurring=False).exists())
+        self.assertTrue(subscription.customer_child.cart.line_items.filter(product__is_recurring=True).exists())
+        self.assertEqual(CartLineItem.history.filter(history_type='-').count(), 1)
+
+    def test_will_collect_errors_without_creating_orders_for_invalid_subscriptions(self):
+        valid_subscription = self._create_subscription()
+        subscription_without_payment_method = self._create_subscription(with_payment_method=False)
+        subscription_without_address = self._create_subscription(with_address=False)
+        builder = BulkOrderBuilder.from_subscription_ids([
+            valid_subscription.id,
+            subscription_without_payment_method.id,
+            subscription_without_address.id,
+        ])
+
+        self.assertEqual(len(builder.orders), 1)
+        self.assertEqual(len(builder.errors), 2)
+        self.assertTrue(all(isinstance(error, CannotBuildOrderError) for error in builder.errors))
+
+    def test_number_of_queries_does_not_grow_with_number_of_subscriptions(self):
+        subscription_ids = [self._create_subscription().id for _ in range(2)]
+        with CaptureQueriesContext(connection) as small_chunk:
+            BulkOrderBuilder.from_subscription_ids(subscription_ids)
+
+        subscription_ids = [self._create_subscription().id for _ in range(6)]
+        with CaptureQueriesContext(connection) as large_chunk:
+            BulkOrderBuilder.from_subscription_ids(subscription_ids)
+
+        self.assertEqual(len(small_chunk), len(large_chunk))
+
+    def test_will_not_create_duplicate_orders_when_rebuilt_for_the_same_charge_date(self):
+        subscription = self._create_subscription()
+        charge_date = subscription.next_order_charge_date
+        BulkOrderBuilder.from_subscription_ids([subscription.id], charge_date)
+        builder = BulkOrderBuilder.from_subscription_ids([subscription.id], charge_date)
+
+        self.assertEqual(len(builder.orders), 0)
+        self.assertEqual(Order.objects.filter(customer=subscription.customer).count(), 1)
+
+
+def _mock_charge(charge_data):
+    class MockProcessedCharge:
+        id = f'{uuid.uuid4()}'
+        status = 'succeeded'
+        amount = charge_data.dollar_amount_to_cents()
+
+    return MockProcessedCharge()
+
+
+def _mock_charge_error(*args, **kwargs):
+    raise CouldNotProcessChargeError('card declined')
+
+
+class OrderChargeEngineTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.orders = []
+        for _ in range(3):
+            subscription = CustomerSubscriptionFactory(is_active=True)
+            self.orders.append(OrderFactory(
+                customer=subscription.customer,
+                customer_child=subscription.customer_child,
+                payment_method__customer=subscription.customer,
+                applied_discount=None,
+                external_order_id=None,
+            ))
+
+    def test_will_charge_all_claimed_orders_and_record_their_charges(self):
+        with mock.patch(
+            'libs.payment_processors.stripe.client.PaymentProcessorClient.charge',
+            side_effect=_mock_charge,
+        ) as mocked:
+            with self.captureOnCommitCallbacks():
+                engine = OrderChargeEngine().charge_orders()
+
+        self.assertEqual(mocked.call_count, 3)
+        self.assertEqual(len(engine.charged_orders), 3)
+        for order in self.orders:
+            order.refresh_from_db()
+            self.assertEqual(order.payment_status, 'paid')
+            self.assertEqual(order.charged_amount, order.amount_total)
+            self.assertEqual(order.charge_attempts, 1)
+            self.assertTrue(order.payment_method.charges.filter(
+                payment_processor_charge_id=order.payment_processor_charge_id,
+            ).exists())
+
+    def test_will_send_a_deterministic_idempotency_key_per_attempt(self):
+        with mock.patch(
+            'libs.payment_processors.stripe.client.PaymentProcessorClient.charge',
+            side_effect=_mock_charge,
+        ) as mocked:
+            with self.captureOnCommitCallbacks():
+                OrderChargeEngine().charge_orders()
+
+        idempotency_keys = {call[0][0].idempotency_key for call in mocked.call_args_list}
+        self.assertEqual(idempotency_keys, {f'order-{order.id}-charge-attempt-1' for order in self.orders})
+
+    def test_will_record_failed_charges_and_keep_orders_pending(self):
+        with mock.patch(
+            'libs.payment_processors.stripe.client.PaymentProcessorClient.charge',
+            side_effect=_mock_charge_error,
+        ):
+            engine = OrderChargeEngine().charge_orders()
+
+        self.assertEqual(len(engine.failed_orders), 3)
+        for order in self.orders:
+            order.refresh_from_db()
+            self.assertEqual(order.payment_status, 'pending')
+            self.assertEqual(order.charge_attempts, 1)
+            self.assertEqual(order.charge_failure_message, 'card declined')
+
+    def test_will_mark_order_as_failed_after_max_charge_attempts(self):
+        order = self.orders[0]
+        order.charge_attempts = order.MAX_FAILED_ORDER_CHARGE_ATTEMPTS - 1
+        order.save()
+        with mock.patch(
+            'libs.payment_processors.stripe.client.PaymentProcessorClient.charge',
+            side_effect=_mock_charge_error,
+        ):
+            with self.captureOnCommitCallbacks():
+                OrderChargeEngine().charge_orders(Order.objects.filter(id=order.id))
+
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, 'failed')
+
+    def test_will_save_the_charges_of_a_batch_when_an_unexpected_error_occurs(self):
+        failing_order = min(self.orders, key=lambda order: order.created_at)
+
+        def _charge(charge_data):
+            if charge_data.idempotency_key.startswith(f'order-{failing_order.id}-'):
+                raise RuntimeError('invalid request')
+            return _mock_charge(charge_data)
+
+        with mock.patch(
+            'libs.payment_processors.stripe.client.PaymentProcessorClient.charge',
+            side_effect=_charge,
+        ):
+            with self.captureOnCommitCallbacks():
+                engine = OrderChargeEngine().charge_orders()
+
+        self.assertEqual(len(engine.charged_orders), 2)
+        self.assertEqual([order.id for order in engine.failed_orders], [failing_order.id])
+        failing_order.refresh_from_db()
+        self.assertEqual(failing_order.payment_status, 'pending')
+        self.assertEqual(failing_order.charge_failure_message, 'invalid request')
+        self.assertIsNone(failing_order.charge_claimed_at)
+
+    def test_will_not_claim_orders_claimed_by_another_engine(self):
+        Order.objects.filter(id=self.orders[0].id).update(charge_claimed_at=timezone.now())
+        with mock.patch(
+            'libs.payment_processors.stripe.client.PaymentProcessorClient.charge',
+            side_effect=_mock_charge,
+        ):
+            with self.captureOnCommitCallbacks():
+                engine = OrderChargeEngine().charge_orders()
+
+        self.assertNotIn(self.orders[0].id, {order.id for order in engine.claimed_orders})
+        self.assertEqual(len(engine.claimed_orders), 2)
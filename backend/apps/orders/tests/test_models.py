@@ -2,6 +2,7 @@ import uuid
 from decimal import Decimal
 from unittest import mock
 
+from django.db import connection
 from django.test import TestCase
 from django.utils import timezone
 from django_fsm import TransitionNotAllowed
@@ -11,6 +12,7 @@ from apps.billing.tests.factories.payment_method import PaymentMethodFactory
 from apps.customers.tests.factories import CustomerFactory, CustomerSubscriptionFactory
 from apps.discounts.tests.factories import CustomerDiscountFactory
 from apps.orders.libs import OrderPaymentStatusEnum
+from apps.orders.models import Order
 from apps.orders.tests.factories import OrderFactory
 from apps.orders.tests.factories.order_line_item import OrderLineItemFactory
 from apps.products.tests.factories import ProductFactory, ProductVariantFactory
@@ -217,3 +219,31 @@ def _create_charge(*args, **kwargs):
 #             OrderLineItemFactory(order=order, product=addon_product, product_variant=addon_variant, quantity=1)
 #
 #         self.assertFalse((order.is_24_pack()))
+
+
+class OrderWorkQueueIndexTestSuite(TestCase):
+    def setUp(self) -> None:
+        OrderFactory.create_batch(3, payment_status=str(OrderPaymentStatusEnum.paid), synced_to_avalara=True)
+        OrderFactory.create_batch(3, payment_status=str(OrderPaymentStatusEnum.paid), synced_to_avalara=False)
+
+    def _explain(self, queryset) -> str:
+        # tables are tiny in tests, make the planner show which index it can use instead of scanning them
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_avalara_scanner_will_use_its_partial_index(self):
+        plan = self._explain(Order.objects.filter(
+            synced_to_avalara=False,
+            payment_status=str(OrderPaymentStatusEnum.paid),
+        ).order_by('id'))
+
+        self.assertIn('order_avalara_sync_queue_idx', plan)
+
+    def test_charge_scanner_will_use_its_partial_index(self):
+        plan = self._explain(Order.objects.filter(
+            payment_status=str(OrderPaymentStatusEnum.pending),
+            payment_processor_charge_id__isnull=True,
+        ).order_by('created_at'))
+
+        self.assertIn('order_pending_payment_idx', plan)
@@ -3,6 +3,8 @@ from collections import namedtuple
 from decimal import Decimal
 from unittest import mock
 
+import requests
+
 from django.core import mail
 from django.test import TestCase, override_settings
 from django.utils import timezone
@@ -14,13 +16,21 @@ from apps.addresses.tests.factories.location import LocationFactory
 from apps.discounts.tests.factories import CustomerDiscountFactory
 from apps.orders.libs import OrderPaymentStatusEnum
 from apps.orders.models import Order
+from apps.orders.tasks.order import (
+    create_orders_for_subscription_shard,
+    report_subscription_order_errors,
+    sync_orders_to_shopify_in_bulk,
+)
 from apps.orders.tasks.recurring import (
     delete_pending_order,
     _charge_order,
     delete_pending_orders_for_non_subscribers,
+    sync_unsynced_orders_to_shopify,
+    sync_unsynced_orders_to_tax_client,
 )
 from libs.payment_processors.exceptions import CouldNotChargeOrderError
 from libs.shopify_api_client import CouldNotSyncRefundError
+from libs.shopify_graphql_client import ShopifyOrderSyncResultDTO
 
 from apps.billing.tests.factories import PaymentMethodFactory
 from apps.carts.tests.factories import CartFactory, CartLineItemFactory
@@ -37,7 +47,7 @@ from apps.orders.tasks import (
     sync_order_to_yotpo,
     sync_refund_to_yotpo,
 )
-from apps.orders.tests.factories import OrderFactory, OrderLineItemFactory
+from apps.orders.tests.factories import OrderFactory, OrderLineItemFactory, ShippingRateFactory
 from apps.products.tests.factories import ProductFactory
 
 
@@ -177,6 +187,66 @@ class OrderSyncToShopifyTestSuite(TestCase):
                 sync_refunded_order_to_shopify(self.order.id)
 
 
+class UnsyncedOrdersToShopifyTestSuite(TestCase):
+    @override_settings(SHOPIFY_ORDER_SYNC_BACKEND='rest')
+    def test_will_sync_orders_of_customers_with_several_addresses_once(self):
+        order = OrderFactory(
+            payment_status=str(OrderPaymentStatusEnum.paid),
+            synced_to_shopify=False,
+            order_number=None,
+            external_order_id=None,
+            shipping_rate=ShippingRateFactory(),
+            payment_processor_charge_id='some-charge-id',
+        )
+        LocationFactory(customer=order.customer)
+        LocationFactory(customer=order.customer)
+
+        with mock.patch('apps.orders.tasks.order.sync_order_to_shopify') as mocked:
+            sync_unsynced_orders_to_shopify()
+
+        mocked.assert_called_once_with(order.id)
+
+
+class OrderBulkSyncToShopifyTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.orders = []
+        for _ in range(2):
+            order = OrderFactory(
+                payment_status=str(OrderPaymentStatusEnum.paid),
+                synced_to_shopify=False,
+                order_number=None,
+                external_order_id=None,
+                payment_processor_charge_id='some-charge-id',
+            )
+            LocationFactory(customer=order.customer)
+            self.orders.append(order)
+
+    def test_will_keep_the_orders_synced_before_a_failed_request(self):
+        results = [
+            lambda orders: [ShopifyOrderSyncResultDTO(order_id=f'{orders[0].id}', external_order_id='1001')],
+            MockedException(),
+        ]
+
+        def _create_orders(orders):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result(orders)
+
+        with mock.patch('libs.shopify_graphql_client.ShopifyGraphQLClient.ORDERS_PER_REQUEST', 1):
+            with mock.patch(
+                'libs.shopify_graphql_client.ShopifyGraphQLClient.create_orders',
+                side_effect=_create_orders,
+            ):
+                with self.assertRaises(MockedException):
+                    sync_orders_to_shopify_in_bulk([f'{order.id}' for order in self.orders])
+
+        self.assertEqual(
+            list(Order.objects.filter(synced_to_shopify=True).values_list('external_order_id', flat=True)),
+            ['1001'],
+        )
+
+
 class OrderTaskTestSuite(TestCase):
     def setUp(self) -> None:
         self.customer = CustomerFactory()
@@ -324,3 +394,106 @@ class OrderSyncToYotpoTestSuite(TestCase):
             sync_refund_to_yotpo(order.id)
 
         self.assertFalse(mocked.called)
+
+
+class RenewalOrderShardTestSuite(TestCase):
+    def setUp(self) -> None:
+        ShippingRateFactory(is_default=True)
+        self.today = timezone.now().date()
+        self.subscriptions = []
+        for _ in range(3):
+            customer = CustomerFactory()
+            child = CustomerChildFactory(parent=customer)
+            cart = CartFactory(customer=customer, customer_child=child)
+            CartLineItemFactory(cart=cart, product__is_recurring=True, quantity=12)
+            PaymentMethodFactory(customer=customer, is_valid=True, setup_for_future_charges=True)
+            LocationFactory(customer=customer)
+            self.subscriptions.append(CustomerSubscriptionFactory(
+                customer=customer,
+                customer_child=child,
+                is_active=True,
+                next_order_charge_date=self.today,
+            ))
+
+    def test_will_dispatch_a_shard_per_chunk_of_due_subscriptions(self):
+        with mock.patch('apps.orders.libs.BulkOrderBuilder.CHUNK_SIZE', 2):
+            with mock.patch('apps.orders.tasks.recurring.chord') as mocked:
+                create_new_orders_for_active_subscribers()
+
+        shards = mocked.call_args[0][0]
+        self.assertEqual(len(shards), 2)
+        shard_subscription_ids = [subscription_id for shard in shards for subscription_id in shard.args[0]]
+        self.assertCountEqual(shard_subscription_ids, [str(subscription.id) for subscription in self.subscriptions])
+
+    def test_retried_shard_will_not_create_duplicate_orders(self):
+        subscription_ids = [str(subscription.id) for subscription in self.subscriptions]
+        create_orders_for_subscription_shard(subscription_ids, self.today.isoformat())
+        create_orders_for_subscription_shard(subscription_ids, self.today.isoformat())
+
+        self.assertEqual(Order.objects.filter(customer_child__subscription__in=self.subscriptions).count(), 3)
+
+    def test_will_aggregate_errors_from_all_shards(self):
+        result = report_subscription_order_errors([['error one'], [], ['error two']], self.today.isoformat())
+
+        self.assertIn('2 errors', result)
+
+
+class TaxClientBatchSyncTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.orders = []
+        for _ in range(3):
+            order = OrderFactory(payment_status=str(OrderPaymentStatusEnum.paid), synced_to_avalara=False)
+            LocationFactory(customer=order.customer)
+            OrderLineItemFactory(order=order)
+            self.orders.append(order)
+
+    def _sync(self, create_transaction_side_effect):
+        with mock.patch('apps.orders.tasks.recurring.TAX_SYNC_CHUNK_SIZE', 2):
+            with mock.patch(
+                'libs.tax_nexus.avalara.AvalaraClient.resolve_address_post',
+                return_value=mock.Mock(status_code=200, json=lambda: {'validatedAddresses': [{}]}),
+            ):
+                with mock.patch(
+                    'libs.tax_nexus.avalara.AvalaraClient.create_transaction',
+                    side_effect=create_transaction_side_effect,
+                ) as mocked:
+                    sync_unsynced_orders_to_tax_client()
+        return mocked
+
+    def test_will_record_every_unsynced_order_across_chunks(self):
+        mocked = self._sync(lambda *args, **kwargs: mock.Mock(status_code=201, json=lambda: {'totalTax': 1}))
+
+        self.assertEqual(mocked.call_count, 3)
+        self.assertFalse(Order.objects.filter(id__in=[order.id for order in self.orders], synced_to_avalara=False))
+
+    def test_will_only_mark_recorded_orders_as_synced(self):
+        failed_order_code = str(self.orders[0].id)
+
+        def _create_transaction(data, *args, **kwargs):
+            if data['code'] == failed_order_code:
+                return mock.Mock(status_code=400, json=lambda: {'error': {'message': 'Invalid'}})
+            return mock.Mock(status_code=201, json=lambda: {'totalTax': 1})
+
+        with self.assertRaises(Exception):
+            self._sync(_create_transaction)
+
+        self.assertEqual(
+            list(Order.objects.filter(synced_to_avalara=False).values_list('id', flat=True)),
+            [self.orders[0].id],
+        )
+
+    def test_will_mark_recorded_orders_as_synced_when_another_order_cannot_reach_avalara(self):
+        failed_order_code = str(self.orders[0].id)
+
+        def _create_transaction(data, *args, **kwargs):
+            if data['code'] == failed_order_code:
+                raise requests.ConnectionError('Connection reset')
+            return mock.Mock(status_code=201, json=lambda: {'totalTax': 1})
+
+        with self.assertRaises(Exception):
+            self._sync(_create_transaction)
+
+        self.assertEqual(
+            list(Order.objects.filter(synced_to_avalara=False).values_list('id', flat=True)),
+            [self.orders[0].id],
+        )
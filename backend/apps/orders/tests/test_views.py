@@ -0,0 +1,64 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from apps.customers.models import Customer
+from apps.customers.tests.factories import CustomerFactory
+from apps.orders.models import Order, OrderLineItem
+from apps.orders.tests.factories import OrderFactory
+from apps.orders.views import create_line_items_from_rows
+from apps.products.tests.factories import ProductVariantFactory
+
+
+class ShopifyOrderImportTestSuite(TestCase):
+    def setUp(self):
+        self.variant = ProductVariantFactory()
+        self.another_variant = ProductVariantFactory()
+
+    def _build_row(self, **kwargs):
+        return {
+            'Id': 'shopify-order-1',
+            'Email': 'buyer@example.com',
+            'Shipping Name': 'Jane Doe',
+            'Lineitem sku': self.variant.sku_id,
+            'Lineitem quantity': '2',
+            'Tags': 'subscription first-order',
+            'Total': '40.00',
+            'Taxes': '2.00',
+            'Financial Status': 'pending',
+            'Name': '#1001',
+            'Fulfillment Status': 'unfulfilled',
+            'Paid at': '',
+            **kwargs,
+        }
+
+    def test_will_import_an_order_with_all_its_line_items(self):
+        with mock.patch('apps.customers.tasks.imports.create_loyalty_customer'):
+            create_line_items_from_rows([
+                self._build_row(),
+                self._build_row(**{'Lineitem sku': self.another_variant.sku_id, 'Total': '', 'Taxes': ''}),
+                self._build_row(**{'Lineitem sku': 'unknown-sku'}),
+            ])
+
+        customer = Customer.objects.get(email='buyer@example.com')
+        self.assertEqual(customer.status, 'subscriber')
+        order = Order.objects.get(external_order_id='shopify-order-1')
+        self.assertEqual(order.customer, customer)
+        self.assertEqual(order.order_number, '1001')
+        self.assertEqual(order.fulfillment_status, 'pending')
+        self.assertEqual(
+            set(OrderLineItem.objects.filter(order=order).values_list('product_variant_id', flat=True)),
+            {self.variant.id, self.another_variant.id},
+        )
+        self.assertEqual(customer.children.get().cart.line_items.count(), 2)
+
+    def test_will_update_existing_orders_in_place(self):
+        customer = CustomerFactory(email='buyer@example.com')
+        order = OrderFactory(customer=customer, external_order_id='shopify-order-1', tags=None)
+
+        create_line_items_from_rows([self._build_row(**{'Email': 'Buyer@Example.com'})])
+
+        order.refresh_from_db()
+        self.assertEqual(order.tags, ['subscription', 'first-order'])
+        self.assertEqual(Order.objects.filter(external_order_id='shopify-order-1').count(), 1)
+        self.assertEqual(Customer.objects.filter(email__iexact='buyer@example.com').count(), 1)
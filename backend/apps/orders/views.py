@@ -1,118 +1,202 @@
-import csv
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Iterable, List
 
 from django.apps import apps
 from django.contrib.admin.views.decorators import staff_member_required
+from django.utils import timezone
 from django.utils.decorators import method_decorator
-from apps.core.views import CoreUploadCSVView
-from celery_app import app
-
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
-@app.task
-def _create_order_line_item_with_data(data: Dict):
+from apps.core.views import CoreUploadCSVView
+from apps.customers.tasks.imports import (
+    create_customers,
+    create_subscriptions,
+    email_lookup_key,
+    get_customers_by_email,
+    get_first_children,
+    get_or_create_cart_line_items,
+    get_or_create_carts,
+    update_customers,
+)
+
+
+ORDER_IMPORT_FIELDS = [
+    'external_order_id',
+    'tags',
+    'amount_total',
+    'charged_amount',
+    'tax_total',
+    'payment_status',
+    'order_number',
+    'fulfillment_status',
+    'charged_at',
+]
+
+
+def _update_order_with_data(order: 'Order', data: Dict):
+    order.external_order_id = data['Id']
+    if data['Tags']:
+        order.tags = data['Tags'].split()
+    if data['Total']:
+        order.amount_total = data.get("Total", 0) if len(data['Total']) else 0
+        order.charged_amount = data.get("Total", 0) if len(data['Total']) else 0
+    if data['Taxes']:
+        order.tax_total = data.get("Taxes", 0) if len(data['Taxes']) else 0
+    if data['Financial Status']:
+        order.payment_status = data['Financial Status']
+    if data['Name']:
+        order.order_number = data['Name'].replace('#', '')
+    if data['Fulfillment Status']:
+        order.fulfillment_status = data['Fulfillment Status']
+    if data['Paid at']:
+        order.charged_at = datetime.strptime(data['Paid at'], '%Y-%m-%d %H:%M:%S %z')
+    order.fulfillment_status = 'pending' if data['Fulfillment Status'] == 'unfulfilled' else \
+        data['Fulfillment Status']
+
+
+def _save_imported_orders(orders: Iterable['Order']):
+    Order = apps.get_model('orders', 'Order')
+    new_orders = []
+    updated_orders = []
+    for order in orders:
+        if order.is_new():
+            new_orders.append(order)
+        elif {'payment_status', 'refunded_at'}.intersection(order.get_dirty_fields()):
+            # payment changes have side effects (confirmation emails, refunds...), only `Order.save` knows about them
+            order.save()
+        elif order.is_dirty():
+            order.modified_at = timezone.now()
+            updated_orders.append(order)
+
+    # new orders have no payment side effects, `Order.save` only publishes them for payment status changes
+    bulk_create_with_history(new_orders, Order)
+    bulk_update_with_history(updated_orders, Order, fields=[*ORDER_IMPORT_FIELDS, 'modified_at'])
+
+
+def create_line_items_from_rows(rows: List[Dict]):
+    """
+    Imports a chunk of a Shopify orders export (one row per order line item). Customers, children, carts, orders and
+    variants of the chunk are loaded up front and rows are resolved in memory, then everything is written in bulk.
+    """
     Order = apps.get_model('orders', 'Order')
     Customer = apps.get_model('customers', 'Customer')
     CustomerChild = apps.get_model('customers', 'CustomerChild')
     OrderLineItem = apps.get_model('orders', 'OrderLineItem')
     ProductVariant = apps.get_model('products', 'ProductVariant')
-    Cart = apps.get_model('carts', 'Cart')
     CartLineItem = apps.get_model('carts', 'CartLineItem')
     CustomerSubscription = apps.get_model('customers', 'CustomerSubscription')
-    try:
-        variant = ProductVariant.objects.get(sku_id=data['Lineitem sku'])
 
-        try:
-            customer = Customer.objects.get(email__iexact=data['Email'])
-        except Customer.DoesNotExist:
-            customer, _ = Customer.objects.get_or_create(
+    variants = {}
+    for variant in ProductVariant.objects.filter(sku_id__in={line['Lineitem sku'] for line in rows}).order_by('id'):
+        variants.setdefault(variant.sku_id, variant)
+    customers = get_customers_by_email(line['Email'] for line in rows)
+    orders = {}
+    for order in Order.objects.filter(external_order_id__in={line['Id'] for line in rows}).order_by('id'):
+        orders.setdefault(order.external_order_id, order)
+
+    rows_to_import = []
+    new_customers = {}
+    for data in rows:
+        if data['Lineitem sku'] not in variants:
+            print("Could not find product with sku", data['Lineitem sku'])
+            continue
+
+        key = email_lookup_key(data['Email'])
+        if key in customers and not customers[key]:
+            print(f'{data["Email"]} is shared by several customers, skipping order {data["Id"]}')
+            continue
+        if key not in customers:
+            customers[key] = new_customers[key] = Customer(
                 last_name=data['Shipping Name'].split(' ')[1],
                 first_name=data['Shipping Name'].split(' ')[0],
                 email=data['Email'],
             )
-
-        customer_child = customer.children.first()
-        if not customer_child:
-            customer_child, _ = CustomerChild.objects.get_or_create(
-                parent=customer,
-                first_name=f'{customer.first_name}\' Little One',
-            )
-
-        cart, _ = Cart.objects.get_or_create(
-            customer=customer,
-            customer_child=customer_child,
-        )
-        CartLineItem.objects.get_or_create(
-            cart=cart,
-            product_variant=variant,
-            product=variant.product,
-            defaults={'quantity': data['Lineitem quantity']},
-        )
-
-        try:
-            order = Order.objects.get(
-                external_order_id=data['Id'],
-            )
-        except Order.DoesNotExist:
-            order = Order(
-                customer=customer,
-                customer_child=customer.children.first(),
-            )
+        rows_to_import.append(data)
+
+    children = get_first_children(customer.id for customer in customers.values() if customer)
+    new_children = []
+    for data in rows_to_import:
+        customer = customers[email_lookup_key(data['Email'])]
+        if customer.id not in children:
+            children[customer.id] = CustomerChild(parent=customer, first_name=f'{customer.first_name}\' Little One')
+            new_children.append(children[customer.id])
+
+    active_subscriber_ids = set(CustomerSubscription.objects.filter(
+        customer__in=[customer for customer in customers.values() if customer and not customer.is_new()],
+        is_active=True,
+    ).values_list('customer_id', flat=True))
+    subscribed_child_ids = set(CustomerSubscription.objects.filter(
+        customer_child__in=[child for child in children.values() if not child.is_new()],
+    ).values_list('customer_child_id', flat=True))
+
+    subscribers = {}
+    cart_line_items = []
+    new_subscriptions = []
+    order_line_items = []
+    for data in rows_to_import:
+        variant = variants[data['Lineitem sku']]
+        customer = customers[email_lookup_key(data['Email'])]
+        customer_child = children[customer.id]
+        cart_line_items.append((customer_child, variant, data['Lineitem quantity']))
+
+        order = orders.get(data['Id'])
+        if not order:
+            order = orders[data['Id']] = Order(customer=customer, customer_child=customer_child)
             customer.has_active_subscriptions = True
             customer.status = 'subscriber'
-            customer.save()
-
-        order.external_order_id = data['Id']
-        if data['Tags']:
-            order.tags = data['Tags'].split()
-        if data['Total']:
-            order.amount_total = data.get("Total", 0) if len(data['Total']) else 0
-            order.charged_amount = data.get("Total", 0) if len(data['Total']) else 0
-        if data['Taxes']:
-            order.tax_total = data.get("Taxes", 0) if len(data['Taxes']) else 0
-        if data['Financial Status']:
-            order.payment_status = data['Financial Status']
-        if data['Name']:
-            order.order_number = data['Name'].replace('#', '')
-        if data['Fulfillment Status']:
-            order.fulfillment_status = data['Fulfillment Status']
-        if data['Paid at']:
-            order.charged_at = datetime.strptime(data['Paid at'], '%Y-%m-%d %H:%M:%S %z')
-        order.fulfillment_status = 'pending' if data['Fulfillment Status'] == 'unfulfilled' else \
-            data['Fulfillment Status']
-
-        order.save()
-        if order.charged_at and not customer.active_subscriptions().count():
-            CustomerSubscription.objects.create(
-                customer=order.customer,
-                customer_child=order.customer_child,
+            subscribers[customer.id] = customer
+        _update_order_with_data(order, data)
+
+        if (
+            order.charged_at and
+            order.customer_id not in active_subscriber_ids and
+            order.customer_child_id not in subscribed_child_ids
+        ):
+            active_subscriber_ids.add(order.customer_id)
+            subscribed_child_ids.add(order.customer_child_id)
+            new_subscriptions.append(CustomerSubscription(
+                customer_id=order.customer_id,
+                customer_child_id=order.customer_child_id,
                 is_active=True,
                 status='active',
-            )
+            ))
 
-        OrderLineItem.objects.get_or_create(
+        order_line_items.append(OrderLineItem(
             product_variant=variant,
-            product=variant.product,
+            product_id=variant.product_id,
             order=order,
-            defaults={
-                'quantity': data['Lineitem quantity'],
-            }
-        )
-    except ProductVariant.DoesNotExist:
-        print("Could not find product with sku", data['Lineitem sku'])
-
-
-@app.task
-def create_line_items(decoded_file):
-    reader = csv.DictReader(decoded_file)
-    for line in reader:
-        _create_order_line_item_with_data(line)
+            quantity=data['Lineitem quantity'],
+        ))
+
+    updated_customers = [customer for customer in subscribers.values() if not customer.is_new() and customer.is_dirty()]
+    create_customers(list(new_customers.values()))
+    update_customers(updated_customers, fields=['has_active_subscriptions', 'status'])
+    bulk_create_with_history(new_children, CustomerChild)
+    carts = get_or_create_carts(children.values())
+    get_or_create_cart_line_items([
+        CartLineItem(cart=carts[child.id], product_variant=variant, product_id=variant.product_id, quantity=quantity)
+        for child, variant, quantity in cart_line_items
+    ])
+
+    _save_imported_orders(orders.values())
+    create_subscriptions(new_subscriptions)
+
+    existing_order_line_items = set(OrderLineItem.objects.filter(
+        order__in=list(orders.values()),
+    ).values_list('order_id', 'product_variant_id', 'product_id'))
+    new_order_line_items = []
+    for line_item in order_line_items:
+        key = (line_item.order_id, line_item.product_variant_id, line_item.product_id)
+        if key not in existing_order_line_items:
+            existing_order_line_items.add(key)
+            new_order_line_items.append(line_item)
+    bulk_create_with_history(new_order_line_items, OrderLineItem)
 
 
 @method_decorator(staff_member_required, name='dispatch')
 class UploadShopifyOrdersCSVView(CoreUploadCSVView):
     template_name = 'upload_orders_from_shopify.html'
-    async_function = create_line_items
+    import_handler = 'apps.orders.views.create_line_items_from_rows'
     view_name = 'upload-order-csv'
 
 
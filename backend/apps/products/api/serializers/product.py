@@ -28,13 +28,20 @@ class ProductReadOnlySerializer(serializers.ModelSerializer):
 
     def get_ingredients(self, obj):
         from apps.recipes.api.serializers.ingredient import IngredientReadOnlySerializer
-        return [IngredientReadOnlySerializer(obj.ingredient).data for obj.ingredient in obj.ingredients.filter()]
+        return IngredientReadOnlySerializer(obj.ingredients.all(), many=True).data
 
     def get_variants(self, obj):
-        return [ProductVariantReadOnlySerializer(variant).data for variant in obj.variants.filter()]
+        return ProductVariantReadOnlySerializer(obj.variants.all(), many=True).data
 
-    def get_variants(self, obj):
-        return [ProductVariantReadOnlySerializer(variant).data for variant in obj.variants.filter()]
+
+class ProductReferenceSerializer(serializers.ModelSerializer):
+    """
+    Flat reference to a product, for payloads listing many products that don't need their ingredients and variants.
+    """
+    class Meta:
+        model = Product
+        fields = 'id', 'title', 'image_url', 'product_type',
+        read_only_fields = fields
 
 
 class ProductVariantReadOnlySerializer(serializers.ModelSerializer):
@@ -1,19 +1,28 @@
-from rest_framework import viewsets
+import hashlib
+from typing import Dict, List, Union
+
+from django.utils.http import parse_etags
+from rest_framework import status, viewsets
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
 
 from apps.customers.models import CustomerSubscription
 from apps.products.api.serializers import ProductReadOnlySerializer
+from apps.products.libs import ProductCatalog
 from apps.products.models import Product
 
 
 class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Contains the api endpoints for Readonly actions on Products.
+
+    Payloads are served from the `ProductCatalog` cache, tagged with an ETag that changes along with the catalog
+    version so clients can revalidate them with `If-None-Match`.
     """
     queryset = Product.objects.filter()
     serializer_class = ProductReadOnlySerializer
 
-    def get_queryset(self):
-        q = super().get_queryset()
+    def get_catalog_filters(self) -> Dict:
         filters = {}
         # supported query args
         if self.request.query_params.get('product_type'):
@@ -21,9 +30,35 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         if self.request.query_params.get('is_active'):
             filters['is_active'] = self.request.query_params.get('is_active') == 'true'
         if self.request.query_params.get('child'):
-            subscription = CustomerSubscription.objects.get(customer_child_id=self.request.query_params.get('child'))
-            filters['variants__sku_id__icontains'] = subscription.number_of_servings
+            filters['number_of_servings'] = CustomerSubscription.objects.values_list(
+                'number_of_servings',
+                flat=True,
+            ).get(customer_child_id=self.request.query_params.get('child'))
+        return filters
+
+    def get_etag(self, filters: Dict) -> str:
+        cache_key = ProductCatalog.get_cache_key(filters)
+        return '"%s"' % hashlib.sha256(f'{cache_key}-{self.request.get_full_path()}'.encode('utf-8')).hexdigest()
+
+    def get_catalog_response(self, etag: str, data: Union[Dict, List[Dict]]) -> Response:
+        if etag in parse_etags(self.request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        filters = self.get_catalog_filters()
+        etag = self.get_etag(filters)
+        return self.get_catalog_response(etag, ProductCatalog.get(**filters))
 
-        q = q.filter(**filters)
-        
-        return q
+    def retrieve(self, request, *args, **kwargs):
+        filters = self.get_catalog_filters()
+        etag = self.get_etag(filters)
+        product_id = str(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        for product in ProductCatalog.get(**filters):
+            if product['id'] == product_id:
+                return self.get_catalog_response(etag, product)
+        raise NotFound()
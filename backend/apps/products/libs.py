@@ -1,11 +1,17 @@
+import hashlib
 from abc import abstractmethod
 from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Union
+from uuid import uuid4
 
 from dataclasses_json import dataclass_json
 from django.apps import apps
+from django.core.cache import cache
 from sentry_sdk.utils import logger
 from django.conf import settings
 
+from apps.fulfillment.libs import ZipcodeLookup
+
 
 class ProductTypeEnum:
     recipe = 'recipe'
@@ -20,6 +26,107 @@ class MealPlanRecipeDTO:
     contains_allergen: bool
 
 
+class RecipeCatalog:
+    """
+    Cached snapshot of the active recipes, each serialized with `ProductReadOnlySerializer` along with the lowercased
+    names of its ingredients and the locations of its fulfillment centers, so allergens and zipcodes can be matched
+    in memory.
+
+    Snapshots are cached per catalog version, which is moved forward (see `invalidate`) whenever a `Product`,
+    `ProductVariant`, `Ingredient` or `FulfillmentCenter` is saved.
+    """
+    VERSION_CACHE_KEY = 'recipe-catalog-version'
+
+    @classmethod
+    def invalidate(cls):
+        cache.set(cls.VERSION_CACHE_KEY, uuid4().hex, None)
+
+    @classmethod
+    def _get_cache_key(cls) -> str:
+        version = cache.get(cls.VERSION_CACHE_KEY, '0')
+        return f'recipe-catalog-{version}'
+
+    @staticmethod
+    def _build() -> List[Dict]:
+        from apps.products.api.serializers import ProductReadOnlySerializer
+
+        Product = apps.get_model('products', 'Product')
+        recipes = Product.objects.filter(
+            product_type=ProductTypeEnum.recipe,
+            is_active=True,
+        ).prefetch_related('ingredients', 'variants', 'fulfillment_centers').order_by('title')
+        return [
+            {
+                'recipe_id': f'{recipe.id}',
+                'title': recipe.title,
+                'ingredient_names': [ingredient.name.lower() for ingredient in recipe.ingredients.all()],
+                'fulfillment_centers': [center.location for center in recipe.fulfillment_centers.all()],
+                'product': ProductReadOnlySerializer(recipe).data,
+            } for recipe in recipes
+        ]
+
+    @classmethod
+    def get(cls, fulfillment_centers: Union[None, FrozenSet[str]] = None) -> List[Dict]:
+        """
+        Recipes available from any of `fulfillment_centers`, or every recipe when `None`.
+        """
+        cache_key = cls._get_cache_key()
+        catalog = cache.get(cache_key)
+        if catalog is None:
+            catalog = cls._build()
+            cache.set(cache_key, catalog, settings.RECIPE_CATALOG_CACHE_TIMEOUT)
+        if fulfillment_centers is None:
+            return catalog
+        return [recipe for recipe in catalog if not fulfillment_centers.isdisjoint(recipe['fulfillment_centers'])]
+
+
+class ProductCatalog:
+    """
+    Cached payloads of the products API: every product matching a set of filters, serialized with
+    `ProductReadOnlySerializer` in a single prefetched pass.
+
+    Shares its version with `RecipeCatalog`, so both are invalidated together whenever a `Product`, `ProductVariant`,
+    `Ingredient` or `FulfillmentCenter` is saved.
+    """
+    @staticmethod
+    def get_cache_key(filters: Dict) -> str:
+        version = cache.get(RecipeCatalog.VERSION_CACHE_KEY, '0')
+        filters_hash = hashlib.sha256(repr(sorted(filters.items())).encode('utf-8')).hexdigest()
+        return f'product-catalog-{version}-{filters_hash}'
+
+    @staticmethod
+    def _build(product_type: str = None, is_active: bool = None, number_of_servings: int = None) -> List[Dict]:
+        from apps.products.api.serializers import ProductReadOnlySerializer
+
+        Product = apps.get_model('products', 'Product')
+        ProductVariant = apps.get_model('products', 'ProductVariant')
+        products = Product.objects.filter()
+        if product_type:
+            products = products.filter(product_type=product_type)
+        if is_active is not None:
+            products = products.filter(is_active=is_active)
+        if number_of_servings:
+            # a subquery rather than a join, so products with several matching variants are only listed once
+            products = products.filter(id__in=ProductVariant.objects.filter(
+                sku_id__icontains=number_of_servings,
+            ).values('product_id'))
+
+        return ProductReadOnlySerializer(products.prefetch_related('ingredients', 'variants'), many=True).data
+
+    @classmethod
+    def get(cls, **filters) -> List[Dict]:
+        cache_key = cls.get_cache_key(filters)
+        catalog = cache.get(cache_key)
+        if catalog is None:
+            catalog = cls._build(**filters)
+            cache.set(cache_key, catalog, settings.PRODUCT_CATALOG_CACHE_TIMEOUT)
+        return catalog
+
+    @classmethod
+    def get_products_by_id(cls, **filters) -> Dict[str, Dict]:
+        return {product['id']: product for product in cls.get(**filters)}
+
+
 class BaseMealPlanRecommendationStrategy:
     def __init__(self, child: 'CustomerChild'):
         self.child = child
@@ -31,26 +138,30 @@ class BaseMealPlanRecommendationStrategy:
 
 
 class GetRecipesByZipcodeMixin:
+    def get_fulfillment_center_locations(self) -> Union[None, FrozenSet[str]]:
+        """
+        Locations of the fulfillment centers serving the customer's zipcode, `None` when every recipe is available.
+        """
+        zipcodes = self.child.parent.addresses.values_list('zipcode', flat=True)[:1]
+
+        # If we don't have a location, return all recipes
+        if len(zipcodes):
+            fulfillment_centers = ZipcodeLookup.get_locations(zipcodes[0])
+            if fulfillment_centers is None:
+                logger.error(f'No fulfillment center zipcode matches {zipcodes[0]}')
+            return fulfillment_centers
+        return None
+
     def get_recipes_by_zipcode(self):
-        location = self.child.parent.addresses.filter()
         Product = apps.get_model('products', 'Product')
         query = {
             'product_type': ProductTypeEnum.recipe,
             'is_active': True,
         }
 
-        # If we don't have a location, return all recipes
-        if len(location):
-            zipcode = location[0].zipcode
-            FulfillmentCenterZipcode = apps.get_model('fulfillment', 'FulfillmentCenterZipcode')
-            try:
-                fulfillment_centers = {
-                    warehouse.location for warehouse in FulfillmentCenterZipcode.objects
-                    .get(zipcode=zipcode).warehouses.filter()
-                }
-                query['fulfillment_centers__location__in'] = fulfillment_centers
-            except FulfillmentCenterZipcode.DoesNotExist as e:
-                logger.error(e)
+        fulfillment_centers = self.get_fulfillment_center_locations()
+        if fulfillment_centers is not None:
+            query['fulfillment_centers__location__in'] = fulfillment_centers
         return Product.objects.filter(**query).order_by('title')
 
     def get_recipes(self):
@@ -63,6 +174,11 @@ class GetRecipesByZipcodeMixin:
             is_active=True,
         ).order_by('title')
 
+    def get_recipe_catalog(self) -> List[Dict]:
+        if settings.FILTER_RECIPES_BY_ZIPCODE:
+            return RecipeCatalog.get(self.get_fulfillment_center_locations())
+        return RecipeCatalog.get()
+
 
 class DisplayAllMealPlansRecommendationStrategy(BaseMealPlanRecommendationStrategy, GetRecipesByZipcodeMixin):
     def __init__(self, child: 'CustomerChild'):
@@ -71,33 +187,36 @@ class DisplayAllMealPlansRecommendationStrategy(BaseMealPlanRecommendationStrate
         self.TINY_BEGINNINGS_TAG_LIST = ['tiny-beginnings']
 
     def _get_child_cart_line_item_id_set(self):
-        Cart = apps.get_model('carts', 'Cart')
         CartLineItem = apps.get_model('carts', 'CartLineItem')
-        child_cart = Cart.objects.get(customer_child=self.child)
-        child_cart_line_items = CartLineItem.objects.filter(cart=child_cart)
-        return set([item.product.id for item in child_cart_line_items])
+        return {
+            f'{product_id}' for product_id in CartLineItem.objects.filter(
+                cart__customer_child=self.child,
+            ).values_list('product_id', flat=True)
+        }
 
-    def execute(self):
-        from apps.products.api.serializers import ProductReadOnlySerializer
+    def _get_child_allergy_names(self):
+        return [name.lower() for name in self.child.allergies.values_list('name', flat=True)]
 
-        child_cart_product_id_set = self._get_child_cart_line_item_id_set()
-        for recipe in self.get_recipes():
+    @staticmethod
+    def _contains_allergen(ingredient_names: List[str], allergy_names: List[str]) -> bool:
+        # an ingredient is an allergen when its name is part of one of the child's allergies (case insensitive)
+        return any(
+            ingredient_name in allergy_name for ingredient_name in ingredient_names for allergy_name in allergy_names
+        )
 
-            recipe_ingredients_list = recipe.ingredients.filter().values_list('name', flat=True)
-            allergens_found = False
-            for allergy_name in recipe_ingredients_list:
-                if self.child.allergies.filter(
-                    name__icontains=allergy_name,
-                ).exists():
-                    allergens_found = True
+    def execute(self):
+        child_cart_product_id_set = self._get_child_cart_line_item_id_set()
+        allergy_names = self._get_child_allergy_names()
+        for recipe in self.get_recipe_catalog():
+            allergens_found = self._contains_allergen(recipe['ingredient_names'], allergy_names)
 
-            if allergens_found and recipe.id not in child_cart_product_id_set:
+            if allergens_found and recipe['recipe_id'] not in child_cart_product_id_set:
                 continue
             self.recommendations.append(
                 MealPlanRecipeDTO(
-                    product=ProductReadOnlySerializer(recipe).data,
-                    recipe_id=f'{recipe.id}',
-                    title=recipe.title,
+                    product=recipe['product'],
+                    recipe_id=recipe['recipe_id'],
+                    title=recipe['title'],
                     contains_allergen=allergens_found,
                 ).to_dict()
             )
@@ -8,6 +8,7 @@ from django.db.models import DateField
 
 from apps.core.models import CoreModel
 from apps.fulfillment.models import FulfillmentCenter
+from apps.products.libs import RecipeCatalog
 from apps.products.tasks import replace_product_in_cart_line_items_for_active_subscribers
 from apps.recipes.models import Ingredient
 
@@ -44,6 +45,8 @@ class Product(CoreModel):
             self.id)
 
     def save(self, *args, **kwargs):
+        # invalidate first, replacements are picked from the recipe catalog
+        transaction.on_commit(RecipeCatalog.invalidate)
         if 'is_active' in self.get_dirty_fields() and not self.is_active:
             transaction.on_commit(
                 self._replace_cart_line_items_containing_product)
@@ -60,3 +63,7 @@ class ProductVariant(CoreModel):
 
     def __str__(self):
         return f'{self.product} - {self.sku_id}'
+
+    def save(self, *args, **kwargs):
+        transaction.on_commit(RecipeCatalog.invalidate)
+        super().save(*args, **kwargs)
@@ -40,18 +40,16 @@ def _replace_cart_line_item(cart_id: str, product_id: str):
         engine = MealPlanRecommendationEngine(child=cart.customer_child).run()
         new_product = None
         for recommended_product_data in engine.recommendations['remaining_products']:
-            recommended_product = Product.objects.get(id=recommended_product_data['recipe_id'])
             # 4: Let's ensure that we're not selecting the product we're trying to replace
-            if recommended_product != product:
-                new_product = recommended_product
+            if recommended_product_data['recipe_id'] != f'{product.id}':
+                new_product = Product.objects.get(id=recommended_product_data['recipe_id'])
                 break
 
         if not new_product:
             for recommended_product_data in engine.recommendations['recommendations']:
-                recommended_product = Product.objects.get(id=recommended_product_data['recipe_id'])
                 # 4: Let's ensure that we're not selecting the product we're trying to replace
-                if recommended_product != product:
-                    new_product = recommended_product
+                if recommended_product_data['recipe_id'] != f'{product.id}':
+                    new_product = Product.objects.get(id=recommended_product_data['recipe_id'])
                     break
 
         # 5: If there's another valid recommended recipe, let's create the cart line item
@@ -1,7 +1,15 @@
+from unittest import mock
+from uuid import uuid4
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
-from apps.products.tests.factories.product import ProductFactory
+from apps.customers.tests.factories import CustomerSubscriptionFactory
+from apps.products.libs import ProductCatalog, RecipeCatalog
+from apps.products.tests.factories.product import ProductFactory, ProductVariantFactory
+from apps.recipes.tests.factories import IngredientFactory
 
 #
 # class ProductViewSetTestCase(APITestCase):
@@ -18,3 +26,76 @@ from apps.products.tests.factories.product import ProductFactory
 #         ))
 #
 #         self.assertEqual(count, 2)
+
+
+class ProductCatalogViewSetTestSuite(APITestCase):
+    def setUp(self) -> None:
+        RecipeCatalog.invalidate()
+        self.ingredient = IngredientFactory(name='Apple')
+        self.products = [ProductFactory(title=f'recipe-{i}', ingredients=[self.ingredient]) for i in range(3)]
+        for product in self.products:
+            ProductVariantFactory(product=product, sku_id='recipe-12-servings')
+            ProductVariantFactory(product=product, sku_id='recipe-12-servings-bundle')
+        self.inactive_product = ProductFactory(title='inactive-recipe', is_active=False)
+        RecipeCatalog.invalidate()
+
+    def test_will_list_products_with_their_variants_and_ingredients(self):
+        response = self.client.get(reverse('product-list'))
+
+        self.assertEqual(response.status_code, 200)
+        products = {product['id']: product for product in response.json()}
+        self.assertEqual(len(products), 4)
+        self.assertEqual(len(products[f'{self.products[0].id}']['variants']), 2)
+        self.assertEqual(products[f'{self.products[0].id}']['ingredients'][0]['name'], 'Apple')
+
+    def test_will_list_products_matching_servings_of_child_once(self):
+        subscription = CustomerSubscriptionFactory(number_of_servings=12)
+
+        response = self.client.get(reverse('product-list'), {'child': subscription.customer_child_id})
+
+        self.assertEqual(
+            sorted(product['id'] for product in response.json()),
+            sorted(f'{product.id}' for product in self.products),
+        )
+
+    def test_will_filter_inactive_products(self):
+        response = self.client.get(reverse('product-list'), {'is_active': 'true'})
+
+        self.assertNotIn(f'{self.inactive_product.id}', {product['id'] for product in response.json()})
+
+    def test_will_build_catalog_in_a_constant_number_of_queries(self):
+        ProductFactory.create_batch(5, ingredients=[self.ingredient])
+        RecipeCatalog.invalidate()
+
+        with CaptureQueriesContext(connection) as queries:
+            ProductCatalog.get()
+
+        self.assertLessEqual(len(queries), 3)
+
+    def test_will_serve_cached_catalog(self):
+        self.client.get(reverse('product-list'))
+
+        with mock.patch.object(ProductCatalog, '_build') as mock_build:
+            response = self.client.get(reverse('product-list'))
+
+        self.assertEqual(len(response.json()), 4)
+        mock_build.assert_not_called()
+
+    def test_will_retrieve_product_from_catalog(self):
+        response = self.client.get(reverse('product-detail', args=[self.products[1].id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'recipe-1')
+        self.assertEqual(self.client.get(reverse('product-detail', args=[uuid4()])).status_code, 404)
+
+    def test_will_answer_not_modified_until_catalog_is_invalidated(self):
+        etag = self.client.get(reverse('product-list'))['ETag']
+
+        response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        RecipeCatalog.invalidate()
+
+        response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
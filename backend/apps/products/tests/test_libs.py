@@ -1,12 +1,15 @@
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from apps.addresses.tests.factories.location import LocationFactory
 from apps.carts.tests.factories import CartFactory, CartLineItemFactory
 from apps.customers.tests.factories import CustomerChildFactory
+from apps.fulfillment.libs import ZipcodeLookup
 from apps.fulfillment.tests.factories import FulfillmentCenterFactory, FulfillmentCenterZipcodeFactory
 from apps.products.libs import MealPlanRecommendationEngine, BaseMealPlanRecommendationStrategy, \
-    GetRecipesByZipcodeMixin
+    GetRecipesByZipcodeMixin, RecipeCatalog
 from apps.products.tests.factories import ProductFactory
 from apps.recipes.tests.factories import IngredientFactory
 
@@ -168,3 +171,65 @@ class GetRecipesByZipcodeMixinTestSuite(TestCase):
 
         for recipe in recommendation_algorithm.execute():
             self.assertTrue(recipe.title in recipe_title_set)
+
+    @override_settings(FILTER_RECIPES_BY_ZIPCODE=True)
+    def test_will_filter_the_recipe_catalog_by_zipcode(self):
+        RecipeCatalog.invalidate()
+        child = CustomerChildFactory()
+        fulfillment_center = FulfillmentCenterFactory(location='wallace')
+        FulfillmentCenterZipcodeFactory(zipcode='33165').warehouses.add(fulfillment_center)
+        ZipcodeLookup.invalidate()
+        LocationFactory(customer=child.parent, zipcode='33165')
+        available_recipe = ProductFactory(title='available-recipe')
+        available_recipe.fulfillment_centers.add(fulfillment_center)
+        ProductFactory(title='unavailable-recipe')
+
+        recipe_ids = {recipe['recipe_id'] for recipe in MockRecommendationAlgorithm(child).get_recipe_catalog()}
+
+        self.assertEqual(recipe_ids, {f'{available_recipe.id}'})
+
+
+@override_settings(FILTER_RECIPES_BY_ZIPCODE=False)
+class RecipeCatalogTestSuite(TestCase):
+    def setUp(self) -> None:
+        RecipeCatalog.invalidate()
+        self.allergen = IngredientFactory(name='Peanut')
+        self.ingredient = IngredientFactory(name='Apple')
+        self.child = CustomerChildFactory()
+        self.child.allergies.add(IngredientFactory(name='Peanut butter'))
+        self.cart = CartFactory(customer=self.child.parent, customer_child=self.child)
+        self.safe_recipes = [ProductFactory(title=f'recipe-{i}', ingredients=[self.ingredient]) for i in range(4)]
+        self.allergen_recipe = ProductFactory(title='allergen-recipe', ingredients=[self.ingredient, self.allergen])
+
+    def _recommended_recipe_ids(self):
+        recommendations = MealPlanRecommendationEngine(self.child).run().recommendations
+        return {recipe['recipe_id'] for listing in recommendations.values() for recipe in listing}
+
+    def test_will_skip_recipes_with_allergens(self):
+        self.assertEqual(self._recommended_recipe_ids(), {f'{recipe.id}' for recipe in self.safe_recipes})
+
+    def test_will_keep_recipes_with_allergens_already_in_cart(self):
+        CartLineItemFactory(cart=self.cart, product=self.allergen_recipe)
+
+        self.assertIn(f'{self.allergen_recipe.id}', self._recommended_recipe_ids())
+
+    def test_will_run_a_constant_number_of_queries_once_catalog_is_cached(self):
+        self._recommended_recipe_ids()
+        ProductFactory.create_batch(5, ingredients=[self.ingredient])
+        RecipeCatalog.invalidate()
+        self._recommended_recipe_ids()
+
+        with CaptureQueriesContext(connection) as queries:
+            recipe_ids = self._recommended_recipe_ids()
+
+        self.assertEqual(len(recipe_ids), 9)
+        self.assertLessEqual(len(queries), 2)
+
+    def test_will_rebuild_catalog_after_invalidation(self):
+        self._recommended_recipe_ids()
+        new_recipe = ProductFactory(title='new-recipe')
+        self.assertNotIn(f'{new_recipe.id}', self._recommended_recipe_ids())
+
+        RecipeCatalog.invalidate()
+
+        self.assertIn(f'{new_recipe.id}', self._recommended_recipe_ids())
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 from apps.core.models import CoreModel
 
@@ -14,4 +14,11 @@ class BaseNameModel(CoreModel):
 
 
 class Ingredient(BaseNameModel):
-    ...
+    @staticmethod
+    def _invalidate_recipe_catalog():
+        from apps.products.libs import RecipeCatalog
+        RecipeCatalog.invalidate()
+
+    def save(self, *args, **kwargs):
+        transaction.on_commit(self._invalidate_recipe_catalog)
+        super().save(*args, **kwargs)
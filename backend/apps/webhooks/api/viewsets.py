@@ -3,13 +3,16 @@ import hashlib
 import hmac
 
 from django.conf import settings
+from django.db import transaction
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status, mixins, viewsets
 from rest_framework.permissions import BasePermission
 from rest_framework.response import Response
 
-from apps.webhooks.models import WebhookEvent, Webhook
+from apps.webhooks.libs import WebhookTopicEnum, record_webhook_event
+from apps.webhooks.models import WebhookEvent
+from apps.webhooks.tasks import schedule_webhook_event_processing
 
 
 class WebhookEventIsVerified(BasePermission):
@@ -47,11 +50,12 @@ class WebhookEventViewSet(
 
     @method_decorator(csrf_exempt)
     def create(self, request, *args, **kwargs):
-        WebhookEvent.objects.create(
-            webhook=Webhook.objects.get(
-                topic=request.headers.get('X-Shopify-Topic'),
-            ),
+        topic = request.headers.get('X-Shopify-Topic')
+        record_webhook_event(
+            topic=topic,
             data=request.data,
             external_id=request.headers.get('X-Shopify-Webhook-Id'),
         )
+        if topic == WebhookTopicEnum.orders_updated:
+            transaction.on_commit(schedule_webhook_event_processing)
         return Response({}, status=status.HTTP_200_OK)
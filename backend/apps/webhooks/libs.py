@@ -0,0 +1,104 @@
+from typing import Dict, Union
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_update_with_history
+
+
+class WebhookTopicEnum:
+    orders_updated = 'orders/updated'
+
+
+WEBHOOK_TOPICS_CACHE_KEY = 'webhook-topics'
+FULFILLED_STATUSES = {'fulfilled', 'partially_fulfilled'}
+
+
+def invalidate_webhook_topics():
+    cache.delete(WEBHOOK_TOPICS_CACHE_KEY)
+
+
+def _get_webhook_topics() -> Dict[str, str]:
+    webhook_topics = cache.get(WEBHOOK_TOPICS_CACHE_KEY)
+    if webhook_topics is None:
+        Webhook = apps.get_model('webhooks', 'Webhook')
+        webhook_topics = {topic: f'{webhook_id}' for topic, webhook_id in Webhook.objects.values_list('topic', 'id')}
+        cache.set(WEBHOOK_TOPICS_CACHE_KEY, webhook_topics, None)
+    return webhook_topics
+
+
+def get_webhook_id(topic: str) -> str:
+    """
+    Id of the webhook of a Shopify topic, from a cached map of every topic so deliveries do not query it. The map is
+    dropped whenever a `Webhook` is saved or deleted.
+    """
+    Webhook = apps.get_model('webhooks', 'Webhook')
+    webhook_id = _get_webhook_topics().get(topic)
+    if webhook_id is None:
+        raise Webhook.DoesNotExist(f'No webhook is registered for {topic}')
+    return webhook_id
+
+
+def record_webhook_event(topic: str, data: Union[Dict, None], external_id: Union[str, None]):
+    """
+    Stores a Shopify delivery with a single insert. Shopify delivers at least once, redeliveries (same
+    `X-Shopify-Webhook-Id`) are dropped by the unique constraint on `external_id`.
+    """
+    WebhookEvent = apps.get_model('webhooks', 'WebhookEvent')
+    WebhookEvent.objects.bulk_create(
+        [WebhookEvent(webhook_id=get_webhook_id(topic), data=data, external_id=external_id)],
+        ignore_conflicts=True,
+    )
+
+
+def process_order_update_events(batch_size: int = None) -> int:
+    """
+    Applies the tracking number and fulfillment status of a batch of unprocessed `orders/updated` events, oldest
+    first, to their orders with one lookup and one bulk update. Returns how many events were processed.
+
+    Only the fulfillment of orders changes here, none of the payment side effects of `Order.save` apply.
+    """
+    WebhookEvent = apps.get_model('webhooks', 'WebhookEvent')
+    Order = apps.get_model('orders', 'Order')
+
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.filter(
+                webhook_id=get_webhook_id(WebhookTopicEnum.orders_updated),
+                is_processed=False,
+            ).select_for_update(
+                skip_locked=True,
+            ).order_by('created_at')[:batch_size or settings.WEBHOOK_EVENT_BATCH_SIZE]
+        )
+        if not events:
+            return 0
+
+        # later updates of the same order win
+        fulfillments = {}
+        for event in events:
+            data = event.data or {}
+            if data.get('fulfillment_status') in FULFILLED_STATUSES and data.get('fulfillments'):
+                fulfillment = data['fulfillments'][0]
+                fulfillments[f'{fulfillment["order_id"]}'] = (
+                    fulfillment.get('tracking_number'),
+                    data['fulfillment_status'],
+                )
+
+        now = timezone.now()
+        updated_orders = []
+        for order in Order.objects.filter(external_order_id__in=fulfillments):
+            order.tracking_number, order.fulfillment_status = fulfillments[order.external_order_id]
+            if order.is_dirty():
+                order.modified_at = now
+                updated_orders.append(order)
+        bulk_update_with_history(
+            updated_orders,
+            Order,
+            fields=['tracking_number', 'fulfillment_status', 'modified_at'],
+        )
+
+        WebhookEvent.objects.filter(id__in=[event.id for event in events]).update(is_processed=True, modified_at=now)
+
+    return len(events)
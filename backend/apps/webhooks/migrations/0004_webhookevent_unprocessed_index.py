@@ -0,0 +1,22 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the index is built concurrently so the events table is not locked while it is created
+    atomic = False
+
+    dependencies = [
+        ('webhooks', '0003_auto_20211221_1939'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='webhookevent',
+            index=models.Index(
+                condition=models.Q(('is_processed', False)),
+                fields=['webhook', 'external_id'],
+                name='webhook_event_unprocessed_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,74 @@
+from django.db import migrations, models, transaction
+from django.db.models import Count
+
+
+BATCH_SIZE = 1000
+
+
+def delete_redelivered_events(apps, schema_editor):
+    WebhookEvent = apps.get_model('webhooks', 'WebhookEvent')
+    redelivered_external_ids = WebhookEvent.objects.filter(
+        external_id__isnull=False,
+    ).values('external_id').annotate(
+        events=Count('id'),
+    ).filter(events__gt=1).order_by('external_id').values_list('external_id', flat=True)
+
+    # keeps one event per Shopify delivery, a processed one when there is one, a batch of deliveries at a time
+    last_external_id = ''
+    while True:
+        external_ids = list(redelivered_external_ids.filter(external_id__gt=last_external_id)[:BATCH_SIZE])
+        if not external_ids:
+            break
+
+        kept_external_ids = set()
+        redelivered_event_ids = []
+        for event_id, external_id in WebhookEvent.objects.filter(
+            external_id__in=external_ids,
+        ).order_by('external_id', '-is_processed', 'created_at').values_list('id', 'external_id'):
+            if external_id in kept_external_ids:
+                redelivered_event_ids.append(event_id)
+            else:
+                kept_external_ids.add(external_id)
+
+        with transaction.atomic():
+            WebhookEvent.objects.filter(id__in=redelivered_event_ids).delete()
+        last_external_id = external_ids[-1]
+
+
+class Migration(migrations.Migration):
+    # the unique index is built concurrently so webhook events keep being inserted while it is created
+    atomic = False
+
+    dependencies = [
+        ('webhooks', '0004_webhookevent_unprocessed_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_redelivered_events, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                # an interrupted concurrent build leaves an invalid index behind
+                migrations.RunSQL(
+                    'DROP INDEX CONCURRENTLY IF EXISTS webhook_event_external_id_uniq',
+                    migrations.RunSQL.noop,
+                ),
+                migrations.RunSQL(
+                    'CREATE UNIQUE INDEX CONCURRENTLY webhook_event_external_id_uniq '
+                    'ON webhooks_webhookevent (external_id)',
+                    'DROP INDEX CONCURRENTLY IF EXISTS webhook_event_external_id_uniq',
+                ),
+                # attaching the built index only takes a brief lock
+                migrations.RunSQL(
+                    'ALTER TABLE webhooks_webhookevent ADD CONSTRAINT webhook_event_external_id_uniq '
+                    'UNIQUE USING INDEX webhook_event_external_id_uniq',
+                    'ALTER TABLE webhooks_webhookevent DROP CONSTRAINT webhook_event_external_id_uniq',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='webhookevent',
+                    constraint=models.UniqueConstraint(fields=('external_id',), name='webhook_event_external_id_uniq'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the indexes are built and dropped concurrently so the events table is not locked meanwhile
+    atomic = False
+
+    dependencies = [
+        ('webhooks', '0005_webhookevent_unique_external_id'),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='webhookevent',
+            name='webhook_event_unprocessed_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='webhookevent',
+            index=models.Index(
+                condition=models.Q(('is_processed', False)),
+                fields=['webhook', 'created_at'],
+                name='webhook_event_unprocessed_idx',
+            ),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models, transaction
 
 from apps.core.models import CoreModel
+from apps.webhooks.libs import invalidate_webhook_topics
 from apps.webhooks.tasks import subscribe_to_webhook_events
 
 
@@ -21,3 +22,12 @@ class Webhook(CoreModel):
         if 'is_active' in self.get_dirty_fields() and self.is_active:
             transaction.on_commit(self._subscribe_to_webhook_topic)
         super().save(*args, **kwargs)
+        # dropped again once committed, a delivery may have cached the map before the change was visible to it
+        invalidate_webhook_topics()
+        transaction.on_commit(invalidate_webhook_topics)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate_webhook_topics()
+        transaction.on_commit(invalidate_webhook_topics)
+        return result
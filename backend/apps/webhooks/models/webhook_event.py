@@ -12,8 +12,23 @@ class WebhookEvent(CoreModel):
     )
     data = models.JSONField(null=True, blank=True)
     is_processed = models.BooleanField(default=False)
-    # stores the shopify webhook event id - used for idempotency.
+    # stores the shopify webhook event id - used for idempotency, redeliveries are dropped by its unique constraint.
     external_id = models.CharField(max_length=128, null=True, blank=True)
+    # events are their own log, `is_processed` flips are not worth a history row each
+    track_history = False
+
+    class Meta(CoreModel.Meta):
+        indexes = [
+            # `process_order_update_events` only ever reads unprocessed events of a webhook, oldest first
+            models.Index(
+                fields=['webhook', 'created_at'],
+                name='webhook_event_unprocessed_idx',
+                condition=models.Q(is_processed=False),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['external_id'], name='webhook_event_external_id_uniq'),
+        ]
 
     def __str__(self):
         return f'{self.webhook} - {"Processed" if self.is_processed else "Not Processed"}'
@@ -2,9 +2,11 @@ import json
 
 import requests
 from celery import shared_task
+from celery_once import QueueOnce
 from django.apps import apps
 from django.conf import settings
 
+from apps.webhooks.libs import process_order_update_events
 from celery_app import app
 
 
@@ -26,22 +28,16 @@ def subscribe_to_webhook_events(webhook_id: str):
     return response.json()
 
 
-@shared_task
+@shared_task(base=QueueOnce, once={'graceful': True})
 def process_updated_orders_from_webhook_events():
-    Webhook = apps.get_model('webhooks', 'Webhook')
-    webhook = Webhook.objects.get(topic='orders/updated')
-
-    Order = apps.get_model('orders', 'Order')
-
-    for event in webhook.events.filter(is_processed=False).distinct('external_id'):
-        if event.data.get('fulfillment_status') in {'fulfilled', 'partially_fulfilled'}:
-            fulfillment = event.data['fulfillments'][0]
-            try:
-                order = Order.objects.get(external_order_id=fulfillment['order_id'])
-                order.tracking_number = fulfillment['tracking_number']
-                order.fulfillment_status = event.data.get('fulfillment_status')
-                order.save()
-            except Order.DoesNotExist:
-                ...
-        event.is_processed = True
-        event.save()
+    """
+    Drains the unprocessed `orders/updated` events in batches. Deliveries schedule it a few seconds out (see
+    `schedule_webhook_event_processing`), only one run is queued or running at a time.
+    """
+    while process_order_update_events():
+        pass
+
+
+def schedule_webhook_event_processing():
+    # deliveries that arrive while a run is already queued are picked up by it
+    process_updated_orders_from_webhook_events.apply_async(countdown=settings.WEBHOOK_EVENT_PROCESSING_DELAY)
@@ -0,0 +1,27 @@
+from django.test import TestCase
+
+from apps.webhooks.libs import get_webhook_id, record_webhook_event
+from apps.webhooks.models import Webhook
+from apps.webhooks.tests.factories import WebhookFactory
+
+
+class WebhookEventIngestionTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.webhook = WebhookFactory(topic='orders/updated')
+
+    def test_will_resolve_the_webhook_of_a_topic(self):
+        self.assertEqual(get_webhook_id('orders/updated'), f'{self.webhook.id}')
+
+    def test_will_resolve_webhooks_created_after_the_topics_were_cached(self):
+        get_webhook_id('orders/updated')
+        webhook = WebhookFactory(topic='orders/create')
+        self.assertEqual(get_webhook_id('orders/create'), f'{webhook.id}')
+
+    def test_will_raise_for_unknown_topics(self):
+        with self.assertRaises(Webhook.DoesNotExist):
+            get_webhook_id('orders/unknown')
+
+    def test_will_drop_redelivered_events(self):
+        record_webhook_event('orders/updated', {'id': 1}, 'some-delivery-id')
+        record_webhook_event('orders/updated', {'id': 1}, 'some-delivery-id')
+        self.assertEqual(self.webhook.events.count(), 1)
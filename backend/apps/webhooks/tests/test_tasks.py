@@ -29,3 +29,19 @@ class WebhookEventTaskTestSuite(TestCase):
         process_updated_orders_from_webhook_events()
         order.refresh_from_db()
         self.assertIsNotNone(order.tracking_number)
+
+    def test_will_apply_the_latest_update_of_an_order(self):
+        order = OrderFactory(external_order_id='some-order-id')
+        for tracking_number in ['12345', '67890']:
+            WebhookEventFactory(
+                webhook=self.webhook,
+                data={
+                    'fulfillment_status': 'fulfilled',
+                    'fulfillments': [{'order_id': 'some-order-id', 'tracking_number': tracking_number}]
+                },
+                external_id=str(uuid.uuid4()),
+            )
+        process_updated_orders_from_webhook_events()
+        order.refresh_from_db()
+        self.assertEqual(order.tracking_number, '67890')
+        self.assertFalse(self.webhook.events.filter(is_processed=False).exists())
@@ -31,6 +31,22 @@ app.conf.ONCE = {
 }
 
 app.conf.beat_schedule = {
+    'relay-outbox-events': {
+        'task': 'apps.core.tasks.relay_outbox_events',
+        'schedule': crontab(),
+    },
+    'purge-outbox-events': {
+        'task': 'apps.core.tasks.purge_outbox_events',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'flush-api-request-logs': {
+        'task': 'apps.core.tasks.flush_api_request_logs',
+        'schedule': crontab(),
+    },
+    'purge-api-request-logs': {
+        'task': 'apps.core.tasks.purge_api_request_logs',
+        'schedule': crontab(hour=3, minute=0),
+    },
     'create-subscription-orders': {
         'task': 'apps.orders.tasks.recurring.create_new_orders_for_active_subscribers',
         'schedule': crontab(hour=0, minute=1),
@@ -65,7 +81,8 @@ app.conf.beat_schedule = {
     },
     'process-updated-orders-from-webhook-events': {
         'task': 'apps.webhooks.tasks.process_updated_orders_from_webhook_events',
-        'schedule': crontab(hour='*', minute=0),
+        # deliveries schedule it right away, this only catches the ones that arrived while it was running
+        'schedule': crontab(),
     },
     'notify-active-subscribers-of-upcoming-order': {
         'task': 'apps.customers.tasks.recurring.send_upcoming_charge_notification_to_active_subscribers',
@@ -102,6 +119,7 @@ app.conf.beat_schedule = {
 }
 
 app.conf.task_routes = {
+    'apps.core.tasks.process_csv_import': {'queue': 'data-import'},
     'apps.customers.tasks.imports.*': {'queue': 'data-import'},
     'apps.customers.tasks.recurring.*': {'queue': 'recurring'},
     'apps.customers.tasks.notifications.*': {'queue': 'notifications'},
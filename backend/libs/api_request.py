@@ -1,10 +1,21 @@
+import logging
+import os
+import threading
+import time
 import requests
 from dataclasses import dataclass
-from typing import Dict, Any, Union
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Any, Optional, Union
 
 import requests_mock
-from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
 from furl import furl
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from apps.core.request_log import enqueue_api_request_log
+from libs.rate_limiting import ProviderGuard
 import re
 import json
 
@@ -29,7 +40,6 @@ class APIRequestDTO:
     headers: Dict
     body: Dict
     metadata: Dict
-    session: requests.Session
     response: APIResponseDTO
     object_type: Union[None, str] = None
     object_id: Union[None, str] = None
@@ -41,8 +51,155 @@ class APIRequestDTO:
         self.__dict__[name] = value
 
 
+logger = logging.getLogger(__name__)
+
+LATENCY_HOSTS_KEY = 'http-latency-hosts'
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_latency_stats = {}
+_latency_stats_lock = threading.Lock()
+_latency_flushed_at = time.monotonic()
+
+
+def _reset_sessions():
+    # connections of the parent process are never reused by a forked child (Celery prefork, gunicorn workers)
+    global _sessions_lock
+    _sessions.clear()
+    _sessions_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_sessions)
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    # the session is shared by every thread and credential of the process, cookies set by one call must not be sent
+    # along with the next ones
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(
+        # hosts a connection pool is kept for, and connections kept alive per host
+        pool_connections=settings.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+        # only idempotent requests are retried on connection errors and gateway errors, `Retry-After` is respected
+        max_retries=Retry(
+            total=settings.HTTP_MAX_RETRIES,
+            backoff_factor=settings.HTTP_RETRY_BACKOFF_FACTOR,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,
+        ),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Session shared by every thread of the process, so calls to the same host reuse kept-alive connections instead of
+    paying for a TCP and TLS handshake each. Headers are passed with each request and never set on the session.
+    """
+    session = _sessions.get('session')
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get('session')
+            if session is None:
+                session = _sessions['session'] = _build_session()
+    return session
+
+
+def _get_redis_client(cache_name):
+    get_client = getattr(getattr(caches[cache_name], 'client', None), 'get_client', None)
+    return get_client(write=True) if get_client else None
+
+
+def _reset_latency_stats():
+    # latencies of the parent process are flushed by the parent, a forked child must not count them again
+    global _latency_stats_lock, _latency_flushed_at
+    _latency_stats.clear()
+    _latency_stats_lock = threading.Lock()
+    _latency_flushed_at = time.monotonic()
+
+
+os.register_at_fork(after_in_child=_reset_latency_stats)
+
+
+def _flush_latency_stats(force: bool = False):
+    """
+    Adds the latencies aggregated by the process to the `celery` cache, at most every `HTTP_LATENCY_FLUSH_SECONDS`
+    unless `force`d. Latencies that cannot be written are dropped.
+    """
+    global _latency_flushed_at
+    with _latency_stats_lock:
+        if not force and time.monotonic() - _latency_flushed_at < settings.HTTP_LATENCY_FLUSH_SECONDS:
+            return
+        stats = dict(_latency_stats)
+        _latency_stats.clear()
+        _latency_flushed_at = time.monotonic()
+
+    redis_client = _get_redis_client('celery')
+    if not stats or redis_client is None:
+        return
+    cache = caches['celery']
+    pipeline = redis_client.pipeline(transaction=False)
+    for host, host_stats in stats.items():
+        key = cache.make_key(f'http-latency-{host}')
+        pipeline.sadd(cache.make_key(LATENCY_HOSTS_KEY), host)
+        pipeline.hincrbyfloat(key, 'total_seconds', host_stats['total_seconds'])
+        for field in ('calls', 'failed_calls', 'slow_calls'):
+            if host_stats[field]:
+                pipeline.hincrby(key, field, host_stats[field])
+    pipeline.execute()
+
+
+def _record_latency(url: str, seconds: float, failed: bool = False):
+    """
+    Aggregates call counts and latencies per host in the process, flushed to the `celery` cache periodically (see the
+    `http_latency` command). Metrics are best effort: they never fail the call they measure.
+    """
+    try:
+        host = furl(url).host
+        is_slow = seconds >= settings.HTTP_SLOW_REQUEST_SECONDS
+        if is_slow:
+            logger.warning(f'{host} took {seconds:.2f}s to respond')
+
+        with _latency_stats_lock:
+            host_stats = _latency_stats.setdefault(
+                host, {'calls': 0, 'failed_calls': 0, 'slow_calls': 0, 'total_seconds': 0.0},
+            )
+            host_stats['calls'] += 1
+            host_stats['total_seconds'] += seconds
+            host_stats['failed_calls'] += int(failed)
+            host_stats['slow_calls'] += int(is_slow)
+        _flush_latency_stats()
+    except Exception:
+        # urls may carry credentials, they are not logged
+        logger.exception('Could not record the latency of an outbound request')
+
+
+def get_latency_stats() -> Dict[str, Dict]:
+    redis_client = _get_redis_client('celery')
+    if redis_client is None:
+        return {}
+    cache = caches['celery']
+    stats = {}
+    for host in sorted(redis_client.smembers(cache.make_key(LATENCY_HOSTS_KEY))):
+        host = host.decode() if isinstance(host, bytes) else host
+        values = {
+            (key.decode() if isinstance(key, bytes) else key): float(value)
+            for key, value in redis_client.hgetall(cache.make_key(f'http-latency-{host}')).items()
+        }
+        calls = int(values.get('calls', 0))
+        stats[host] = {
+            'calls': calls,
+            'failed_calls': int(values.get('failed_calls', 0)),
+            'slow_calls': int(values.get('slow_calls', 0)),
+            'average_seconds': values.get('total_seconds', 0) / calls if calls else 0,
+        }
+    return stats
+
+
 def _inside_test():
-    from django.conf import settings
     return settings.TESTING
 
 
@@ -59,13 +216,14 @@ def _register_mocked_routes(adapter):
     })
 
 
-def _send_request(session: requests.Session, method: str, request_url: str, body=None):
+def _send_request(session: requests.Session, method: str, request_url: str, headers: Dict, body=None):
+    kwargs = {
+        'headers': headers,
+        'timeout': (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT),
+    }
     if body:
-        api_response = getattr(session, method)(request_url, json=body)
-    else:
-        api_response = getattr(session, method)(request_url)
-
-    return api_response
+        kwargs['json'] = body
+    return getattr(session, method)(request_url, **kwargs)
 
 
 def make_api_request(
@@ -76,18 +234,34 @@ def make_api_request(
     options: Dict = {},
     metadata: Dict = {},
     object_type: Union[str, None] = None,
-    object_id: Union[str, None] = None
+    object_id: Union[str, None] = None,
+    provider: Union[str, None] = None,
 ):
-    session = requests.Session()
-    session.headers.update(headers)
+    """
+    Calls `url`, behind the rate limit and circuit breaker of `provider` when given (see `ProviderGuard`).
+    """
+    guard = ProviderGuard(provider) if provider else None
+    session = get_session()
     request_url = furl(url).add(options).url
 
     if _inside_test():
         with requests_mock.Mocker(real_http=False) as adapter:
             _register_mocked_routes(adapter)
-            api_response = _send_request(session, method, request_url, body)
+            api_response = _send_request(session, method, request_url, headers, body)
     else:
-        api_response = _send_request(session, method, request_url, body)
+        if guard:
+            guard.acquire()
+        started_at = time.monotonic()
+        try:
+            api_response = _send_request(session, method, request_url, headers, body)
+        except (requests.ConnectionError, requests.Timeout):
+            if guard:
+                guard.circuit_breaker.record_failure()
+            _record_latency(request_url, time.monotonic() - started_at, failed=True)
+            raise
+        _record_latency(request_url, time.monotonic() - started_at, failed=api_response.status_code >= 500)
+        if guard:
+            guard.record_response(api_response.status_code, api_response.headers)
 
     response_body = api_response.content if api_response.content else '{}'
     api_response_object = APIResponseDTO(
@@ -102,7 +276,6 @@ def make_api_request(
         headers=headers,
         body=body,
         metadata=metadata,
-        session=session,
         response=api_response_object,
         object_type=object_type,
         object_id=object_id,
@@ -119,7 +292,20 @@ def make_logged_api_request(**kwargs):
         body=kwargs.get('body', {}),
         object_type=kwargs.get('object_type', None),
         object_id=kwargs.get('object_id', None),
+        provider=kwargs.get('provider', None),
     )
-    APIRequestLog = apps.get_model('core', 'APIRequestLog')
-    APIRequestLog.objects.create_from_logged_request(api_request)
+    enqueue_api_request_log(api_request)
     return api_request
+
+
+def cache_api_response(key: str, response: APIResponseDTO):
+    """
+    Keeps the parsed body of a successful response under `key`, for integrations that reuse responses (e.g. the
+    queued orders of a ReCharge customer) instead of calling the API again.
+    """
+    if response.status_code == 200:
+        caches['celery'].set(f'api-response-{key}', response.parsed_body, settings.API_RESPONSE_CACHE_TIMEOUT)
+
+
+def get_cached_api_response(key: str) -> Optional[Dict]:
+    return caches['celery'].get(f'api-response-{key}')
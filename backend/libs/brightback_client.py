@@ -61,7 +61,8 @@ class BrightBackClient:
         response = make_logged_api_request(
             url=f'{self.bright_back_base_url}/precancel',
             method='post',
-            body=self.cancellation_payload
+            body=self.cancellation_payload,
+            provider='brightback',
         )
 
         response = response.response
@@ -1,7 +1,7 @@
 from abc import abstractmethod
-from typing import Union
+from typing import List, Union
 
-from libs.payment_processors.dto import ChargeDTO, ProcessedRefundDTO
+from libs.payment_processors.dto import ChargeDTO, ProcessedChargeDTO, ProcessedRefundDTO
 
 
 class BillingTransactionManager:
@@ -20,3 +20,8 @@ class BillingTransactionManager:
     @abstractmethod
     def save_refund_to_database(self):
         ...
+
+    @staticmethod
+    @abstractmethod
+    def save_charges_to_database(processed_charge_dtos: List[ProcessedChargeDTO]):
+        ...
@@ -29,6 +29,7 @@ class ChargeDTO(BaseTransactionDTO):
     processor_customer_id: str = None
     capture_immediately: bool = True
     currency_code: str = 'usd'
+    idempotency_key: Union[None, str] = None
 
 
 @dataclass
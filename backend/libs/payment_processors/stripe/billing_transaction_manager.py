@@ -1,7 +1,12 @@
+from typing import List
+
 from django.apps import apps
+from simple_history.utils import bulk_create_with_history
+
 from libs.payment_processors.billing_transaction_manager import (
     BillingTransactionManager as BaseTransactionManager,
 )
+from libs.payment_processors.dto import ProcessedChargeDTO
 
 
 class BillingTransactionManager(BaseTransactionManager):
@@ -16,6 +21,20 @@ class BillingTransactionManager(BaseTransactionManager):
             status='captured' if self.processed_charge_data.is_captured else 'uncaptured',
         )
 
+    @staticmethod
+    def save_charges_to_database(processed_charge_dtos: List[ProcessedChargeDTO]):
+        Charge = apps.get_model('billing', 'Charge')
+
+        return bulk_create_with_history([
+            Charge(
+                customer_id=charge_data.customer_id,
+                payment_method_id=charge_data.payment_method_id,
+                payment_processor_charge_id=charge_data.processor_transaction_id,
+                amount=charge_data.cents_amount_to_decimal_amount(),
+                status='captured' if charge_data.is_captured else 'uncaptured',
+            ) for charge_data in processed_charge_dtos
+        ], Charge)
+
     def save_refund_to_database(self):
         Refund = apps.get_model('billing', 'Refund')
 
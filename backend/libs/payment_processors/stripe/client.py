@@ -10,12 +10,18 @@ from libs.payment_processors.exceptions import (
     CouldNotProcessChargeError,
     CouldNotProcessRefundError,
 )
+from libs.rate_limiting import ProviderGuard
+
+
+# errors on Stripe's side, declined cards and invalid requests say nothing about its health
+STRIPE_FAILURES = (stripe.error.APIConnectionError, stripe.error.APIError)
 
 
 class PaymentProcessorClient(BaseClient):
     def __init__(self, *args, **kwargs):
         self.client = stripe
         self.client.api_key = settings.STRIPE_SECRET_KEY
+        self.guard = ProviderGuard('stripe')
 
     @staticmethod
     def _parse_payment_method(payment_method_obj):
@@ -31,61 +37,69 @@ class PaymentProcessorClient(BaseClient):
 
     def retrieve_payment_method(self, payment_method):
         try:
-            return self._parse_payment_method(
-                self.client.PaymentMethod.retrieve(
-                    payment_method,
+            with self.guard.call(failures=STRIPE_FAILURES):
+                return self._parse_payment_method(
+                    self.client.PaymentMethod.retrieve(
+                        payment_method,
+                    )
                 )
-            )
         except stripe.error.APIConnectionError as e:
             raise CouldNotFetchPaymentMethodError(e)
 
     def create_setup_intent(self, *args, **kwargs):
         try:
-            return self.client.SetupIntent.create(**kwargs)
+            with self.guard.call(failures=STRIPE_FAILURES):
+                return self.client.SetupIntent.create(**kwargs)
         except (stripe.error.StripeError, stripe.error.APIConnectionError) as e:
             raise CouldNotCreateSetupIntentError(e)
 
     def create_customer(self, *args, **kwargs):
-        return self.client.Customer.create(
-            **kwargs
-        )
+        with self.guard.call(failures=STRIPE_FAILURES):
+            return self.client.Customer.create(
+                **kwargs
+            )
 
     def retrieve_customer(self, customer):
         try:
-            return self.client.Customer.retrieve(
-                customer
-            )
+            with self.guard.call(failures=STRIPE_FAILURES):
+                return self.client.Customer.retrieve(
+                    customer
+                )
         except (stripe.error.StripeError, stripe.error.APIConnectionError) as e:
             raise CouldNotFetchProcessorCustomerError(e)
 
     def charge(self, charge_data: ChargeDTO):
         try:
-            return self.client.PaymentIntent.create(
-                currency=charge_data.currency_code,
-                amount=charge_data.dollar_amount_to_cents(),
-                customer=charge_data.processor_customer_id,
-                payment_method=charge_data.processor_payment_method_id,
-                confirm=charge_data.capture_immediately,
-                setup_future_usage='off_session',
-            )
+            with self.guard.call(failures=STRIPE_FAILURES):
+                return self.client.PaymentIntent.create(
+                    currency=charge_data.currency_code,
+                    amount=charge_data.dollar_amount_to_cents(),
+                    customer=charge_data.processor_customer_id,
+                    payment_method=charge_data.processor_payment_method_id,
+                    confirm=charge_data.capture_immediately,
+                    setup_future_usage='off_session',
+                    idempotency_key=charge_data.idempotency_key,
+                )
         except (stripe.error.CardError, stripe.error.APIConnectionError) as e:
             raise CouldNotProcessChargeError(e)
 
     def refund(self, refund_data: RefundDTO):
         try:
-            return self.client.Refund.create(
-                payment_intent=refund_data.processor_transaction_id,
-                amount=refund_data.dollar_amount_to_cents(),
-                reason=refund_data.reason
-            )
+            with self.guard.call(failures=STRIPE_FAILURES):
+                return self.client.Refund.create(
+                    payment_intent=refund_data.processor_transaction_id,
+                    amount=refund_data.dollar_amount_to_cents(),
+                    reason=refund_data.reason
+                )
         except (stripe.error.CardError, stripe.error.APIConnectionError) as e:
             raise CouldNotProcessRefundError(e)
 
     def attach_customer_to_payment_method(self, attachment_data: PaymentMethodAttachmentDTO):
         try:
-            return self.client.PaymentMethod.attach(
-                attachment_data.processor_payment_method_id,
-                customer=attachment_data.processor_customer_id
-            )
+            with self.guard.call(failures=STRIPE_FAILURES):
+                return self.client.PaymentMethod.attach(
+                    attachment_data.processor_payment_method_id,
+                    customer=attachment_data.processor_customer_id
+                )
         except (stripe.error.CardError, stripe.error.APIConnectionError) as e:
             raise CouldNotAttachPaymentMethodToProcessorCustomerError(e)
@@ -0,0 +1,274 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from libs.test_helpers import inside_test
+
+
+# claims ARGV[3] units in the bucket of KEYS[1] (capacity ARGV[1], leaking ARGV[2] units per second, at time ARGV[4])
+# when there is room for them or when forced by ARGV[5], returns the seconds to wait for room otherwise
+LEAKY_BUCKET_ACQUIRE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local leak_rate = tonumber(ARGV[2])
+local units = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local level = 0
+local state = redis.call('HMGET', KEYS[1], 'level', 'updated_at')
+if state[1] then
+    level = math.max(0, tonumber(state[1]) - (now - tonumber(state[2])) * leak_rate)
+end
+if level + units > capacity and ARGV[5] ~= '1' then
+    return tostring((level + units - capacity) / leak_rate)
+end
+level = level + units
+redis.call('HMSET', KEYS[1], 'level', tostring(level), 'updated_at', ARGV[4])
+redis.call('EXPIRE', KEYS[1], math.floor(level / leak_rate) + 1)
+return '0'
+"""
+
+LEAKY_BUCKET_SET_SCRIPT = """
+redis.call('HMSET', KEYS[1], 'level', ARGV[1], 'updated_at', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+"""
+
+
+def _get_cache(cache_name):
+    return caches[cache_name]
+
+
+def _get_redis_client(cache_name):
+    """
+    Raw client of a django-redis cache, `None` for other backends (e.g. the file based caches of local environments).
+    """
+    get_client = getattr(getattr(_get_cache(cache_name), 'client', None), 'get_client', None)
+    return get_client(write=True) if get_client else None
+
+
+class CircuitOpenError(Exception):
+    ...
+
+
+class LeakyBucketRateLimiter:
+    """
+    Token bucket shared through a Django cache (a leaky bucket, from the point of view of the API), so every worker
+    calling the same API sees the same bucket. Mirrors the limits of APIs like Shopify's.
+
+    Each call adds one unit to the bucket and the bucket drains at `leak_rate` units per second. Callers block once the
+    bucket is full. On a django-redis cache, checking and claiming room in the bucket is a single atomic script;
+    other caches fall back to separate reads and writes. The local estimate is corrected with the levels reported by
+    the API (see `update`), which keeps workers honest either way.
+    """
+    def __init__(self, name: str, capacity: int, leak_rate: float, cache_name: str = 'celery'):
+        self.name = name
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.cache_name = cache_name
+
+    @property
+    def _key(self) -> str:
+        return f'leaky-bucket-{self.name}'
+
+    @property
+    def _redis_key(self) -> str:
+        return _get_cache(self.cache_name).make_key(self._key)
+
+    def _get_level(self, now: float) -> float:
+        redis_client = _get_redis_client(self.cache_name)
+        if redis_client is not None:
+            state = redis_client.hmget(self._redis_key, 'level', 'updated_at')
+            state = (float(state[0]), float(state[1])) if state[0] is not None else None
+        else:
+            state = _get_cache(self.cache_name).get(self._key)
+        if not state:
+            return 0
+        level, updated_at = state
+        return max(0, level - (now - updated_at) * self.leak_rate)
+
+    def _set_level(self, level: float, now: float):
+        # the bucket is empty once it has fully drained, no need to keep the state around any longer
+        timeout = int(level / self.leak_rate) + 1
+        redis_client = _get_redis_client(self.cache_name)
+        if redis_client is not None:
+            redis_client.register_script(LEAKY_BUCKET_SET_SCRIPT)(
+                keys=[self._redis_key],
+                args=[repr(float(level)), repr(now), timeout],
+            )
+            return
+        _get_cache(self.cache_name).set(self._key, (level, now), timeout)
+
+    def _try_acquire(self, units: int, now: float, force: bool = False) -> float:
+        """
+        Claims `units` when there is room for them in the bucket (or when forced), returns the seconds to wait for room
+        otherwise.
+        """
+        redis_client = _get_redis_client(self.cache_name)
+        if redis_client is not None:
+            return float(redis_client.register_script(LEAKY_BUCKET_ACQUIRE_SCRIPT)(
+                keys=[self._redis_key],
+                args=[self.capacity, self.leak_rate, units, repr(now), '1' if force else '0'],
+            ))
+
+        level = self._get_level(now)
+        if level + units <= self.capacity or force:
+            self._set_level(level + units, now)
+            return 0
+        return (level + units - self.capacity) / self.leak_rate
+
+    def acquire(self, units: int = 1):
+        """
+        Blocks until there is room in the bucket for `units` more units (one per call, or the cost of a call for
+        cost-based limits), then claims them.
+        """
+        while True:
+            wait = self._try_acquire(units, time.time(), force=inside_test())
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def update(self, level: float, capacity: int = None):
+        """
+        Replaces the local estimate with the bucket level reported by the API.
+        """
+        if capacity:
+            self.capacity = capacity
+        self._set_level(level, time.time())
+
+    def pause(self, seconds: float):
+        """
+        Fills the bucket so that nobody calls the API for `seconds` seconds, e.g. after a `Retry-After` response.
+        """
+        self._set_level(self.capacity + seconds * self.leak_rate, time.time())
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared through a Django cache. Once `failure_threshold` calls failed within `failure_window`
+    seconds (successes in between do not reset the count, so a provider failing intermittently trips it too), the
+    circuit opens and every worker fails fast with `CircuitOpenError` for `recovery_timeout` seconds instead of piling
+    up calls to a degraded service. Calls are let through again afterwards: a success closes the circuit, another
+    failure opens it right away.
+    """
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        recovery_timeout: int,
+        failure_window: int = 60,
+        cache_name: str = 'celery',
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failure_window = failure_window
+        self.cache_name = cache_name
+
+    @property
+    def _failures_key(self) -> str:
+        return f'circuit-breaker-{self.name}-failures'
+
+    @property
+    def _open_key(self) -> str:
+        return f'circuit-breaker-{self.name}-open'
+
+    @property
+    def _half_open_key(self) -> str:
+        return f'circuit-breaker-{self.name}-half-open'
+
+    def is_open(self) -> bool:
+        return bool(_get_cache(self.cache_name).get(self._open_key))
+
+    def check(self):
+        if not inside_test() and self.is_open():
+            raise CircuitOpenError(f'{self.name} is unavailable, calls are suspended for a while')
+
+    def record_success(self):
+        # failures are only forgotten when their window expires, a success only closes a circuit that was let through
+        _get_cache(self.cache_name).delete(self._half_open_key)
+
+    def _open(self):
+        cache = _get_cache(self.cache_name)
+        cache.set(self._open_key, True, self.recovery_timeout)
+        cache.set(self._half_open_key, True, self.recovery_timeout + self.failure_window)
+
+    def record_failure(self):
+        cache = _get_cache(self.cache_name)
+        if cache.get(self._half_open_key):
+            return self._open()
+
+        # the count starts with the first failure of a window and expires with it
+        cache.add(self._failures_key, 0, self.failure_window)
+        try:
+            failures = cache.incr(self._failures_key)
+        except ValueError:
+            # the failures expired between `add` and `incr`
+            return self.record_failure()
+        if failures >= self.failure_threshold:
+            cache.delete(self._failures_key)
+            self._open()
+
+
+class ProviderGuard:
+    """
+    Gate every outbound call to a 3rd party provider goes through: a token bucket sized to the provider's real limit
+    and a circuit breaker, both shared by every worker through the `celery` cache. Providers are configured in
+    `settings.OUTBOUND_API_LIMITS`.
+    """
+    def __init__(self, provider: str):
+        limits: Dict = settings.OUTBOUND_API_LIMITS[provider]
+        self.provider = provider
+        self.rate_limiter = LeakyBucketRateLimiter(
+            f'provider-{provider}',
+            capacity=limits.get('capacity', limits['rate']),
+            leak_rate=limits['rate'],
+        )
+        self.circuit_breaker = CircuitBreaker(
+            f'provider-{provider}',
+            failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=settings.CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+            failure_window=settings.CIRCUIT_BREAKER_FAILURE_WINDOW,
+        )
+
+    def acquire(self, units: int = 1):
+        """
+        Fails fast while the provider is degraded, blocks until its budget allows `units` more otherwise.
+        """
+        self.circuit_breaker.check()
+        self.rate_limiter.acquire(units)
+
+    def record_response(self, status_code: int, headers: Dict = None):
+        """
+        Feeds the outcome of an HTTP call back: server errors count towards opening the circuit and throttled calls
+        (429) pause the budget for the `Retry-After` delay the provider asks for.
+        """
+        if status_code >= 500:
+            self.circuit_breaker.record_failure()
+            return
+
+        self.circuit_breaker.record_success()
+        if status_code == 429:
+            retry_after = next(
+                (value for key, value in (headers or {}).items() if key.lower() == 'retry-after'),
+                None,
+            )
+            try:
+                self.rate_limiter.pause(float(retry_after) if retry_after else 1 / self.rate_limiter.leak_rate)
+            except ValueError:
+                # `Retry-After` may also be an HTTP date
+                self.rate_limiter.pause(1 / self.rate_limiter.leak_rate)
+
+    @contextmanager
+    def call(self, units: int = 1, failures=(Exception, )):
+        """
+        Guards a call made with an SDK rather than an HTTP response at hand: exceptions listed in `failures` count
+        towards opening the circuit, the others are the caller's business (e.g. a declined card).
+        """
+        self.acquire(units)
+        try:
+            yield
+        except failures:
+            self.circuit_breaker.record_failure()
+            raise
+        self.circuit_breaker.record_success()
@@ -1,10 +1,16 @@
+import time
 from dataclasses import dataclass
 from decimal import Decimal
-from typing import Dict, List, Union
+from typing import Callable, Dict, List, Union
 
 import shopify
 from dataclasses_json import dataclass_json
 from django.conf import settings
+from pyactiveresource.connection import ClientError, ServerError
+
+from apps.orders.libs import PaymentCalculator
+from libs.rate_limiting import ProviderGuard
+from libs.test_helpers import inside_test
 
 
 @dataclass_json
@@ -114,12 +120,62 @@ class CouldNotCancelOrderError(Exception):
 
 
 class ShopifyAPIClient:
+    CALL_LIMIT_HEADER = 'X-Shopify-Shop-Api-Call-Limit'
+    MAX_THROTTLED_RETRIES = 5
+
     def __init__(self):
         self.shop_url = settings.SHOPIFY_DOMAIN
         self.api_version = settings.SHOPIFY_API_VERSION
         self.api_key = settings.SHOPIFY_API_KEY
         self.secret = settings.SHOPIFY_API_KEY_SECRET
         self.password = settings.SHOPIFY_PASSWORD
+        # the same bucket as `ShopifyRestClient` calls
+        self.guard = ProviderGuard('shopify')
+        self.rate_limiter = self.guard.rate_limiter
+
+    @staticmethod
+    def _get_header(headers, name: str):
+        for key, value in (headers or {}).items():
+            if key.lower() == name.lower():
+                return value
+
+    def _update_rate_limit(self, headers):
+        """
+        Shopify reports the state of the store's bucket with every response, e.g. `X-Shopify-Shop-Api-Call-Limit: 32/40`
+        """
+        call_limit = self._get_header(headers, self.CALL_LIMIT_HEADER)
+        if call_limit:
+            level, capacity = call_limit.split('/')
+            self.rate_limiter.update(int(level), int(capacity))
+
+    def _call(self, func: Callable, *args, **kwargs):
+        """
+        Makes a Shopify API call once the store's shared call budget allows it. Throttled calls (429) are retried after
+        the `Retry-After` delay the store asks for, during which no worker calls the store. Server errors count towards
+        opening the circuit of the store.
+        """
+        for attempt in range(self.MAX_THROTTLED_RETRIES + 1):
+            self.guard.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except ServerError:
+                self.guard.circuit_breaker.record_failure()
+                raise
+            except ClientError as e:
+                if e.response.code != 429 or attempt == self.MAX_THROTTLED_RETRIES:
+                    raise
+                retry_after = self._get_header(e.response.headers, 'Retry-After')
+                retry_after = float(retry_after) if retry_after else 1 / self.rate_limiter.leak_rate
+                self.rate_limiter.pause(retry_after)
+                if not inside_test():
+                    time.sleep(retry_after)
+                continue
+
+            self.guard.circuit_breaker.record_success()
+            response = getattr(shopify.ShopifyResource.connection, 'response', None)
+            if response is not None:
+                self._update_rate_limit(response.headers)
+            return result
 
     def _calculate_sales_tax_rate(self, order):
         pre_tax_price = order.charged_amount - order.tax_total
@@ -129,16 +185,17 @@ class ShopifyAPIClient:
         decimal_tax_rate = Decimal(f'{order.tax_total / pre_tax_price}')
         return str(float(decimal_tax_rate))
 
-    def _calculate_line_item_price(self, line_item: 'OrderLineItem', order_is_24_pack):
-        item_price = f'{line_item.product_variant.price}'
+    def _calculate_line_item_price(self, line_item: 'LineItemSnapshotDTO', order_is_24_pack):
+        item_price = f'{line_item.price}'
 
-        if order_is_24_pack and line_item.product.product_type == 'recipe':
-            item_price = str(Decimal(f'{float(line_item.product_variant.price) - 20 / 24}'))
+        if order_is_24_pack and line_item.product_type == 'recipe':
+            item_price = str(Decimal(f'{float(line_item.price) - 20 / 24}'))
 
         return item_price
 
     def _build_order_data(self, order):
-        line_items = order.line_items.filter()
+        calculator = PaymentCalculator().set_order(order)
+        line_items = calculator.get_line_item_snapshots()
         customer = order.customer
         address = customer.addresses.first()
         shipping_rate = order.shipping_rate
@@ -160,13 +217,13 @@ class ShopifyAPIClient:
                 ).to_dict()
             ]
 
-        order_is_24_pack = order.is_24_pack()
+        order_is_24_pack = calculator.is_24_pack()
 
         items_data = [
             LineItemDTO(
-                variant_id=line_item.product_variant.external_variant_id,
+                variant_id=line_item.external_variant_id,
                 quantity=line_item.quantity,
-                sku=line_item.product_variant.sku_id,
+                sku=line_item.sku_id,
                 price=self._calculate_line_item_price(line_item, order_is_24_pack)
             ).to_dict() for line_item in line_items
         ]
@@ -220,7 +277,7 @@ class ShopifyAPIClient:
             },
             prefix_options={'order_id': shopify_order_id}
         )
-        transaction.save()
+        self._call(transaction.save)
         if transaction.errors.errors:
             raise CouldNotCreateTransactionError(
                 f'Could not record transaction for order: {shopify_order_id}'
@@ -230,7 +287,7 @@ class ShopifyAPIClient:
     def create_order(self, order: 'Order'):
         create_order_payload = self._build_order_data(order)
         with shopify.Session.temp(self.shop_url, self.api_version, self.password):
-            shopify_order = shopify.Order.create(create_order_payload)
+            shopify_order = self._call(shopify.Order.create, create_order_payload)
             if shopify_order.errors.errors:
                 raise CouldNotSyncOrderError(f'Order ID: {order.id}', shopify_order.errors.errors)
 
@@ -245,12 +302,12 @@ class ShopifyAPIClient:
 
     def retrieve_customer_with_shopify_id(self, shopify_customer_id: str):
         with shopify.Session.temp(self.shop_url, self.api_version, self.password):
-            return shopify.Customer.find(shopify_customer_id)
+            return self._call(shopify.Customer.find, shopify_customer_id)
 
     def create_customer(self, customer: 'Customer'):
         with shopify.Session.temp(self.shop_url, self.api_version, self.password):
             address = customer.addresses.first()
-            shopify_customer = shopify.Customer.create({
+            shopify_customer = self._call(shopify.Customer.create, {
                 "first_name": customer.first_name,
                 "last_name": customer.last_name,
                 "email": customer.email,
@@ -270,10 +327,11 @@ class ShopifyAPIClient:
 
     def retrieve_order(self, shopify_order_id: str):
         with shopify.Session.temp(self.shop_url, self.api_version, self.password):
-            return shopify.Order.find(shopify_order_id)
+            return self._call(shopify.Order.find, shopify_order_id)
 
     def _send_calculate_refund_request(self, shopify_order_id: str, order_line_items_data: List[Dict]):
-        calculated_refund = shopify.Refund.calculate(
+        calculated_refund = self._call(
+            shopify.Refund.calculate,
             shopify_order_id,
             refund_line_items=order_line_items_data
         )
@@ -302,12 +360,12 @@ class ShopifyAPIClient:
                 f'Shopify Order ID: {shopify_order_id}',
                 refund_obj.errors.errors
             )
-        refund_obj.save()
+        self._call(refund_obj.save)
 
     def _apply_refund_to_order(self, shopify_order: shopify.Order, refund_object: shopify.Refund):
         shopify_order.financial_status = 'refunded'
         shopify_order.refunds = [refund_object]
-        shopify_order.save()
+        self._call(shopify_order.save)
         if shopify_order.errors.errors:
             raise CouldNotApplyRefundError()
         return shopify_order
@@ -316,13 +374,13 @@ class ShopifyAPIClient:
         with shopify.Session.temp(self.shop_url, self.api_version, self.password):
             refund_transaction = shopify.Transaction({
                 'kind': 'refund',
-                'parent_id': shopify_order.transactions()[0].id
+                'parent_id': self._call(shopify_order.transactions)[0].id
             }, prefix_options={'order_id': shopify_order.id})
 
             if amount:
                 refund_transaction.amount = amount
 
-            refund_transaction.save()
+            self._call(refund_transaction.save)
             if refund_transaction.errors.errors:
                 raise CouldNotCreateTransactionError(
                     f'Could not record refund transaction for order: {shopify_order.id}'
@@ -336,7 +394,7 @@ class ShopifyAPIClient:
             }, prefix_options={'order_id': shopify_order_id}
         )
         with shopify.Session.temp(self.shop_url, self.api_version, self.password):
-            refund_obj.save()
+            self._call(refund_obj.save)
         return refund_obj
 
     def partially_refund_order(self, order: 'Order'):
@@ -378,8 +436,8 @@ class ShopifyAPIClient:
     def cancel_order(self, order: 'Order'):
         shopify_order = self.retrieve_order(order.external_order_id)
         with shopify.Session.temp(self.shop_url, self.api_version, self.password):
-            shopify_order.cancel()
-            shopify_order.save()
+            self._call(shopify_order.cancel)
+            self._call(shopify_order.save)
 
         if not shopify_order.attributes['cancelled_at']:
             raise CouldNotCancelOrderError(f'Could not cancel order {order} with shopify id: {shopify_order}')
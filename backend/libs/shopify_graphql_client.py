@@ -0,0 +1,252 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Union
+
+import requests
+from dataclasses_json import dataclass_json
+from django.conf import settings
+
+from libs.api_request import get_session
+from libs.rate_limiting import ProviderGuard
+from libs.shopify_api_client import CouldNotSyncOrderError, ShopifyAPIClient
+from libs.test_helpers import inside_test
+
+
+ORDER_CREATE_FIELDS = '''
+    order {
+        legacyResourceId
+        name
+        customer {
+            legacyResourceId
+        }
+    }
+    userErrors {
+        field
+        message
+    }
+'''
+
+
+@dataclass_json
+@dataclass
+class ShopifyOrderSyncResultDTO:
+    order_id: str
+    external_order_id: Union[None, str] = None
+    order_number: Union[None, str] = None
+    external_customer_id: Union[None, str] = None
+    errors: Union[None, List] = None
+
+
+class CouldNotExecuteGraphQLRequestError(Exception):
+    ...
+
+
+class ShopifyGraphQLClient:
+    """
+    Creates orders through Shopify's GraphQL Admin API.
+
+    Orders are built from the same payload as `ShopifyAPIClient.create_order`, but several `orderCreate` mutations are
+    sent per request and each one records the sale transaction and associates (or upserts) the customer itself, so
+    syncing an order no longer takes a customer, an order and a transaction call. Shopify customer ids are cached
+    per email for the lifetime of the client.
+    """
+    ORDERS_PER_REQUEST = 10
+    # requested cost of a single `orderCreate` mutation, used to reserve room in the cost bucket up front
+    ORDER_CREATE_COST = 10
+    MAX_THROTTLED_RETRIES = 5
+
+    def __init__(self, endpoint: str = None):
+        self.endpoint = endpoint or (
+            f'https://{settings.SHOPIFY_DOMAIN}/admin/api/{settings.SHOPIFY_GRAPHQL_API_VERSION}/graphql.json'
+        )
+        # headers are sent with each request, the pooled session is shared by every client of the process
+        self.headers = {
+            'Content-Type': 'application/json',
+            'X-Shopify-Access-Token': settings.SHOPIFY_PASSWORD,
+        }
+        self.guard = ProviderGuard('shopify-graphql')
+        self.rate_limiter = self.guard.rate_limiter
+        self.rest_client = ShopifyAPIClient()
+        self.customer_ids = {}
+
+    @staticmethod
+    def _money(amount: str) -> Dict:
+        return {'shopMoney': {'amount': amount, 'currencyCode': 'USD'}}
+
+    @staticmethod
+    def _global_id(resource: str, resource_id: str) -> str:
+        return f'gid://shopify/{resource}/{resource_id}'
+
+    def _update_rate_limit(self, response_body: Dict):
+        throttle_status = response_body.get('extensions', {}).get('cost', {}).get('throttleStatus')
+        if throttle_status:
+            self.rate_limiter.leak_rate = throttle_status['restoreRate']
+            self.rate_limiter.update(
+                throttle_status['maximumAvailable'] - throttle_status['currentlyAvailable'],
+                throttle_status['maximumAvailable'],
+            )
+
+    @staticmethod
+    def _is_throttled(response_body: Dict) -> bool:
+        return any(
+            error.get('extensions', {}).get('code') == 'THROTTLED' for error in response_body.get('errors', [])
+        )
+
+    def execute(self, query: str, variables: Dict = None, cost: int = 1) -> Dict:
+        for attempt in range(self.MAX_THROTTLED_RETRIES + 1):
+            self.guard.acquire(cost)
+            try:
+                response = get_session().post(
+                    self.endpoint,
+                    json={'query': query, 'variables': variables or {}},
+                    headers=self.headers,
+                    timeout=(settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT),
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                self.guard.circuit_breaker.record_failure()
+                raise
+            self.guard.record_response(response.status_code, response.headers)
+            if response.status_code != 200:
+                raise CouldNotExecuteGraphQLRequestError(response.status_code, response.text)
+
+            response_body = response.json()
+            self._update_rate_limit(response_body)
+            if self._is_throttled(response_body) and attempt < self.MAX_THROTTLED_RETRIES:
+                if not inside_test():
+                    time.sleep(cost / self.rate_limiter.leak_rate)
+                continue
+
+            if response_body.get('errors'):
+                raise CouldNotExecuteGraphQLRequestError(response_body['errors'])
+            return response_body['data']
+
+    def _build_customer_input(self, order: 'Order') -> Dict:
+        customer = order.customer
+        shopify_customer_id = customer.external_customer_id or self.customer_ids.get(customer.email)
+        if shopify_customer_id:
+            return {'toAssociate': {'id': self._global_id('Customer', shopify_customer_id)}}
+
+        return {
+            'toUpsert': {
+                'email': customer.email,
+                'firstName': customer.first_name,
+                'lastName': customer.last_name,
+            }
+        }
+
+    def _build_discount_input(self, discount_data: Dict) -> Dict:
+        if discount_data['type'] == 'percentage':
+            return {
+                'itemPercentageDiscountCode': {
+                    'code': discount_data['code'],
+                    'percentage': float(discount_data['amount']),
+                }
+            }
+        return {
+            'itemFixedDiscountCode': {'code': discount_data['code'], 'amountSet': self._money(discount_data['amount'])}
+        }
+
+    def _build_order_input(self, order: 'Order') -> Dict:
+        """
+        Translates the REST payload built by `ShopifyAPIClient._build_order_data` into an `OrderCreateOrderInput`.
+        """
+        order_data = self.rest_client._build_order_data(order)
+        shipping_address = order_data['shipping_address']
+        order_input = {
+            'email': order_data['email'],
+            'financialStatus': order_data['financial_status'].upper(),
+            'tags': order_data['tags'],
+            'customer': self._build_customer_input(order),
+            'lineItems': [
+                {
+                    'variantId': self._global_id('ProductVariant', line_item['variant_id']),
+                    'quantity': line_item['quantity'],
+                    'sku': line_item['sku'],
+                    'priceSet': self._money(line_item['price']),
+                } for line_item in order_data['line_items']
+            ],
+            'shippingAddress': {
+                'firstName': shipping_address['first_name'],
+                'lastName': shipping_address['last_name'],
+                'address1': shipping_address['address1'],
+                'address2': shipping_address['address2'],
+                'city': shipping_address['city'],
+                'provinceCode': shipping_address['province_code'],
+                'zip': shipping_address['zip'],
+                'countryCode': 'US',
+            },
+            'shippingLines': [
+                {
+                    'title': shipping_line['title'],
+                    'priceSet': self._money(shipping_line['price']),
+                } for shipping_line in order_data['shipping_lines']
+            ],
+            'taxLines': [
+                {
+                    'title': tax_line['title'],
+                    'rate': float(tax_line['rate']),
+                    'priceSet': self._money(tax_line['price']),
+                } for tax_line in order_data['tax_lines']
+            ],
+            # replaces the separate `ShopifyAPIClient.create_transaction_for_order` call
+            'transactions': [
+                {
+                    'kind': 'SALE',
+                    'status': 'SUCCESS',
+                    'gateway': 'external',
+                    'amountSet': self._money(f'{order.charged_amount}'),
+                }
+            ],
+        }
+        if order_data['discount_codes']:
+            order_input['discountCode'] = self._build_discount_input(order_data['discount_codes'][0])
+        return order_input
+
+    def _create_orders(self, orders: List['Order']) -> List[ShopifyOrderSyncResultDTO]:
+        results = []
+        variables = {}
+        for order in orders:
+            try:
+                variables[f'order{len(variables)}'] = (order, self._build_order_input(order))
+            except CouldNotSyncOrderError as e:
+                results.append(ShopifyOrderSyncResultDTO(order_id=f'{order.id}', errors=[f'{e}']))
+
+        if not variables:
+            return results
+
+        query = 'mutation CreateOrders({arguments}) {{ {mutations} }}'.format(
+            arguments=', '.join(f'${alias}: OrderCreateOrderInput!' for alias in variables),
+            mutations=' '.join(
+                f'{alias}: orderCreate(order: ${alias}, options: {{sendReceipt: false}}) {{ {ORDER_CREATE_FIELDS} }}'
+                for alias in variables
+            ),
+        )
+        data = self.execute(
+            query,
+            {alias: order_input for alias, (_, order_input) in variables.items()},
+            cost=self.ORDER_CREATE_COST * len(variables),
+        )
+
+        for alias, (order, _) in variables.items():
+            result = data[alias]
+            if result['userErrors'] or not result['order']:
+                results.append(ShopifyOrderSyncResultDTO(order_id=f'{order.id}', errors=result['userErrors']))
+                continue
+
+            shopify_order = result['order']
+            external_customer_id = shopify_order['customer']['legacyResourceId'] if shopify_order['customer'] else None
+            if external_customer_id:
+                self.customer_ids[order.customer.email] = external_customer_id
+            results.append(ShopifyOrderSyncResultDTO(
+                order_id=f'{order.id}',
+                external_order_id=shopify_order['legacyResourceId'],
+                order_number=shopify_order['name'].lstrip('#'),
+                external_customer_id=external_customer_id,
+            ))
+        return results
+
+    def create_orders(self, orders: List['Order']) -> List[ShopifyOrderSyncResultDTO]:
+        results = []
+        for index in range(0, len(orders), self.ORDERS_PER_REQUEST):
+            results.extend(self._create_orders(orders[index:index + self.ORDERS_PER_REQUEST]))
+        return results
@@ -3,8 +3,6 @@ from dataclasses import dataclass
 from typing import Union
 from urllib import parse
 
-import requests
-
 from apps.core.exceptions import APIRateLimitError
 from libs.api_request import make_logged_api_request, APIResponseDTO
 from settings.minimal import env
@@ -24,7 +22,6 @@ class ShopifyRestClient:
         self.SHOPIFY_DOMAIN = env.str('SHOPIFY_DOMAIN', default='FAKE')
         self.SHOPIFY_PASSWORD = env.str('SHOPIFY_PASSWORD', default='FAKE')
         self.BASE_URI = f'https://{self.SHOPIFY_API_KEY}:{self.SHOPIFY_PASSWORD}@{self.SHOPIFY_DOMAIN}'
-        self.session = requests.Session()
 
     def get_customers(self, request_params: CustomerRequestDTO) -> APIResponseDTO:
         url = f'{self.BASE_URI}/admin/api/2022-01/customers.json'
@@ -38,7 +35,13 @@ class ShopifyRestClient:
         if request_params.start_date:
             options['created_at_min'] = request_params.start_date
 
-        logged_request = make_logged_api_request(url=url, headers={}, options=options, object_type='Customer')
+        logged_request = make_logged_api_request(
+            url=url,
+            headers={},
+            options=options,
+            object_type='Customer',
+            provider='shopify',
+        )
         return logged_request.response
 
     def _sanitize_next_link_info(self, next_link_info: str) -> str:
@@ -58,7 +61,13 @@ class ShopifyRestClient:
 
     def get_metafields_for_object(self, obj_name, obj_id):
         url = f'{self.BASE_URI}/admin/{obj_name}/{obj_id}/metafields.json'
-        logged_request = make_logged_api_request(url=url, headers={}, options={}, object_type='Customer')
+        logged_request = make_logged_api_request(
+            url=url,
+            headers={},
+            options={},
+            object_type='Customer',
+            provider='shopify',
+        )
         if logged_request.response.status_code == 429:
             raise APIRateLimitError
         return logged_request.response
@@ -72,6 +81,7 @@ class ShopifyRestClient:
             options={'limit': '250'},
             object_type='Product',
             object_id=f'{uuid.uuid4()}',
+            provider='shopify',
         ).response.parsed_body['products']
 
     def get_customer_with_shopify_customer_id(
@@ -83,6 +93,7 @@ class ShopifyRestClient:
             url=url,
             object_type='ShopifyCustomer',
             object_id=f'{uuid.uuid4()}',
+            provider='shopify',
         )
 
     def get_order_with_shopify_order_id(
@@ -94,4 +105,5 @@ class ShopifyRestClient:
             url=url,
             object_type='ShopifyCustomer',
             object_id=f'{uuid.uuid4()}',
+            provider='shopify',
         )
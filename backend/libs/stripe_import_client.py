@@ -24,5 +24,5 @@ class StripeImportClient:
             metadata={'created_by': 'Import to Re-platform Method.'}
         )
 
-    def create_refund(self, refund_dto: 'RefundDTO'):
-        return self.client.Refund.create(**refund_dto)
+    def create_refund(self, refund_dto: 'RefundDTO', idempotency_key: str = None):
+        return self.client.Refund.create(**refund_dto, idempotency_key=idempotency_key)
@@ -1,12 +1,21 @@
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from decimal import Decimal
-from typing import Union
+from typing import Dict, List, Tuple, Union
 from uuid import uuid4 as uuid
 
+import requests
 from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+from sentry_sdk.utils import logger
 
 from apps.addresses.models import Location
 from apps.orders.libs import PaymentCalculator
+from libs.rate_limiting import ProviderGuard
 from libs.tax_nexus.avalara.avalara_client import AvalaraClient
 from libs.tax_nexus.client import TaxClient
 
@@ -30,6 +39,21 @@ class TaxProcessorClient(TaxClient):
         self.shipping_rate: 'ShippingRate' = None
         self.paymentCalculator: 'PaymentCalculator' = PaymentCalculator()
 
+    def _call(self, method: str, *args):
+        """
+        Calls `method` of the Avalara SDK once the budget shared by every worker allows it, failing fast while Avalara
+        is degraded (see `ProviderGuard`).
+        """
+        guard = ProviderGuard('avalara')
+        guard.acquire()
+        try:
+            response = getattr(self.client, method)(*args)
+        except requests.RequestException:
+            guard.circuit_breaker.record_failure()
+            raise
+        guard.record_response(response.status_code, getattr(response, 'headers', None))
+        return response
+
     def set_customer_discount(self, customer_discount: 'Discount'):
         self.customer_discount = customer_discount
         return self
@@ -79,7 +103,7 @@ class TaxProcessorClient(TaxClient):
         }
 
     def refund(self, order_id):
-        response = self.client.refund_transaction('DEFAULT', str(order_id), {
+        response = self._call('refund_transaction', 'DEFAULT', str(order_id), {
             "refundTransactionCode": str(order_id),
             "refundDate": self._get_current_date(),
             "refundType": "Full",
@@ -95,18 +119,77 @@ class TaxProcessorClient(TaxClient):
         return data
 
     def validate_tax_address(self, address: 'Location'):
-        response = self.client.resolve_address_post(self._parse_address(address))
+        """
+        Validates the address with Avalara, unless the outcome of a previous validation of the same address fields is
+        stored on the location. Outcomes for saved locations are stored for the next time, `valid_address` is `None`
+        when Avalara could not validate the address.
+        """
+        if address.has_current_tax_address_validation:
+            return {
+                'valid_address': address.is_valid_tax_address,
+                'messages': address.tax_address_validation_messages,
+            }
+
+        validation = self._request_tax_address_validation(address)
+        if validation is None:
+            return {
+                'valid_address': None,
+                'messages': [],
+            }
+
+        data, is_valid, messages = validation
+        self._store_tax_address_validation(address, data, is_valid, messages)
+        return {
+            'valid_address': is_valid,
+            'messages': messages
+        }
+
+    def _request_tax_address_validation(self, address: 'Location') -> Union[None, Tuple[Dict, bool, list]]:
+        """
+        Avalara's answer, outcome and messages for the address fields, `None` when Avalara could not validate them.
+        Makes no database queries.
+        """
+        response = self._call('resolve_address_post', self._parse_address(address))
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+
+        # an error answer says nothing about the address: it is reported as unknown and not stored, so the next call
+        # validates again
+        if not 200 <= response.status_code < 300 or not isinstance(data, dict) or data.get('error'):
+            logger.warning(
+                f'Could not validate address #{address.id} with Avalara ({response.status_code}): '
+                f'{data.get("error") if isinstance(data, dict) else data}'
+            )
+            return None
 
-        data = response.json()
         message_list = data.get('messages')
         messages = []
 
         if message_list:
             messages = [message.get('summary') for message in message_list]
-        return {
-            'valid_address': not bool(message_list),
-            'messages': messages
-        }
+
+        return data, not bool(message_list), messages
+
+    def _store_tax_address_validation(self, address: 'Location', data: Dict, is_valid: bool, messages: list):
+        validated_addresses = data.get('validatedAddresses') or [data.get('validatedAddress') or {}]
+        address.is_valid_tax_address = is_valid
+        address.normalized_tax_address = validated_addresses[0]
+        address.tax_address_validation_messages = messages
+        address.tax_address_fingerprint = address.address_fingerprint
+        address.tax_address_validated_at = timezone.now()
+        if address.is_new():
+            return
+
+        # a plain update: the validation outcome is derived data, it must not add history or invalidate tax quotes
+        Location.objects.filter(id=address.id).update(
+            is_valid_tax_address=address.is_valid_tax_address,
+            normalized_tax_address=address.normalized_tax_address,
+            tax_address_validation_messages=address.tax_address_validation_messages,
+            tax_address_fingerprint=address.tax_address_fingerprint,
+            tax_address_validated_at=address.tax_address_validated_at,
+        )
 
     def _is_sales_document(self, transaction_type):
         """
@@ -124,20 +207,240 @@ class TaxProcessorClient(TaxClient):
         else:
             self.paymentCalculator = self.paymentCalculator.from_cart(cart)
 
-    def _get_line_items(self, cart: 'Cart', transaction_type, order_id):
-        if self._is_sales_document(transaction_type):
-            Order = apps.get_model('orders', 'Order')
-            order = Order.objects.get(id=order_id)
-            line_items = order.line_items.filter()
-        else:
-            line_items = cart.line_items.filter()
+    @staticmethod
+    def _get_quote_version_cache_key(address: 'Location') -> str:
+        return f'tax-quote-version-{address.id}'
 
-        return line_items
+    @classmethod
+    def invalidate_cached_quotes(cls, address: 'Location'):
+        """
+        Quotes are cached per address version, moving the address to a new version orphans all of its cached quotes.
+        """
+        cache.set(cls._get_quote_version_cache_key(address), uuid().hex, None)
+
+    def _get_quote_cache_key(self, address: 'Location', transaction_data: Dict) -> str:
+        """
+        Content-addressed key of a quote: a hash of the canonical Avalara request body, minus the throwaway document
+        code, scoped to the current version of the ship-to address.
+        """
+        canonical_body = json.dumps(
+            {key: value for key, value in transaction_data.items() if key != 'code'},
+            sort_keys=True,
+            default=str,
+        )
+        body_hash = hashlib.sha256(canonical_body.encode('utf-8')).hexdigest()
+        address_version = cache.get(self._get_quote_version_cache_key(address), '0')
+        return f'tax-quote-{address.id}-{address_version}-{body_hash}'
+
+    def _build_transaction_data(self, customer: 'Customer', address: 'Location', line_items, transaction_type, code):
+        return {
+            'code': code,
+            'date': self._get_current_date(),
+            'lines': self._parse_line_items(line_items),
+            'addresses': {
+                'shipFrom': self._resolve_ship_from_location(address),
+                'shipTo': self._parse_address(address)
+            },
+            'type': transaction_type,
+            'customerCode': str(customer.id),
+            'commit': True
+        }
+
+    def _create_sales_invoice_for_order(self, order: 'Order', address: 'Location'):
+        """
+        `SalesInvoice` for an order whose line items (with products and variants), shipping rate and applied discount
+        were prefetched, and whose address was already validated: it makes no database queries.
+        """
+        self.paymentCalculator = PaymentCalculator()\
+            .set_line_items(order.line_items.all())\
+            .set_tax(order.tax_total)\
+            .set_shipping_rate(order.shipping_rate)\
+            .set_applied_discount(order.applied_discount)\
+            .calculate()
+
+        transaction_data = self._build_transaction_data(
+            order.customer, address, self.paymentCalculator.get_line_item_snapshots(), 'SalesInvoice', str(order.id),
+        )
+        # calculate taxes on zip + state if address cannot be confirmed
+        if not address.is_valid_tax_address:
+            transaction_data['addresses']['shipTo']['line1'] = 'GENERAL DELIVERY'
+
+        return self._call('create_transaction', transaction_data).json()
+
+    @classmethod
+    def charge_orders(cls, orders: List['Order'], max_workers: int = None) -> Tuple[List['Order'], List]:
+        """
+        Records `SalesInvoice` documents for a batch of orders concurrently, under the Avalara budget shared with
+        every other caller. Orders must be fetched with `customer__addresses` (newest first), `line_items__product`,
+        `line_items__product_variant`, `shipping_rate` and `applied_discount__discount` loaded up front.
+        Returns the recorded orders and the errors of the ones that could not be recorded, whatever the failure.
+        """
+        errors = []
+
+        # addresses are validated up front, on this thread: outcomes are stored on the location so this rarely calls
+        # Avalara, and the worker threads below must not touch the database
+        addresses = {}
+        for order in orders:
+            customer_addresses = list(order.customer.addresses.all())
+            if not customer_addresses:
+                errors.append(CouldNotRecordTaxForPurchaseError(f'Order #{order.id} has no address'))
+                continue
+            try:
+                cls().validate_tax_address(customer_addresses[0])
+            except Exception as e:
+                errors.append(CouldNotRecordTaxForPurchaseError(
+                    f'Could not validate the address of order #{order.id}', e
+                ))
+                continue
+            addresses[order.id] = customer_addresses[0]
+
+        def _charge_order(order: 'Order'):
+            response = cls()\
+                .set_shipping_rate(order.shipping_rate)\
+                .set_customer_discount(order.applied_discount)\
+                ._create_sales_invoice_for_order(order, addresses[order.id])
+            if response.get('error'):
+                raise CouldNotRecordTaxForPurchaseError(
+                    f'Could not record taxable charge to Avalara for order #{order.id}',
+                    response.get('error')
+                )
+            return response
+
+        orders_to_charge = [order for order in orders if order.id in addresses]
+        with ThreadPoolExecutor(max_workers=max_workers or settings.AVALARA_CONCURRENCY) as executor:
+            futures = [(order, executor.submit(_charge_order, order)) for order in orders_to_charge]
+
+        # one failed order, whatever the failure, must not hide the orders that were recorded
+        recorded_orders = []
+        for order, future in futures:
+            try:
+                future.result()
+                recorded_orders.append(order)
+            except CouldNotRecordTaxForPurchaseError as e:
+                errors.append(e)
+            except Exception as e:
+                errors.append(CouldNotRecordTaxForPurchaseError(
+                    f'Could not record taxable charge to Avalara for order #{order.id}', e
+                ))
+
+        return recorded_orders, errors
+
+    @staticmethod
+    def _get_tax_rate_cache_key(address: 'Location') -> str:
+        return f'tax-rate-{address.zipcode}'
+
+    @staticmethod
+    def _get_taxable_amount(transaction_data: Dict) -> Decimal:
+        return sum((Decimal(f'{line["amount"]}') for line in transaction_data['lines']), Decimal('0'))
+
+    def _remember_tax_rate(self, address: 'Location', transaction_data: Dict, response: Dict):
+        taxable_amount = self._get_taxable_amount(transaction_data)
+        if taxable_amount > 0:
+            tax_rate = Decimal(f'{response.get("totalTax")}') / taxable_amount
+            cache.set(self._get_tax_rate_cache_key(address), tax_rate, settings.TAX_RATE_ESTIMATE_CACHE_TIMEOUT)
+
+    def _estimate_tax(self, address: 'Location', transaction_data: Dict) -> Decimal:
+        """
+        Tax of a quote that Avalara did not answer in time, from the last effective rate quoted for the zipcode.
+        """
+        tax_rate = cache.get(self._get_tax_rate_cache_key(address))
+        if tax_rate is None:
+            return Decimal('0')
+        return (tax_rate * self._get_taxable_amount(transaction_data)).quantize(Decimal('0.01'))
+
+    @classmethod
+    def quote_summaries(
+        cls,
+        customer: 'Customer',
+        address: 'Location',
+        summaries: List['OrderSummaryDetailDTO'],
+        deadline: float = None,
+    ) -> List[Decimal]:
+        """
+        Tax amounts of the order summaries of a customer, quoted concurrently. Summaries must carry the line item
+        snapshots of their cart, their discount and shipping rate: payloads are built on this thread and only the
+        Avalara calls run on worker threads.
+
+        Quotes cached for the day are used as is. Quotes that fail or are not answered within `deadline` seconds are
+        estimated from the last rate quoted for the zipcode, late answers are still cached for the next summary. An
+        address without a stored validation is validated within the same deadline, without storing the outcome, and
+        every quote that is not cached is estimated when it cannot be.
+        """
+        deadline_at = time.monotonic() + (deadline if deadline is not None else settings.TAX_QUOTE_DEADLINE)
+
+        def _quote(client: 'TaxProcessorClient', transaction_data: Dict, quote_cache_key: str):
+            response = client._call('create_transaction', transaction_data).json()
+            if response.get('error'):
+                raise CouldNotCalculateTaxForPurchaseError(
+                    f'Could calculate tax for customer #{customer.id}',
+                    response.get('error')
+                )
+            cache.set(quote_cache_key, response, settings.TAX_QUOTE_CACHE_TIMEOUT)
+            client._remember_tax_rate(address, transaction_data, response)
+            return response
+
+        executor = ThreadPoolExecutor(max_workers=settings.AVALARA_CONCURRENCY)
+        quotes = []
+        for summary in summaries:
+            client = cls()\
+                .set_shipping_rate(summary.shipping_rate)\
+                .set_customer_discount(summary.customer_discount)
+            client.paymentCalculator = PaymentCalculator()\
+                .set_line_item_snapshots(summary.line_item_snapshots)\
+                .set_shipping_rate(summary.shipping_rate)\
+                .set_applied_discount(summary.customer_discount)\
+                .calculate()
+            transaction_data = client._build_transaction_data(
+                customer, address, summary.line_item_snapshots, 'SalesOrder', str(uuid()),
+            )
+            quote_cache_key = client._get_quote_cache_key(address, transaction_data)
+            quotes.append([client, transaction_data, quote_cache_key, cache.get(quote_cache_key), None])
+
+        is_valid_address = None
+        if any(not cached_quote for _, _, _, cached_quote, _ in quotes):
+            if address.has_current_tax_address_validation:
+                is_valid_address = address.is_valid_tax_address
+            else:
+                validation_future = executor.submit(cls()._request_tax_address_validation, address)
+                wait([validation_future], timeout=max(deadline_at - time.monotonic(), 0))
+                if validation_future.done() and not validation_future.exception() and validation_future.result():
+                    _, is_valid_address, _ = validation_future.result()
+
+        # quotes are not requested at all when the address could not be validated in time, they are all estimated
+        if is_valid_address is not None:
+            for quote in quotes:
+                client, transaction_data, quote_cache_key, cached_quote, _ = quote
+                if cached_quote:
+                    continue
+                # calculate taxes on zip + state if address cannot be confirmed
+                if not is_valid_address:
+                    transaction_data['addresses']['shipTo']['line1'] = 'GENERAL DELIVERY'
+                quote[4] = executor.submit(_quote, client, transaction_data, quote_cache_key)
+
+            wait(
+                [future for _, _, _, _, future in quotes if future],
+                timeout=max(deadline_at - time.monotonic(), 0),
+            )
+        # late quotes are left to finish in the background
+        executor.shutdown(wait=False)
+
+        tax_amounts = []
+        for client, transaction_data, _, cached_quote, future in quotes:
+            if cached_quote:
+                tax_amounts.append(Decimal(cached_quote.get('totalTax')))
+            elif future and future.done() and not future.exception():
+                tax_amounts.append(Decimal(future.result().get('totalTax')))
+            else:
+                tax_amounts.append(client._estimate_tax(address, transaction_data))
+        return tax_amounts
 
     def _create_sales_document(self, cart: 'Cart', transaction_type, order_id):
         """
          Info on document types here:
          https://developer.avalara.com/ecommerce-integration-guide/sales-tax-badge/transactions/simple-transactions/document-types/
+
+         Quotes (`SalesOrder`) for the same request body are served from the cache for the rest of the day, without
+         calling Avalara.
         """
 
         # initialize payment calculator
@@ -147,29 +450,29 @@ class TaxProcessorClient(TaxClient):
         address = Location.objects \
             .filter(customer=customer.id) \
             .latest('created_at')
-        is_valid_location = self.validate_tax_address(address)
+
+        # line items of the order or cart picked by the payment calculator, read once
+        line_items = self.paymentCalculator.get_line_item_snapshots()
+
+        transaction_data = self._build_transaction_data(customer, address, line_items, transaction_type, order_id)
+        ship_to = transaction_data['addresses']['shipTo']
+
+        quote_cache_key = None
+        if not self._is_sales_document(transaction_type):
+            quote_cache_key = self._get_quote_cache_key(address, transaction_data)
+            cached_quote = cache.get(quote_cache_key)
+            if cached_quote:
+                return cached_quote
 
         # calculate taxes on zip + state if address cannot be confirmed
-        ship_to = self._parse_address(address)
+        is_valid_location = self.validate_tax_address(address)
         if not is_valid_location.get('valid_address'):
             ship_to['line1'] = 'GENERAL DELIVERY'
 
-        # get proper line items based on transaction type
-        line_items = self._get_line_items(cart, transaction_type, order_id)
-
-        response = self.client.create_transaction({
-            'code': order_id,
-            'date': self._get_current_date(),
-            'lines': self._parse_line_items(line_items),
-            'addresses': {
-                'shipFrom': self._resolve_ship_from_location(address),
-                'shipTo': ship_to
-            },
-            'type': transaction_type,
-            'customerCode': str(customer.id),
-            'commit': True
-        })
-        return response.json()
+        response = self._call('create_transaction', transaction_data).json()
+        if quote_cache_key and not response.get('error'):
+            cache.set(quote_cache_key, response, settings.TAX_QUOTE_CACHE_TIMEOUT)
+        return response
 
     def _parse_address(self, address: 'Location'):
         return {
@@ -180,13 +483,13 @@ class TaxProcessorClient(TaxClient):
             'postalCode': str(address.zipcode)
         }
 
-    def _parse_line_items(self, line_items):
+    def _parse_line_items(self, line_items: Tuple['LineItemSnapshotDTO', ...]):
         items = [
             {
-                'description': line_item.product.title,
+                'description': line_item.title,
                 'quantity': line_item.quantity,
-                'amount': float(line_item.product_variant.price * line_item.quantity),
-                'itemCode': line_item.product_variant.sku_id
+                'amount': float(line_item.price * line_item.quantity),
+                'itemCode': line_item.sku_id
             }
             for line_item in line_items
         ]
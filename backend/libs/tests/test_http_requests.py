@@ -1,11 +1,16 @@
-from unittest.mock import patch
+from unittest.mock import ANY, Mock, patch
 
-from django.test import SimpleTestCase
+import requests_mock
+from django.test import SimpleTestCase, override_settings
 from requests import Session
 
 from libs.api_request import (
     APIResponseDTO,
     APIRequestDTO,
+    _build_session,
+    _flush_latency_stats,
+    _record_latency,
+    get_session,
     make_api_request,
 )
 
@@ -45,6 +50,55 @@ class APIRequestTestSuite(SimpleTestCase):
         )
 
 
+class SessionTestSuite(SimpleTestCase):
+    def test_requests_share_the_session_of_the_process(self):
+        self.assertIs(get_session(), get_session())
+
+    def test_session_does_not_keep_cookies(self):
+        session = _build_session()
+        with requests_mock.Mocker(session=session) as adapter:
+            adapter.get('https://tacos.are.awesome', headers={'Set-Cookie': 'session=secret'})
+            session.get('https://tacos.are.awesome')
+
+        self.assertEqual(len(session.cookies), 0)
+
+    @patch.object(Session, 'get', return_value=MockResponse())
+    def test_requests_are_sent_with_headers_and_timeouts(self, mock_get):
+        make_api_request(url='http://tacos.are.awesome', headers={'X-Salsa': 'verde'})
+        self.assertEqual(mock_get.call_args.kwargs['headers'], {'X-Salsa': 'verde'})
+        self.assertIsNotNone(mock_get.call_args.kwargs['timeout'])
+
+
+class LatencyTestSuite(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = Mock()
+        _flush_latency_stats(force=True)
+
+    @override_settings(HTTP_LATENCY_FLUSH_SECONDS=60)
+    def test_latencies_are_aggregated_before_being_flushed(self):
+        with patch('libs.api_request._get_redis_client', return_value=self.redis_client):
+            _record_latency('https://tacos.are.awesome/salsa', 0.5)
+            _record_latency('https://tacos.are.awesome/salsa', 1.5, failed=True)
+            self.redis_client.pipeline.assert_not_called()
+
+            _flush_latency_stats(force=True)
+
+        pipeline = self.redis_client.pipeline.return_value
+        pipeline.hincrbyfloat.assert_called_once_with(ANY, 'total_seconds', 2.0)
+        self.assertIn(((ANY, 'calls', 2), {}), pipeline.hincrby.call_args_list)
+        self.assertIn(((ANY, 'failed_calls', 1), {}), pipeline.hincrby.call_args_list)
+        pipeline.execute.assert_called_once()
+
+    @override_settings(HTTP_LATENCY_FLUSH_SECONDS=0)
+    def test_latencies_that_cannot_be_flushed_do_not_fail_the_request(self):
+        self.redis_client.pipeline.return_value.execute.side_effect = ConnectionError('Redis is down')
+
+        with patch('libs.api_request._get_redis_client', return_value=self.redis_client):
+            _record_latency('https://tacos.are.awesome/salsa', 0.5)
+
+        self.redis_client.pipeline.return_value.execute.assert_called_once()
+
+
 class APIResponseDTOTestSuite(SimpleTestCase):
     def test_api_request_dto_raises_error_when_http_method_invalid(self):
         with self.assertRaises(AssertionError):
@@ -0,0 +1,125 @@
+import time
+import uuid
+
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from libs.rate_limiting import CircuitBreaker, CircuitOpenError, LeakyBucketRateLimiter, ProviderGuard
+
+
+class LeakyBucketRateLimiterTestSuite(SimpleTestCase):
+    def test_will_fill_the_bucket_with_every_call(self):
+        limiter = LeakyBucketRateLimiter(f'{uuid.uuid4()}', capacity=40, leak_rate=2)
+        limiter.acquire()
+        limiter.acquire()
+
+        self.assertAlmostEqual(limiter._get_level(time.time()), 2, delta=0.1)
+
+    def test_will_use_the_level_reported_by_the_api(self):
+        limiter = LeakyBucketRateLimiter(f'{uuid.uuid4()}', capacity=40, leak_rate=2)
+        limiter.update(30, 80)
+
+        self.assertEqual(limiter.capacity, 80)
+        self.assertAlmostEqual(limiter._get_level(time.time()), 30, delta=0.1)
+
+    def test_will_ask_to_wait_once_the_bucket_is_full(self):
+        limiter = LeakyBucketRateLimiter(f'{uuid.uuid4()}', capacity=2, leak_rate=2)
+        now = time.time()
+
+        self.assertEqual(limiter._try_acquire(2, now), 0)
+        self.assertAlmostEqual(limiter._try_acquire(1, now), 0.5, delta=0.01)
+
+    def test_will_pause_every_caller(self):
+        limiter = LeakyBucketRateLimiter(f'{uuid.uuid4()}', capacity=40, leak_rate=2)
+        limiter.pause(3)
+
+        self.assertAlmostEqual(limiter._try_acquire(1, time.time()), 3.5, delta=0.1)
+
+
+@mock.patch('libs.rate_limiting.inside_test', return_value=False)
+class CircuitBreakerTestSuite(SimpleTestCase):
+    def test_will_open_after_the_failure_threshold(self, *args):
+        breaker = CircuitBreaker(f'{uuid.uuid4()}', failure_threshold=2, recovery_timeout=30)
+        breaker.record_failure()
+        breaker.check()
+        breaker.record_failure()
+
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+
+    def test_will_open_for_intermittent_failures_within_the_window(self, *args):
+        breaker = CircuitBreaker(f'{uuid.uuid4()}', failure_threshold=2, recovery_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        self.assertTrue(breaker.is_open())
+
+    def test_will_only_count_failures_of_the_window(self, *args):
+        breaker = CircuitBreaker(f'{uuid.uuid4()}', failure_threshold=2, recovery_timeout=30, failure_window=60)
+        breaker.record_failure()
+        caches[breaker.cache_name].delete(breaker._failures_key)
+        breaker.record_failure()
+
+        self.assertFalse(breaker.is_open())
+
+    def test_will_reopen_on_the_first_failure_after_recovering(self, *args):
+        breaker = CircuitBreaker(f'{uuid.uuid4()}', failure_threshold=2, recovery_timeout=30)
+        breaker.record_failure()
+        breaker.record_failure()
+        caches[breaker.cache_name].delete(breaker._open_key)
+        breaker.record_failure()
+
+        self.assertTrue(breaker.is_open())
+
+    def test_will_close_on_the_first_success_after_recovering(self, *args):
+        breaker = CircuitBreaker(f'{uuid.uuid4()}', failure_threshold=2, recovery_timeout=30)
+        breaker.record_failure()
+        breaker.record_failure()
+        caches[breaker.cache_name].delete(breaker._open_key)
+        breaker.record_success()
+        breaker.record_failure()
+
+        self.assertFalse(breaker.is_open())
+
+    def test_breakers_with_the_same_name_share_their_state(self, *args):
+        name = f'{uuid.uuid4()}'
+        CircuitBreaker(name, failure_threshold=1, recovery_timeout=30).record_failure()
+
+        self.assertTrue(CircuitBreaker(name, failure_threshold=1, recovery_timeout=30).is_open())
+
+
+@override_settings(CIRCUIT_BREAKER_FAILURE_THRESHOLD=1)
+class ProviderGuardTestSuite(SimpleTestCase):
+    def setUp(self):
+        self.provider = f'{uuid.uuid4()}'
+        self.limits = override_settings(OUTBOUND_API_LIMITS={self.provider: {'rate': 2, 'capacity': 40}})
+        self.limits.enable()
+        self.addCleanup(self.limits.disable)
+
+    def test_will_pause_the_bucket_for_the_retry_after_delay(self):
+        guard = ProviderGuard(self.provider)
+        with mock.patch.object(guard.rate_limiter, 'pause') as mocked:
+            guard.record_response(429, {'retry-after': '2.0'})
+
+        mocked.assert_called_with(2.0)
+
+    def test_server_errors_open_the_circuit(self):
+        guard = ProviderGuard(self.provider)
+        guard.record_response(503)
+
+        self.assertTrue(guard.circuit_breaker.is_open())
+
+    def test_only_listed_exceptions_open_the_circuit(self):
+        guard = ProviderGuard(self.provider)
+        with self.assertRaises(ValueError):
+            with guard.call(failures=(ConnectionError, )):
+                raise ValueError()
+        self.assertFalse(guard.circuit_breaker.is_open())
+
+        with self.assertRaises(ConnectionError):
+            with guard.call(failures=(ConnectionError, )):
+                raise ConnectionError()
+        self.assertTrue(guard.circuit_breaker.is_open())
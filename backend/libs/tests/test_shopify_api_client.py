@@ -1,4 +1,7 @@
+from unittest import mock
+
 from django.test import TestCase
+from pyactiveresource.connection import ClientError
 
 from apps.orders.tests.factories import OrderFactory
 from libs.shopify_api_client import ShopifyAPIClient
@@ -26,3 +29,42 @@ class ShopifyAPIClientTestSuite(TestCase):
         built_data = client._build_order_data(self.order)
         self.assertIn('discount_codes', built_data)
         self.assertEqual(type(built_data['discount_codes'][0]), dict)
+
+
+class _MockResponse:
+    def __init__(self, code, headers):
+        self.code = code
+        self.headers = headers
+        self.msg = ''
+        self.body = ''
+
+
+def _mock_throttled_call(*args, **kwargs):
+    raise ClientError(_MockResponse(429, {'Retry-After': '2.0'}))
+
+
+class ShopifyAPIClientRateLimitTestSuite(TestCase):
+    def test_will_sync_the_rate_limiter_with_the_call_limit_header(self):
+        client = ShopifyAPIClient()
+        with mock.patch.object(client.rate_limiter, 'update') as mocked:
+            client._update_rate_limit({'x-shopify-shop-api-call-limit': '32/80'})
+
+        mocked.assert_called_with(32, 80)
+
+    def test_will_retry_throttled_calls_after_pausing_the_rate_limiter(self):
+        client = ShopifyAPIClient()
+        func = mock.Mock(side_effect=[ClientError(_MockResponse(429, {'Retry-After': '2.0'})), 'ok'])
+        with mock.patch.object(client.rate_limiter, 'pause') as mocked:
+            result = client._call(func)
+
+        self.assertEqual(result, 'ok')
+        self.assertEqual(func.call_count, 2)
+        mocked.assert_called_with(2.0)
+
+    def test_will_give_up_after_max_throttled_retries(self):
+        client = ShopifyAPIClient()
+        func = mock.Mock(side_effect=_mock_throttled_call)
+        with self.assertRaises(ClientError):
+            client._call(func)
+
+        self.assertEqual(func.call_count, client.MAX_THROTTLED_RETRIES + 1)
@@ -0,0 +1,118 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+
+from apps.addresses.tests.factories.location import LocationFactory
+from apps.customers.tests.factories import CustomerFactory
+from apps.orders.tests.factories import OrderFactory, OrderLineItemFactory
+from libs.shopify_graphql_client import ShopifyGraphQLClient
+
+
+class _StubShopifyGraphQLHandler(BaseHTTPRequestHandler):
+    """
+    Answers every aliased `orderCreate` mutation with a created order, the way the Shopify GraphQL Admin API does.
+    """
+    requests = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.requests.append(payload)
+        aliases = re.findall(r'(\w+): orderCreate', payload['query'])
+        data = {
+            alias: {
+                'order': {
+                    'legacyResourceId': f'{1000 + index}',
+                    'name': f'#{2000 + index}',
+                    'customer': {'legacyResourceId': f'{3000 + index}'},
+                },
+                'userErrors': [],
+            } for index, alias in enumerate(aliases)
+        }
+        body = json.dumps({
+            'data': data,
+            'extensions': {
+                'cost': {
+                    'throttleStatus': {'maximumAvailable': 1000, 'currentlyAvailable': 990, 'restoreRate': 50},
+                },
+            },
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        ...
+
+
+class ShopifyGraphQLClientTestSuite(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(('127.0.0.1', 0), _StubShopifyGraphQLHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.endpoint = f'http://127.0.0.1:{cls.server.server_port}/graphql.json'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self) -> None:
+        _StubShopifyGraphQLHandler.requests = []
+        self.orders = []
+        for _ in range(3):
+            customer = CustomerFactory()
+            LocationFactory(customer=customer)
+            order = OrderFactory(customer=customer, applied_discount=None)
+            OrderLineItemFactory(order=order)
+            self.orders.append(order)
+
+    def test_will_create_several_orders_per_request(self):
+        client = ShopifyGraphQLClient(endpoint=self.endpoint)
+        client.ORDERS_PER_REQUEST = 2
+        results = client.create_orders(self.orders)
+
+        self.assertEqual(len(_StubShopifyGraphQLHandler.requests), 2)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result.external_order_id for result in results))
+        self.assertEqual(results[0].order_number, '2000')
+
+    def test_will_reuse_cached_customer_ids(self):
+        client = ShopifyGraphQLClient(endpoint=self.endpoint)
+        client.create_orders(self.orders[:1])
+        client.create_orders(self.orders[:1])
+
+        first_request, second_request = _StubShopifyGraphQLHandler.requests
+        self.assertIn('toUpsert', first_request['variables']['order0']['customer'])
+        self.assertEqual(
+            second_request['variables']['order0']['customer'],
+            {'toAssociate': {'id': 'gid://shopify/Customer/3000'}},
+        )
+
+    def test_will_send_the_sale_transaction_with_the_order(self):
+        client = ShopifyGraphQLClient(endpoint=self.endpoint)
+        client.create_orders(self.orders[:1])
+
+        order_input = _StubShopifyGraphQLHandler.requests[0]['variables']['order0']
+        self.assertEqual(order_input['transactions'][0]['kind'], 'SALE')
+
+    def test_will_send_requests_with_timeouts_through_the_shared_session(self):
+        session = mock.Mock()
+        session.post.return_value = mock.Mock(status_code=200, headers={}, json=lambda: {'data': {}})
+
+        with mock.patch('libs.shopify_graphql_client.get_session', return_value=session):
+            ShopifyGraphQLClient(endpoint=self.endpoint).execute('{ shop { name } }')
+
+        self.assertEqual(
+            session.post.call_args.kwargs['timeout'],
+            (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT),
+        )
+        self.assertEqual(session.post.call_args.kwargs['headers']['X-Shopify-Access-Token'], settings.SHOPIFY_PASSWORD)
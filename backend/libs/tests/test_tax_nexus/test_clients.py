@@ -1,10 +1,14 @@
+import threading
+from decimal import Decimal
 from unittest import mock
 
+from django.core.cache import cache
 from rest_framework.test import APITestCase
 
 from apps.addresses.tests.factories.location import LocationFactory
 from apps.carts.tests.factories import CartLineItemFactory
 from apps.customers.tests.factories import CustomerFactory, CustomerChildFactory
+from apps.orders.libs import LineItemSnapshotDTO, OrderSummaryDetailDTO
 from apps.orders.tests.factories import ShippingRateFactory, OrderFactory
 from apps.products.tests.factories import ProductFactory, ProductVariantFactory
 from libs.tax_nexus.avalara import TaxProcessorClient
@@ -25,6 +29,8 @@ def _mock_payment_calculator(*args, **kwargs):
 
 def _mock_valid_tax_address(*args, **kwargs):
     class MockValidTaxAddressResponse:
+        status_code = 200
+
         def json(self):
             return {
                 'validatedAddresses': [{
@@ -49,6 +55,8 @@ def _mock_valid_tax_address(*args, **kwargs):
 
 def _mock_invalid_tax_address(*args, **kwargs):
     class MockInvalidTaxAddress:
+        status_code = 200
+
         def json(self):
             return {
                 "validatedAddress":{
@@ -245,9 +253,231 @@ class TaxProcessorAPIClientTestSuite(APITestCase):
                 self.taxClient.refund('invalid_order_id')
 
 
+def _mock_tax_quote_response(*args, **kwargs):
+    class MockTaxQuoteResponse:
+        status_code = 201
+
+        def json(self):
+            return {
+                'totalTax': 0.78,
+                'summary': [{'rate': 0.07}],
+            }
+
+    return MockTaxQuoteResponse()
+
+
+class TaxQuoteCacheTestSuite(APITestCase):
+    def setUp(self):
+        self.customer = CustomerFactory()
+        self.address = LocationFactory(customer=self.customer, city='Miami', zipcode=33179)
+        self.tax_client = TaxProcessorClient().set_shipping_rate(ShippingRateFactory(is_default=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            customer_child = CustomerChildFactory(parent=self.customer)
+        self.cart = customer_child.cart
+        CartLineItemFactory(cart=self.cart, quantity=12)
+
+    def _calculate_tax(self):
+        with mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.resolve_address_post',
+            side_effect=_mock_valid_tax_address,
+        ):
+            return self.tax_client.calculate_tax(self.cart)
+
+    def test_will_reuse_quote_for_identical_request(self):
+        with mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.create_transaction',
+            side_effect=_mock_tax_quote_response,
+        ) as mocked:
+            first_quote = self._calculate_tax()
+            second_quote = self._calculate_tax()
+
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(first_quote, second_quote)
+
+    def test_will_request_a_new_quote_after_address_changes(self):
+        with mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.create_transaction',
+            side_effect=_mock_tax_quote_response,
+        ) as mocked:
+            self._calculate_tax()
+            self.address.street_address = '1 New Street'
+            with self.captureOnCommitCallbacks(execute=True):
+                self.address.save()
+            self._calculate_tax()
+
+        self.assertEqual(mocked.call_count, 2)
+
+    def test_will_not_cache_invoices(self):
+        order = OrderFactory(customer=self.customer)
+        with mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.create_transaction',
+            side_effect=_mock_tax_quote_response,
+        ) as mocked:
+            with mock.patch(
+                'libs.tax_nexus.avalara.AvalaraClient.resolve_address_post',
+                side_effect=_mock_valid_tax_address,
+            ):
+                self.tax_client.charge(self.cart, order.id)
+                self.tax_client.charge(self.cart, order.id)
+
+        self.assertEqual(mocked.call_count, 2)
+
+
+class TaxAddressValidationStorageTestSuite(APITestCase):
+    def setUp(self):
+        self.address = LocationFactory(city='Miami', zipcode=33179)
+        self.tax_client = TaxProcessorClient()
+
+    def test_will_store_validation_outcome_on_location(self):
+        with mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.resolve_address_post',
+            side_effect=_mock_invalid_tax_address,
+        ):
+            self.tax_client.validate_tax_address(self.address)
+
+        self.address.refresh_from_db()
+        self.assertFalse(self.address.is_valid_tax_address)
+        self.assertEqual(self.address.tax_address_fingerprint, self.address.address_fingerprint)
+        self.assertEqual(self.address.normalized_tax_address['city'], 'MIAMI')
+        self.assertEqual(len(self.address.tax_address_validation_messages), 2)
+
+    def test_will_reuse_stored_outcome_while_address_is_unchanged(self):
+        with mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.resolve_address_post',
+            side_effect=_mock_valid_tax_address,
+        ) as mocked:
+            self.tax_client.validate_tax_address(self.address)
+            self.address.refresh_from_db()
+            response = self.tax_client.validate_tax_address(self.address)
+
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(response, {'valid_address': True, 'messages': []})
+
+    def test_will_not_store_error_answers(self):
+        error_response = mock.Mock(status_code=500, json=lambda: {'error': {'message': 'Internal error'}})
+        with mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.resolve_address_post',
+            return_value=error_response,
+        ):
+            response = self.tax_client.validate_tax_address(self.address)
+
+        self.address.refresh_from_db()
+        self.assertEqual(response, {'valid_address': None, 'messages': []})
+        self.assertIsNone(self.address.is_valid_tax_address)
+        self.assertFalse(self.address.has_current_tax_address_validation)
+
+    def test_will_not_store_answers_without_a_json_body(self):
+        def _json():
+            raise ValueError('Expecting value')
+
+        with mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.resolve_address_post',
+            return_value=mock.Mock(status_code=502, json=_json),
+        ):
+            response = self.tax_client.validate_tax_address(self.address)
+
+        self.address.refresh_from_db()
+        self.assertIsNone(response['valid_address'])
+        self.assertIsNone(self.address.is_valid_tax_address)
+
+    def test_will_validate_again_after_address_changes(self):
+        with mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.resolve_address_post',
+            side_effect=_mock_valid_tax_address,
+        ) as mocked:
+            self.tax_client.validate_tax_address(self.address)
+            self.address.street_address = '1 New Street'
+            self.address.save()
+            self.tax_client.validate_tax_address(self.address)
+
+        self.assertEqual(mocked.call_count, 2)
+
+
+class TaxQuoteSummariesTestSuite(APITestCase):
+    def setUp(self):
+        self.customer = CustomerFactory()
+        self.address = LocationFactory(customer=self.customer, city='Miami', zipcode=33179)
+        TaxProcessorClient.invalidate_cached_quotes(self.address)
+        cache.delete(TaxProcessorClient._get_tax_rate_cache_key(self.address))
+        shipping_rate = ShippingRateFactory(is_default=True)
+        self.summaries = []
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                customer_child = CustomerChildFactory(parent=self.customer)
+            CartLineItemFactory(cart=customer_child.cart, quantity=12)
+            self.summaries.append(OrderSummaryDetailDTO(
+                cart=customer_child.cart,
+                shipping_rate=shipping_rate,
+                line_item_snapshots=LineItemSnapshotDTO.from_line_items(customer_child.cart.line_items.all()),
+            ))
+
+    def _quote_summaries(self, create_transaction, deadline=None, resolve_address=_mock_valid_tax_address):
+        with mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.resolve_address_post',
+            side_effect=resolve_address,
+        ), mock.patch(
+            'libs.tax_nexus.avalara.AvalaraClient.create_transaction',
+            side_effect=create_transaction,
+        ) as mocked:
+            tax_amounts = TaxProcessorClient.quote_summaries(self.customer, self.address, self.summaries, deadline)
+        return tax_amounts, mocked
+
+    def test_will_quote_every_summary(self):
+        tax_amounts, mocked = self._quote_summaries(_mock_tax_quote_response)
+
+        self.assertEqual(mocked.call_count, 2)
+        self.assertEqual(tax_amounts, [Decimal(0.78), Decimal(0.78)])
+
+    def test_will_reuse_cached_quotes(self):
+        self._quote_summaries(_mock_tax_quote_response)
+
+        tax_amounts, mocked = self._quote_summaries(_mock_tax_quote_response)
+
+        self.assertEqual(mocked.call_count, 0)
+        self.assertEqual(tax_amounts, [Decimal(0.78), Decimal(0.78)])
+
+    def test_will_estimate_late_quotes_from_last_rate_of_zipcode(self):
+        self._quote_summaries(_mock_tax_quote_response)
+        TaxProcessorClient.invalidate_cached_quotes(self.address)
+        release = threading.Event()
+
+        def _late_tax_quote_response(*args, **kwargs):
+            release.wait(5)
+            return _mock_tax_quote_response()
+
+        try:
+            tax_amounts, _ = self._quote_summaries(_late_tax_quote_response, deadline=0.01)
+        finally:
+            release.set()
+
+        self.assertEqual(tax_amounts, [Decimal('0.78'), Decimal('0.78')])
+
+    def test_will_estimate_failed_quotes_without_known_rate_as_untaxed(self):
+        tax_amounts, _ = self._quote_summaries(_mock_invalid_address_tax_calculation_response)
+
+        self.assertEqual(tax_amounts, [Decimal('0'), Decimal('0')])
 
+    def test_will_not_store_address_validation(self):
+        self._quote_summaries(_mock_tax_quote_response)
 
+        self.address.refresh_from_db()
+        self.assertIsNone(self.address.is_valid_tax_address)
 
+    def test_will_estimate_quotes_when_address_is_not_validated_in_time(self):
+        self._quote_summaries(_mock_tax_quote_response)
+        TaxProcessorClient.invalidate_cached_quotes(self.address)
+        release = threading.Event()
 
+        def _late_valid_tax_address(*args, **kwargs):
+            release.wait(5)
+            return _mock_valid_tax_address()
 
+        try:
+            tax_amounts, mocked = self._quote_summaries(
+                _mock_tax_quote_response, deadline=0.01, resolve_address=_late_valid_tax_address,
+            )
+        finally:
+            release.set()
 
+        self.assertEqual(mocked.call_count, 0)
+        self.assertEqual(tax_amounts, [Decimal('0.78'), Decimal('0.78')])
@@ -93,6 +93,7 @@ class YotpoClient:
 
         logged_api_request_object = api_request.make_logged_api_request(
             url=url,
+            provider='yotpo',
             method='post',
             headers=self.headers,
             body={
@@ -117,6 +118,7 @@ class YotpoClient:
         url = furl(f'{self.base_url}/customers').url
         logged_api_request_object = api_request.make_logged_api_request(
             url=url,
+            provider='yotpo',
             method='post',
             headers=self.headers,
             body={
@@ -141,6 +143,7 @@ class YotpoClient:
         url = furl(f'{self.base_url}/customers').url
         logged_api_request_object = api_request.make_logged_api_request(
             url=url,
+            provider='yotpo',
             method='get',
             options={
                 'customer_id': customer_id,
@@ -165,6 +168,7 @@ class YotpoClient:
         url = furl(f'{self.base_url}/orders').url
         logged_api_request_object = api_request.make_logged_api_request(
             url=url,
+            provider='yotpo',
             method='post',
             headers=self.headers,
             body={
@@ -194,6 +198,7 @@ class YotpoClient:
         url = furl(f'{self.base_url}/refunds').url
         logged_api_request_object = api_request.make_logged_api_request(
             url=url,
+            provider='yotpo',
             method='post',
             headers=self.headers,
             body={
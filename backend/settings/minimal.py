@@ -17,6 +17,7 @@ from pathlib import Path
 from posixpath import join
 
 import environ
+from django.core.exceptions import ImproperlyConfigured
 #root = environ.Path(__file__)-3
 # print(root)
 env = environ.Env()
@@ -298,9 +299,46 @@ CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
+# outbox events claimed (and fanned out to the workers) per relay transaction
+OUTBOX_RELAY_BATCH_SIZE = env.int('OUTBOX_RELAY_BATCH_SIZE', 500)
+# days dispatched outbox events are kept for replays
+OUTBOX_EVENT_RETENTION_DAYS = env.int('OUTBOX_EVENT_RETENTION_DAYS', 14)
+
+# Shopify webhook events processed per transaction, and seconds deliveries wait to be processed together
+WEBHOOK_EVENT_BATCH_SIZE = env.int('WEBHOOK_EVENT_BATCH_SIZE', 500)
+WEBHOOK_EVENT_PROCESSING_DELAY = env.int('WEBHOOK_EVENT_PROCESSING_DELAY', 5)
+
+# storage uploaded CSV files are kept in until a worker imports them, it has to be shared by the web and worker hosts
+# (they do not share a volume): a private S3 bucket everywhere but local environments
+CSV_IMPORT_STORAGE = env.str(
+    'CSV_IMPORT_STORAGE',
+    'django.core.files.storage.FileSystemStorage'
+    if 'development' in env.str('ENVIRONMENT', 'development') or IS_TESTING
+    else 'storages.backends.s3boto3.S3Boto3Storage',
+)
+CSV_IMPORT_BUCKET_NAME = env.str('CSV_IMPORT_BUCKET_NAME', env.str('AWS_STORAGE_BUCKET_NAME', ''))
+if CSV_IMPORT_STORAGE == 'storages.backends.s3boto3.S3Boto3Storage' and not CSV_IMPORT_BUCKET_NAME:
+    raise ImproperlyConfigured('CSV_IMPORT_BUCKET_NAME (or AWS_STORAGE_BUCKET_NAME) is required to store CSV imports')
+# CSV rows handed to an import handler (and committed) at a time
+CSV_IMPORT_CHUNK_SIZE = env.int('CSV_IMPORT_CHUNK_SIZE', 1000)
+
 # Stripe
 STRIPE_PUBLISHABLE_KEY = env.str('STRIPE_PUBLISHABLE_KEY', 'FAKE_KEY')
 STRIPE_SECRET_KEY = env.str('STRIPE_SECRET_KEY', 'FAKE_KEY')
+STRIPE_CHARGE_CONCURRENCY = env.int('STRIPE_CHARGE_CONCURRENCY', 8)
+# seconds after which an order claimed by a charge engine that never saved its results can be claimed again, well
+# within the 24 hours Stripe replays a charge for the same idempotency key
+ORDER_CHARGE_CLAIM_TIMEOUT = env.int('ORDER_CHARGE_CLAIM_TIMEOUT', 60 * 15)
+
+# Avalara
+# seconds a tax quote (SalesOrder) is cached for, quotes are also keyed on the date so they never outlive the day
+TAX_QUOTE_CACHE_TIMEOUT = env.int('TAX_QUOTE_CACHE_TIMEOUT', 60 * 60 * 24)
+AVALARA_REQUESTS_PER_SECOND = env.int('AVALARA_REQUESTS_PER_SECOND', 20)
+AVALARA_CONCURRENCY = env.int('AVALARA_CONCURRENCY', 8)
+# seconds the order summary waits for its tax quotes before estimating the late ones
+TAX_QUOTE_DEADLINE = env.float('TAX_QUOTE_DEADLINE', 3)
+# seconds the last effective tax rate of a zipcode is kept to estimate late quotes with
+TAX_RATE_ESTIMATE_CACHE_TIMEOUT = env.int('TAX_RATE_ESTIMATE_CACHE_TIMEOUT', 60 * 60 * 24 * 30)
 
 # Shopify
 SHOPIFY_API_KEY = env.str('SHOPIFY_API_KEY', 'FAKE')
@@ -308,6 +346,55 @@ SHOPIFY_API_KEY_SECRET = env.str('SHOPIFY_API_KEY_SECRET', 'FAKE')
 SHOPIFY_DOMAIN = env.str('SHOPIFY_DOMAIN', 'FAKE.com')
 SHOPIFY_PASSWORD = env.str('SHOPIFY_PASSWORD', 'FAKE_PASS')
 SHOPIFY_API_VERSION = env.str('SHOPIFY_API_VERSION', '2021-10')
+# REST Admin API leaky bucket, standard stores get 40 calls that leak at 2/s (Shopify Plus: 80 at 4/s)
+SHOPIFY_API_CALL_LIMIT = env.int('SHOPIFY_API_CALL_LIMIT', 40)
+SHOPIFY_API_CALLS_PER_SECOND = env.float('SHOPIFY_API_CALLS_PER_SECOND', 2)
+# `rest` syncs orders one at a time through ShopifyAPIClient, `graphql` batches them through ShopifyGraphQLClient
+SHOPIFY_ORDER_SYNC_BACKEND = env.str('SHOPIFY_ORDER_SYNC_BACKEND', 'rest')
+# `orderCreate` is only available in the GraphQL Admin API from 2024-07 onwards
+SHOPIFY_GRAPHQL_API_VERSION = env.str('SHOPIFY_GRAPHQL_API_VERSION', '2024-07')
+SHOPIFY_GRAPHQL_COST_LIMIT = env.int('SHOPIFY_GRAPHQL_COST_LIMIT', 1000)
+SHOPIFY_GRAPHQL_COST_RESTORE_RATE = env.float('SHOPIFY_GRAPHQL_COST_RESTORE_RATE', 50)
+
+# Outbound APIs
+# stripe allows 100 requests per second in live mode, for every call the app makes (charges included)
+STRIPE_REQUESTS_PER_SECOND = env.int('STRIPE_REQUESTS_PER_SECOND', 90)
+YOTPO_REQUESTS_PER_SECOND = env.float('YOTPO_REQUESTS_PER_SECOND', 5)
+BRIGHTBACK_REQUESTS_PER_SECOND = env.float('BRIGHTBACK_REQUESTS_PER_SECOND', 5)
+# failures of a provider within CIRCUIT_BREAKER_FAILURE_WINDOW seconds that suspend calls to it for
+# CIRCUIT_BREAKER_RECOVERY_TIMEOUT seconds
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = env.int('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5)
+CIRCUIT_BREAKER_FAILURE_WINDOW = env.int('CIRCUIT_BREAKER_FAILURE_WINDOW', 60)
+CIRCUIT_BREAKER_RECOVERY_TIMEOUT = env.int('CIRCUIT_BREAKER_RECOVERY_TIMEOUT', 30)
+# seconds to wait for outbound connections and responses, a stalled vendor must not pin a worker
+HTTP_CONNECT_TIMEOUT = env.float('HTTP_CONNECT_TIMEOUT', 3.05)
+HTTP_READ_TIMEOUT = env.float('HTTP_READ_TIMEOUT', 30)
+# hosts a keep-alive connection pool is kept for per process, and connections per host (at least as many as threads)
+HTTP_POOL_CONNECTIONS = env.int('HTTP_POOL_CONNECTIONS', 20)
+HTTP_POOL_MAXSIZE = env.int('HTTP_POOL_MAXSIZE', 16)
+# retries of idempotent requests on connection and gateway errors, waiting backoff * 2 ** (retry - 1) seconds
+HTTP_MAX_RETRIES = env.int('HTTP_MAX_RETRIES', 3)
+HTTP_RETRY_BACKOFF_FACTOR = env.float('HTTP_RETRY_BACKOFF_FACTOR', 0.5)
+HTTP_SLOW_REQUEST_SECONDS = env.float('HTTP_SLOW_REQUEST_SECONDS', 5)
+# seconds the latencies of outbound requests are aggregated in each process before being added to the `celery` cache
+HTTP_LATENCY_FLUSH_SECONDS = env.float('HTTP_LATENCY_FLUSH_SECONDS', 10)
+# outbound requests are logged through the `celery` cache and written this many at a time
+API_REQUEST_LOG_BATCH_SIZE = env.int('API_REQUEST_LOG_BATCH_SIZE', 500)
+API_REQUEST_LOG_RETENTION_DAYS = env.int('API_REQUEST_LOG_RETENTION_DAYS', 30)
+# logs waiting to be written, new logs are dropped past it (e.g. while flushes are failing)
+API_REQUEST_LOG_QUEUE_MAX_LENGTH = env.int('API_REQUEST_LOG_QUEUE_MAX_LENGTH', 100000)
+# seconds responses reused by integrations are kept for, see `libs.api_request.cache_api_response`
+API_RESPONSE_CACHE_TIMEOUT = env.int('API_RESPONSE_CACHE_TIMEOUT', 60 * 60 * 24)
+# token buckets shared by every worker (see `libs.rate_limiting.ProviderGuard`): `rate` calls (or cost units) per
+# second, with bursts of up to `capacity`
+OUTBOUND_API_LIMITS = {
+    'stripe': {'rate': STRIPE_REQUESTS_PER_SECOND},
+    'avalara': {'rate': AVALARA_REQUESTS_PER_SECOND},
+    'shopify': {'rate': SHOPIFY_API_CALLS_PER_SECOND, 'capacity': SHOPIFY_API_CALL_LIMIT},
+    'shopify-graphql': {'rate': SHOPIFY_GRAPHQL_COST_RESTORE_RATE, 'capacity': SHOPIFY_GRAPHQL_COST_LIMIT},
+    'yotpo': {'rate': YOTPO_REQUESTS_PER_SECOND},
+    'brightback': {'rate': BRIGHTBACK_REQUESTS_PER_SECOND},
+}
 
 # Whitenoise
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
@@ -406,3 +493,8 @@ SHOW_VARIANTS_ENABLED = env.str('SHOW_VARIANTS_ENABLED', False)
 YOTPO_ORDER_SYNC_ENABLED = env.str('YOTPO_ORDER_SYNC_ENABLED', not IS_PRODUCTION)
 
 FILTER_RECIPES_BY_ZIPCODE = env.str('FILTER_RECIPES_BY_ZIPCODE', not IS_PRODUCTION)
+# seconds a serialized recipe catalog is cached for, it is also invalidated whenever recipes or their fulfillment
+# centers change
+RECIPE_CATALOG_CACHE_TIMEOUT = env.int('RECIPE_CATALOG_CACHE_TIMEOUT', 60 * 60)
+# seconds the serialized payloads of the products API are cached for, invalidated along with the recipe catalog
+PRODUCT_CATALOG_CACHE_TIMEOUT = env.int('PRODUCT_CATALOG_CACHE_TIMEOUT', 60 * 60)